@@ -7,30 +7,119 @@ Ubuntu图片裁剪工具
 import gi
 gi.require_version('Gtk', '3.0')
 gi.require_version('Gdk', '3.0')
-from gi.repository import Gtk, Gdk, GdkPixbuf, GLib
-import cairo
+from gi.repository import Gtk, Gdk, GdkPixbuf, GLib, Pango
 import os
 import sys
-from PIL import Image, ImageDraw, ImageOps
+import time
+from collections import deque
+from functools import partial
+from PIL import ImageDraw, ImageOps
 import numpy as np
-from datetime import datetime
 from math import sqrt, atan2, degrees
 
+from render import (TiledRenderer, TileCache, DEFAULT_TILE_CACHE_BYTES, DAMAGE_MARGIN,
+                    draw_crop_shade, draw_crop_frame, surface_nbytes)
+from loader import open_preview, open_full, BackgroundLoader, PrefetchCache, wait_prefetched
+from transform import rotated_size, rotate_image
+from export import format_from_filename, default_output_name, FORMAT_EXTENSIONS
+from presets import RATIO_PRESETS, SIZE_PRESETS, ratio_from_label
+from image_state import ImageState, transpose_quarter_turns
+from export_queue import ExportQueue, ExportJob
+from regions import CropRegion, new_region_name, region_at, region_filenames
+from responsive import DEFAULT_WIDTHS, parse_widths
+from region_stats import RegionStats, format_stats
+from suggest import suggest_crops
+from trim import TRIM_SIDE, trim_box
+from thumbnails import THUMBNAIL_SIZES, ThumbnailPool, list_images
+from sidecar import make_recipe
+from profiling import Profiler
+from crop_geometry import anchor_for_drag_mode, constrain_aspect, fit_ratio, fit_size
+
+# 缩放范围（屏幕像素 / 图像像素）
+MIN_ZOOM = 0.001
+MAX_ZOOM = 32.0
+
+# 每格滚轮的缩放倍数
+ZOOM_STEP = 1.25
+
+# 保留最近多少次交互延迟采样
+LATENCY_SAMPLES = 240
+
+# 旋转滑块停止多久后才进行高质量旋转（毫秒）
+ROTATE_SETTLE_MS = 250
+
+
 class ImageCropper(Gtk.Window):
     def __init__(self):
         super().__init__(title="ImageCropper v1.0")
         
         # 初始化变量
-        self.original_image = None
-        self.display_image = None
+        # 原图、预览和显示图像共用缓冲区，并统计内存占用（见image_state）
+        self.image_state = ImageState()
+        self.image_size = None  # display_image对应的完整分辨率尺寸，裁剪坐标以此为准
         self.scale_factor = 1.0
-        self.crop_rect = None  # (x1, y1, x2, y2) 相对于显示图像
+        self.view_offset = (0, 0)  # 图像原点在画布中的位置
+        self.fit_to_window = True  # 未手动缩放/平移时，随窗口大小自动适应
+        self.panning = False
+        self.pan_start = None  # (鼠标x, 鼠标y, 原偏移x, 原偏移y)
+        
+        # 鼠标移动合并：每个显示帧最多计算一次裁剪框
+        self.pending_motion = None  # 最近一次未处理的指针位置 (x, y)
+        self.motion_tick_id = None  # 帧时钟回调ID
+        self.motion_event_since = None  # 未处理事件中最早的时间戳（微秒，单调时钟）
+        self.latency_since = None  # 等待绘制完成的最早事件时间戳
+        self.motion_latencies = deque(maxlen=LATENCY_SAMPLES)  # 输入到绘制完成的延迟（毫秒）
+        self.report_latency = bool(os.environ.get("IMAGECROPPER_LATENCY"))
+        
+        # 性能分析：IMAGECROPPER_PROFILE / IMAGECROPPER_TRACE 开启，Ctrl+Shift+P 切换
+        self.profiler = Profiler.from_environment()
+        
+        # 分块渲染器，瓦片缓存上限可通过环境变量 IMAGECROPPER_TILE_CACHE_MB 配置
+        cache_mb = os.environ.get("IMAGECROPPER_TILE_CACHE_MB")
+        cache_bytes = int(cache_mb) * 1024 * 1024 if cache_mb else DEFAULT_TILE_CACHE_BYTES
+        # base_renderer显示未经滑块旋转的底图，rotated_renderer显示旋转后的图像，
+        # 两者共用同一个瓦片缓存和内存上限
+        self.tile_cache = TileCache(cache_bytes, surface_nbytes)
+        self.base_renderer = TiledRenderer(cache=self.tile_cache, profiler=self.profiler)
+        self.rotated_renderer = TiledRenderer(cache=self.tile_cache, profiler=self.profiler)
+        self.renderer = self.base_renderer  # 当前显示display_image的渲染器
+        
+        # 后台解码：打开文件和延迟的完整分辨率解码各用一个加载器
+        self.loader = BackgroundLoader(GLib.idle_add)
+        self.full_loader = BackgroundLoader(GLib.idle_add)
+        
+        # 旋转滑块：拖动时用cairo变换实时预览，停止后在后台做一次双三次旋转
+        self.rotation_preview = False  # display_image尚未与self.rotation一致
+        self.rotate_settle_id = None
+        self.rotate_worker = BackgroundLoader(GLib.idle_add)
+        
+        # 裁剪区域统计：每个显示图像在后台建一次积分图，拖动时只查表
+        self.region_stats = None
+        self.stats_worker = BackgroundLoader(GLib.idle_add)
+        
+        # 内容感知裁剪建议：[(比例下拉框序号, 裁剪框)]，点击其中一个即采用
+        self.suggestions = None
+        self.suggest_worker = BackgroundLoader(GLib.idle_add)
+        
+        # 文件夹浏览：缩略图在线程池中生成（freedesktop缓存），相邻图片预先解码
+        self.folder = None
+        self.folder_images = []
+        self.filmstrip_items = {}  # 路径 -> (按钮, 缩略图控件)
+        self.thumbnail_pool = ThumbnailPool(GLib.idle_add)
+        self.prefetcher = PrefetchCache()
+        
+        # 后台导出：保存对话框关闭后立即返回，裁剪和编码在线程池中进行
+        self.export_queue = ExportQueue(GLib.idle_add, profiler=self.profiler)
+        self.export_rows = {}  # 任务ID -> (列表行, 文字标签, 进度条)
+        
+        # 多个命名裁剪区域，crop_rect和aspect_ratio指向当前区域
+        self.regions = [CropRegion(new_region_name([]))]
+        self.active_region = 0
         self.dragging = False
         self.drag_mode = None  # 'move', 'resize_tl', 'resize_tr', 'resize_bl', 'resize_br'
         self.drag_start = (0, 0)
         self.image_path = None
         self.rotation = 0
-        self.aspect_ratio = None  # (width, height) 比例，None表示自由比例
         
         # 设置窗口
         self.set_default_size(1000, 700)
@@ -47,11 +136,59 @@ class ImageCropper(Gtk.Window):
         self.create_control_panel()
         
         # 连接信号
-        self.connect("destroy", Gtk.main_quit)
+        self.connect("destroy", self.on_destroy)
+        self.connect("key-press-event", self.on_key_press)
         
         # 加载默认主题
         self.apply_theme()
     
+    @property
+    def original_image(self):
+        """完整分辨率图像，只有预览时为None（延迟解码）"""
+        return self.image_state.original
+    
+    @property
+    def preview_image(self):
+        """JPEG缩小解码得到的预览图"""
+        return self.image_state.preview
+    
+    @property
+    def display_image(self):
+        """显示图像，未旋转时就是底图本身"""
+        return self.image_state.display
+    
+    @property
+    def full_size(self):
+        """完整分辨率图像的尺寸（已包含90度旋转）"""
+        return self.image_state.full_size
+    
+    @property
+    def image_format(self):
+        return self.image_state.image_format
+    
+    @property
+    def region(self):
+        """当前编辑的裁剪区域"""
+        return self.regions[self.active_region]
+    
+    @property
+    def crop_rect(self):
+        """当前区域的 [x1, y1, x2, y2]（旋转后的完整分辨率坐标），None表示没有裁剪框"""
+        return self.region.rect
+    
+    @crop_rect.setter
+    def crop_rect(self, rect):
+        self.region.rect = rect
+    
+    @property
+    def aspect_ratio(self):
+        """当前区域的 (width, height) 比例，None表示自由比例"""
+        return self.region.aspect_ratio
+    
+    @aspect_ratio.setter
+    def aspect_ratio(self, ratio):
+        self.region.aspect_ratio = ratio
+    
     def create_image_panel(self):
         """创建图像显示面板"""
         # 滚动窗口，用于大图像
@@ -67,6 +204,9 @@ class ImageCropper(Gtk.Window):
             Gdk.EventMask.BUTTON_PRESS_MASK |
             Gdk.EventMask.BUTTON_RELEASE_MASK |
             Gdk.EventMask.POINTER_MOTION_MASK |
+            Gdk.EventMask.POINTER_MOTION_HINT_MASK |
+            Gdk.EventMask.SCROLL_MASK |
+            Gdk.EventMask.SMOOTH_SCROLL_MASK |
             Gdk.EventMask.KEY_PRESS_MASK
         )
         
@@ -74,15 +214,25 @@ class ImageCropper(Gtk.Window):
         self.drawing_area.connect("button-press-event", self.on_button_press)
         self.drawing_area.connect("button-release-event", self.on_button_release)
         self.drawing_area.connect("motion-notify-event", self.on_motion_notify)
+        self.drawing_area.connect("scroll-event", self.on_scroll)
+        self.drawing_area.connect("size-allocate", self.on_canvas_size_allocate)
         
         # 添加标签提示
         self.info_label = Gtk.Label(label="请打开一张图片（支持 JPG, PNG, BMP, GIF）")
         self.info_label.get_style_context().add_class("info-label")
         
+        # 当前目录的缩略图条，Page Up/Page Down切换上一张/下一张
+        self.filmstrip = Gtk.ScrolledWindow()
+        self.filmstrip.set_policy(Gtk.PolicyType.AUTOMATIC, Gtk.PolicyType.NEVER)
+        self.filmstrip.set_min_content_height(THUMBNAIL_SIZES['normal'] + 40)
+        self.filmstrip_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=4)
+        self.filmstrip.add(self.filmstrip_box)
+        
         # 布局
         image_vbox = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=10)
         image_vbox.pack_start(self.info_label, False, False, 5)
         image_vbox.pack_start(scrolled, True, True, 0)
+        image_vbox.pack_start(self.filmstrip, False, False, 0)
         
         scrolled.add(self.drawing_area)
         
@@ -113,16 +263,37 @@ class ImageCropper(Gtk.Window):
         self.save_btn.connect("clicked", self.on_save_image)
         self.save_btn.set_sensitive(False)
         
+        # 导出全部区域（共用一次解码）
+        self.export_all_btn = Gtk.Button(label="导出全部区域")
+        self.export_all_btn.connect("clicked", self.on_export_regions)
+        
+        # 多尺寸导出（网页srcset）：保存时按宽度列表输出多个文件和清单JSON
+        self.responsive_check = Gtk.CheckButton(label="多尺寸导出")
+        self.responsive_widths_entry = Gtk.Entry()
+        self.responsive_widths_entry.set_text(",".join(map(str, DEFAULT_WIDTHS)))
+        self.responsive_widths_entry.set_tooltip_text("输出宽度（像素），逗号分隔")
+        responsive_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=5)
+        responsive_box.pack_start(self.responsive_check, False, False, 0)
+        responsive_box.pack_start(self.responsive_widths_entry, True, True, 0)
+        
         # 文件信息
         self.file_info_label = Gtk.Label(label="未选择文件")
         self.file_info_label.set_line_wrap(True)
         self.file_info_label.set_max_width_chars(30)
         
+        # 内存占用
+        self.memory_label = Gtk.Label(label="")
+        self.memory_label.set_line_wrap(True)
+        self.memory_label.set_max_width_chars(30)
+        
         file_box.pack_start(open_btn, False, False, 5)
         file_box.pack_start(Gtk.Separator(orientation=Gtk.Orientation.HORIZONTAL), False, False, 5)
         file_box.pack_start(self.save_btn, False, False, 5)
+        file_box.pack_start(self.export_all_btn, False, False, 5)
+        file_box.pack_start(responsive_box, False, False, 5)
         file_box.pack_start(Gtk.Separator(orientation=Gtk.Orientation.HORIZONTAL), False, False, 5)
         file_box.pack_start(self.file_info_label, False, False, 5)
+        file_box.pack_start(self.memory_label, False, False, 5)
         
         # 裁剪控制部分
         crop_frame = Gtk.Frame(label="裁剪控制")
@@ -140,33 +311,62 @@ class ImageCropper(Gtk.Window):
         size_box.pack_start(self.height_label, False, False, 0)
         size_box.pack_start(Gtk.Label(label="px"), False, False, 0)
         
+        # 裁剪区域的亮度、通道平均值、高光溢出和清晰度
+        self.stats_label = Gtk.Label(label=format_stats(None))
+        self.stats_label.set_xalign(0)
+        
+        # 裁剪区域选择
+        region_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=5)
+        region_box.pack_start(Gtk.Label(label="区域:"), False, False, 0)
+        self.region_combo = Gtk.ComboBoxText()
+        self.region_combo.append_text(self.region.name)
+        self.region_combo.set_active(0)
+        self.region_combo.connect("changed", self.on_region_changed)
+        add_region_btn = Gtk.Button(label="+")
+        add_region_btn.connect("clicked", self.on_add_region)
+        remove_region_btn = Gtk.Button(label="−")
+        remove_region_btn.connect("clicked", self.on_remove_region)
+        region_box.pack_start(self.region_combo, True, True, 0)
+        region_box.pack_start(add_region_btn, False, False, 0)
+        region_box.pack_start(remove_region_btn, False, False, 0)
+        
+        # 区域名称（回车确认）
+        self.region_name_entry = Gtk.Entry()
+        self.region_name_entry.set_text(self.region.name)
+        self.region_name_entry.connect("activate", self.on_region_renamed)
+        
         # 比例锁定
         ratio_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=10)
         ratio_label = Gtk.Label(label="固定比例:")
         ratio_box.pack_start(ratio_label, False, False, 0)
         
         self.ratio_combo = Gtk.ComboBoxText()
-        self.ratio_combo.append_text("自由")
-        self.ratio_combo.append_text("1:1 (正方形)")
-        self.ratio_combo.append_text("4:3 (标准)")
-        self.ratio_combo.append_text("16:9 (宽屏)")
-        self.ratio_combo.append_text("3:2 (照片)")
-        self.ratio_combo.append_text("2:3 (人像)")
+        for label, _, _ in RATIO_PRESETS:
+            self.ratio_combo.append_text(label)
         self.ratio_combo.set_active(0)
         self.ratio_combo.connect("changed", self.on_ratio_changed)
         
         ratio_box.pack_start(self.ratio_combo, True, True, 0)
         
+        # 内容感知裁剪建议（每个固定比例一个）和自动去边
+        auto_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=5)
+        suggest_btn = Gtk.Button(label="建议裁剪")
+        suggest_btn.set_tooltip_text("按内容为每个固定比例建议裁剪框，点击建议框采用")
+        suggest_btn.connect("clicked", self.on_suggest_crops)
+        trim_btn = Gtk.Button(label="自动去边")
+        trim_btn.set_tooltip_text("去掉四周的纯色边框")
+        trim_btn.connect("clicked", self.on_auto_trim)
+        auto_box.pack_start(suggest_btn, True, True, 0)
+        auto_box.pack_start(trim_btn, True, True, 0)
+        
         # 预设尺寸
         preset_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=10)
         preset_label = Gtk.Label(label="预设尺寸:")
         preset_box.pack_start(preset_label, False, False, 0)
         
         self.preset_combo = Gtk.ComboBoxText()
-        self.preset_combo.append_text("自定义")
-        self.preset_combo.append_text("1920x1080")
-        self.preset_combo.append_text("1280x720")
-        self.preset_combo.append_text("150x150")
+        for label, _ in SIZE_PRESETS:
+            self.preset_combo.append_text(label)
         self.preset_combo.set_active(0)
         self.preset_combo.connect("changed", self.on_preset_changed)
         
@@ -198,11 +398,26 @@ class ImageCropper(Gtk.Window):
         rotate_btn_box.pack_start(rotate_left_btn, True, True, 0)
         rotate_btn_box.pack_start(rotate_right_btn, True, True, 0)
         
+        # 缩放按钮
+        zoom_btn_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=5)
+        zoom_fit_btn = Gtk.Button(label="适应窗口")
+        zoom_fit_btn.connect("clicked", self.on_zoom_fit)
+        zoom_actual_btn = Gtk.Button(label="1:1 原始大小")
+        zoom_actual_btn.connect("clicked", self.on_zoom_actual)
+        
+        zoom_btn_box.pack_start(zoom_fit_btn, True, True, 0)
+        zoom_btn_box.pack_start(zoom_actual_btn, True, True, 0)
+        
+        crop_box.pack_start(region_box, False, False, 5)
+        crop_box.pack_start(self.region_name_entry, False, False, 5)
         crop_box.pack_start(size_box, False, False, 5)
+        crop_box.pack_start(self.stats_label, False, False, 5)
         crop_box.pack_start(ratio_box, False, False, 5)
+        crop_box.pack_start(auto_box, False, False, 5)
         crop_box.pack_start(preset_box, False, False, 5)
         crop_box.pack_start(rotate_box, False, False, 5)
         crop_box.pack_start(rotate_btn_box, False, False, 5)
+        crop_box.pack_start(zoom_btn_box, False, False, 5)
         
 
         # 输出路径
@@ -220,9 +435,28 @@ class ImageCropper(Gtk.Window):
         
 
         
+        # 导出队列
+        export_frame = Gtk.Frame(label="导出队列")
+        export_box = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=5)
+        export_frame.add(export_box)
+        
+        self.export_list = Gtk.ListBox()
+        self.export_list.set_selection_mode(Gtk.SelectionMode.NONE)
+        export_scroll = Gtk.ScrolledWindow()
+        export_scroll.set_policy(Gtk.PolicyType.NEVER, Gtk.PolicyType.AUTOMATIC)
+        export_scroll.set_min_content_height(100)
+        export_scroll.add(self.export_list)
+        
+        clear_export_btn = Gtk.Button(label="清除已完成")
+        clear_export_btn.connect("clicked", self.on_clear_exports)
+        
+        export_box.pack_start(export_scroll, True, True, 5)
+        export_box.pack_start(clear_export_btn, False, False, 5)
+        
         # 添加到主面板
         control_vbox.pack_start(file_frame, False, False, 0)
         control_vbox.pack_start(crop_frame, False, False, 0)
+        control_vbox.pack_start(export_frame, False, False, 0)
 
         
         # 帮助文本
@@ -230,7 +464,9 @@ class ImageCropper(Gtk.Window):
                                   "1. 拖拽选择裁剪区域\n"
                                   "2. 拖动边角调整大小\n"
                                   "3. 拖动内部移动区域\n"
-                                  "4. 点击保存按钮导出")
+                                  "4. 滚轮缩放，中键或右键拖动平移\n"
+                                  "5. 点击保存按钮导出\n"
+                                  "6. “+”添加更多区域，点击区域切换，可一次导出全部区域")
         help_label.set_line_wrap(True)
         help_label.get_style_context().add_class("help-text")
         
@@ -247,6 +483,10 @@ class ImageCropper(Gtk.Window):
             color: #3465a4;
         }
         
+        .current-image {
+            background-color: #c5d9f1;
+        }
+        
         .suggested-action {
             background-color: #4a90d9;
             color: white;
@@ -282,6 +522,35 @@ class ImageCropper(Gtk.Window):
     
     # ========== 事件处理函数 ==========
     
+    def on_destroy(self, widget):
+        """退出前写入性能分析trace（如果设置了IMAGECROPPER_TRACE）"""
+        self.thumbnail_pool.shutdown()
+        self.prefetcher.shutdown()
+        path = self.profiler.write_trace()
+        if path:
+            print(f"trace已写入 {path}")
+        Gtk.main_quit()
+    
+    def on_key_press(self, widget, event):
+        """Page Up/Page Down切换同一目录中的上一张/下一张
+        
+        隐藏快捷键：Ctrl+Shift+P 开关性能分析叠加层
+        """
+        state = event.state & Gtk.accelerator_get_default_mod_mask()
+        if not state and event.keyval in (Gdk.KEY_Page_Up, Gdk.KEY_Page_Down):
+            self.open_neighbour(1 if event.keyval == Gdk.KEY_Page_Down else -1)
+            return True
+        if (state == Gdk.ModifierType.CONTROL_MASK | Gdk.ModifierType.SHIFT_MASK and
+                Gdk.keyval_to_lower(event.keyval) == Gdk.KEY_p):
+            if not self.profiler.toggle():
+                # 关闭时写出这段时间的trace
+                path = self.profiler.write_trace(self.profiler.trace_path or os.path.join(
+                    GLib.get_tmp_dir(), f"imagecropper-trace-{default_output_name()}.json"))
+                self.info_label.set_text(f"trace已写入 {path}")
+            self.drawing_area.queue_draw()
+            return True
+        return False
+    
     def on_open_image(self, widget):
         """打开图片文件"""
         dialog = Gtk.FileChooserDialog(
@@ -301,6 +570,12 @@ class ImageCropper(Gtk.Window):
         filter_image.add_mime_type("image/png")
         filter_image.add_mime_type("image/bmp")
         filter_image.add_mime_type("image/gif")
+        filter_image.add_mime_type("image/tiff")
+        filter_image.add_pattern("*.tif")
+        filter_image.add_pattern("*.tiff")
+        filter_image.add_mime_type("image/x-portable-pixmap")
+        filter_image.add_mime_type("image/x-portable-graymap")
+        filter_image.add_pattern("*.npy")
         dialog.add_filter(filter_image)
         
         filter_all = Gtk.FileFilter()
@@ -310,60 +585,498 @@ class ImageCropper(Gtk.Window):
         
         response = dialog.run()
         if response == Gtk.ResponseType.OK:
-            self.image_path = dialog.get_filename()
-            self.load_image(self.image_path)
+            self.start_loading(dialog.get_filename())
         
         dialog.destroy()
     
+    def get_preview_target_size(self):
+        """预览解码的目标尺寸：绘图区域大小"""
+        return (self.drawing_area.get_allocated_width(),
+                self.drawing_area.get_allocated_height())
+    
+    def start_loading(self, path):
+        """在后台线程中加载图片，完成后在主线程中更新界面
+        
+        加载期间再次打开其他文件会取消这一次加载
+        """
+        self.full_loader.cancel()
+        name = os.path.basename(path)
+        target_size = self.get_preview_target_size()
+        
+        # 浏览文件夹时相邻图片已经预先解码：完成的直接使用，进行中的等待它完成
+        future = self.prefetcher.take(path, target_size)
+        if future is not None and future.done() and future.exception() is None:
+            self.loader.cancel()
+            self.apply_loaded_image(path, future.result())
+            return
+        
+        self.info_label.set_text(f"正在加载 {name} ...")
+        if future is not None:
+            self.loader.load(
+                wait_prefetched, future,
+                on_done=lambda result: self.apply_loaded_image(path, result),
+                on_error=self.show_load_error
+            )
+            return
+        
+        self.loader.load(
+            self.profiler.wrap("decode.preview", open_preview), path, target_size,
+            on_done=lambda result: self.apply_loaded_image(path, result),
+            on_error=self.show_load_error,
+            on_progress=lambda fraction: self.info_label.set_text(
+                f"正在加载 {name} ... {int(fraction * 100)}%")
+        )
+    
+    def show_load_error(self, error):
+        """显示加载失败的对话框"""
+        self.info_label.set_text("请打开一张图片（支持 JPG, PNG, BMP, GIF）"
+                                 if self.display_image is None else "拖拽选择裁剪区域")
+        dialog = Gtk.MessageDialog(
+            parent=self,
+            flags=0,
+            message_type=Gtk.MessageType.ERROR,
+            buttons=Gtk.ButtonsType.OK,
+            text=f"无法打开图片: {str(error)}"
+        )
+        dialog.run()
+        dialog.destroy()
+    
     def load_image(self, path):
-        """加载图片"""
+        """加载图片（同步）"""
         try:
-            # 使用PIL打开图像
-            self.original_image = Image.open(path)
-            self.display_image = self.original_image.copy()
-            
-            # 重置旋转和裁剪
-            self.rotation = 0
-            self.rotate_scale.set_value(0)
-            self.crop_rect = None
-            self.save_btn.set_sensitive(False)
-            
-            # 计算缩放比例以适应显示区域
-            display_width = self.drawing_area.get_allocated_width()
-            display_height = self.drawing_area.get_allocated_height()
-            
-            img_width, img_height = self.display_image.size
-            
-            # 计算缩放比例，保持纵横比
-            scale_x = display_width / img_width
-            scale_y = display_height / img_height
-            self.scale_factor = min(scale_x, scale_y, 1.0)  # 最大放大到原始尺寸
-            
-            # 更新文件信息
-            file_info = f"文件: {os.path.basename(path)}\n"
-            file_info += f"尺寸: {img_width} × {img_height} px\n"
-            file_info += f"格式: {self.display_image.format}\n"
-            file_info += f"模式: {self.display_image.mode}"
-            self.file_info_label.set_text(file_info)
-            
-            # 更新提示
-            self.info_label.set_text("拖拽选择裁剪区域")
-            
-            # 重绘画布
-            self.drawing_area.queue_draw()
-            
+            # 先按显示区域大小解码预览（JPEG），完整分辨率解码推迟到需要时
+            with self.profiler.span("decode.preview"):
+                result = open_preview(path, self.get_preview_target_size())
         except Exception as e:
-            dialog = Gtk.MessageDialog(
-                parent=self,
-                flags=0,
-                message_type=Gtk.MessageType.ERROR,
-                buttons=Gtk.ButtonsType.OK,
-                text=f"无法打开图片: {str(e)}"
-            )
-            dialog.run()
-            dialog.destroy()
+            self.show_load_error(e)
+            return
+        self.apply_loaded_image(path, result)
+    
+    def apply_loaded_image(self, path, result):
+        """将解码结果应用到界面（只在主线程中调用）"""
+        image, full_size, image_format, is_full = result
+        self.image_path = path
+        self.image_state.load(image, full_size, image_format, is_full)
+        
+        # 重置旋转和裁剪（保留区域的名称和比例，方便对下一张图片做同样的裁剪）
+        self.rotation = 0
+        self.clear_crop_rects()
+        self.save_btn.set_sensitive(False)
+        self.update_base_renderer()
+        self.refresh_display_image()
+        self.rotate_scale.set_value(0)
+        
+        # 计算缩放比例以适应显示区域
+        self.zoom_to_fit()
+        
+        img_width, img_height = self.full_size
+        
+        # 更新文件信息
+        file_info = f"文件: {os.path.basename(path)}\n"
+        file_info += f"尺寸: {img_width} × {img_height} px\n"
+        file_info += f"格式: {image_format}\n"
+        file_info += f"模式: {image.mode}"
+        self.file_info_label.set_text(file_info)
+        
+        # 更新提示
+        self.info_label.set_text("拖拽选择裁剪区域")
+        
+        # 缩略图条和相邻图片的预解码
+        self.update_filmstrip(path)
+        
+        # 重绘画布
+        self.drawing_area.queue_draw()
+    
+    # ========== 文件夹浏览 ==========
+    
+    def update_filmstrip(self, path):
+        """换了目录时重建缩略图条；标出当前图片，并预先解码上一张和下一张"""
+        directory = os.path.dirname(os.path.abspath(path))
+        if directory != self.folder:
+            self.folder = directory
+            self.folder_images = list_images(directory)
+            self.thumbnail_pool.cancel()
+            for child in self.filmstrip_box.get_children():
+                self.filmstrip_box.remove(child)
+            self.filmstrip_items = {}
+            for image_path in self.folder_images:
+                self.add_filmstrip_item(image_path)
+            self.filmstrip_box.show_all()
+        
+        current = os.path.abspath(path)
+        for image_path, (button, _) in self.filmstrip_items.items():
+            style = button.get_style_context()
+            if image_path == current:
+                style.add_class("current-image")
+                GLib.idle_add(self.scroll_filmstrip_to, button)
+            else:
+                style.remove_class("current-image")
+        
+        if current in self.folder_images:
+            index = self.folder_images.index(current)
+            neighbours = [self.folder_images[i] for i in (index + 1, index - 1)
+                          if 0 <= i < len(self.folder_images)]
+            self.prefetcher.prefetch(neighbours, self.get_preview_target_size())
+    
+    def add_filmstrip_item(self, image_path):
+        """缩略图条中的一项：先显示占位图标，缩略图生成后替换"""
+        thumbnail = Gtk.Image.new_from_icon_name("image-x-generic", Gtk.IconSize.DIALOG)
+        thumbnail.set_size_request(THUMBNAIL_SIZES['normal'], THUMBNAIL_SIZES['normal'])
+        label = Gtk.Label(label=os.path.basename(image_path))
+        label.set_ellipsize(Pango.EllipsizeMode.MIDDLE)
+        label.set_max_width_chars(16)
+        item_box = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=2)
+        item_box.pack_start(thumbnail, False, False, 0)
+        item_box.pack_start(label, False, False, 0)
+        
+        button = Gtk.Button()
+        button.set_relief(Gtk.ReliefStyle.NONE)
+        button.set_tooltip_text(image_path)
+        button.add(item_box)
+        button.connect("clicked", lambda widget: self.start_loading(image_path))
+        self.filmstrip_box.pack_start(button, False, False, 0)
+        self.filmstrip_items[image_path] = (button, thumbnail)
+        self.thumbnail_pool.request(image_path, self.on_thumbnail_ready)
+    
+    def on_thumbnail_ready(self, image_path, thumbnail_file):
+        """缩略图已生成（或从缓存读取），无法生成时保留占位图标"""
+        item = self.filmstrip_items.get(image_path)
+        if item is None or thumbnail_file is None:
+            return
+        try:
+            item[1].set_from_pixbuf(GdkPixbuf.Pixbuf.new_from_file(thumbnail_file))
+        except GLib.Error:
+            pass
+    
+    def scroll_filmstrip_to(self, button):
+        """把当前图片滚动到缩略图条的可见范围内"""
+        adjustment = self.filmstrip.get_hadjustment()
+        allocation = button.get_allocation()
+        if allocation.x < adjustment.get_value():
+            adjustment.set_value(allocation.x)
+        elif allocation.x + allocation.width > adjustment.get_value() + adjustment.get_page_size():
+            adjustment.set_value(allocation.x + allocation.width - adjustment.get_page_size())
+        return False
+    
+    def open_neighbour(self, step):
+        """打开同一目录中的下一张（step=1）或上一张（step=-1）"""
+        if self.image_path is None or not self.folder_images:
+            return
+        current = os.path.abspath(self.image_path)
+        if current not in self.folder_images:
+            return
+        index = self.folder_images.index(current) + step
+        if 0 <= index < len(self.folder_images):
+            self.start_loading(self.folder_images[index])
+    
+    def update_memory_label(self):
+        """显示各图像缓冲区、瓦片缓存的内存占用和峰值RSS"""
+        self.memory_label.set_text(self.image_state.memory_summary(
+            {"tiles": self.tile_cache.current_bytes}))
+    
+    def set_display_image(self, image, image_size=None):
+        """设置显示图像，重建预览金字塔并使瓦片缓存失效
+        
+        image可以是缩小解码的预览，image_size是它对应的完整分辨率尺寸
+        """
+        self.image_state.set_display(image, image_size)
+        self.request_region_stats()
+        self.suggestions = None
+        self.suggest_worker.cancel()
+        if image is None:
+            self.rotated_renderer.set_image(None)
+            self.renderer = self.base_renderer
+            return
+        
+        image_size = image_size or image.size
+        if self.image_state.display_shared:
+            # 未旋转时直接复用底图的金字塔
+            self.rotated_renderer.set_image(None)
+            self.renderer = self.base_renderer
+        else:
+            self.rotated_renderer.set_image(image, image.size[0] / image_size[0])
+            self.renderer = self.rotated_renderer
+        self.set_image_size(image_size)
+        self.update_memory_label()
+    
+    def request_region_stats(self):
+        """显示图像变化后在后台重建积分图（区域源用预览建表）"""
+        self.region_stats = None
+        self.stats_worker.cancel()
+        image = (self.image_state.raster if self.image_state.display_shared
+                 else self.image_state.display)
+        if image is None:
+            return
+        self.stats_worker.load(
+            self.profiler.wrap("stats.build", lambda image, size, **_: RegionStats(image, size)),
+            image, self.image_state.display_size,
+            on_done=lambda stats: self.apply_region_stats(image, stats)
+        )
+    
+    def apply_region_stats(self, image, stats):
+        """应用后台建好的积分图（显示图像已变化时丢弃）"""
+        current = (self.image_state.raster if self.image_state.display_shared
+                   else self.image_state.display)
+        if image is not current:
+            return
+        self.region_stats = stats
+        self.update_stats_label()
+    
+    def update_stats_label(self):
+        """按当前裁剪框查表更新统计面板，每次只需常数次查表"""
+        stats = None
+        if self.region_stats is not None and self.crop_rect is not None:
+            with self.profiler.span("stats.lookup"):
+                stats = self.region_stats.stats(self.crop_rect)
+        self.stats_label.set_text(format_stats(stats))
+    
+    def set_image_size(self, image_size):
+        """更新完整分辨率坐标下的图像尺寸"""
+        old_size = self.image_size
+        self.image_size = image_size
+        
+        # 旋转会改变图像尺寸，保持图像中心在画布上的位置不变
+        if old_size is not None and image_size != old_size:
+            dx = (image_size[0] - old_size[0]) * self.scale_factor / 2
+            dy = (image_size[1] - old_size[1]) * self.scale_factor / 2
+            self.view_offset = (self.view_offset[0] - dx, self.view_offset[1] - dy)
+    
+    def get_base_image(self):
+        """当前可用的最高分辨率图像（完整分辨率或预览）"""
+        return self.image_state.base
+    
+    def update_base_renderer(self):
+        """底图（原图或预览，含90度旋转）变化后重建它的金字塔"""
+        base = self.get_base_image()
+        region_source = self.image_state.region_source
+        if base is None:
+            self.base_renderer.set_image(None)
+        elif region_source is not None:
+            # 区域源：预览金字塔之上再加一层，放大时瓦片直接从文件读取（映射的行或TIFF的块）
+            preview = self.image_state.preview
+            self.base_renderer.set_image(preview, preview.size[0] / self.full_size[0],
+                                         source=region_source)
+        else:
+            self.base_renderer.set_image(base, base.size[0] / self.full_size[0])
+    
+    def refresh_display_image(self):
+        """根据当前旋转角度更新显示图像
+        
+        有旋转角度时先用cairo变换旋转底图进行预览，高质量旋转推迟到后台执行
+        """
+        base = self.get_base_image()
+        if base is None:
+            return
+        
+        self.cancel_rotation_settle()
+        if self.rotation:
+            self.rotation_preview = True
+            self.set_image_size(rotated_size(self.full_size, self.rotation))
+            self.schedule_rotation_settle()
+        else:
+            self.rotation_preview = False
+            self.set_display_image(base, self.full_size)
+    
+    def schedule_rotation_settle(self):
+        """滑块停止ROTATE_SETTLE_MS毫秒后再进行双三次旋转"""
+        if self.rotate_settle_id is not None:
+            GLib.source_remove(self.rotate_settle_id)
+        self.rotate_settle_id = GLib.timeout_add(ROTATE_SETTLE_MS, self.on_rotate_settled)
+    
+    def cancel_rotation_settle(self):
+        """取消尚未开始或正在进行的高质量旋转"""
+        if self.rotate_settle_id is not None:
+            GLib.source_remove(self.rotate_settle_id)
+            self.rotate_settle_id = None
+        self.rotate_worker.cancel()
+    
+    def on_rotate_settled(self):
+        """滑块已停止：在后台线程中做一次双三次旋转"""
+        self.rotate_settle_id = None
+        base = self.image_state.raster
+        angle = self.rotation
+        self.rotate_worker.load(
+            self.profiler.wrap("rotate", lambda base, angle, **_: rotate_image(base, angle)),
+            base, angle,
+            on_done=lambda image: self.apply_rotated_image(base, angle, image),
+            on_error=self.show_load_error
+        )
+        return GLib.SOURCE_REMOVE
+    
+    def apply_rotated_image(self, base, angle, image):
+        """应用后台旋转的结果（底图或角度已变化时丢弃）"""
+        if base is not self.image_state.raster or angle != self.rotation:
+            return
+        self.rotation_preview = False
+        self.set_display_image(image, rotated_size(self.full_size, angle))
+        self.drawing_area.queue_draw()
+    
+    def ensure_full_resolution(self):
+        """确保已完成完整分辨率解码（导出时调用，同步执行）"""
+        if self.original_image is not None or self.image_path is None:
+            return self.original_image
+        
+        # 同步解码优先，取消可能正在进行的后台解码
+        self.full_loader.cancel()
+        with self.profiler.span("decode.full"):
+            image = open_full(self.image_path, lazy=True)
+        self.apply_full_resolution(image)
+        return self.original_image
+    
+    def request_full_resolution(self):
+        """在后台解码完整分辨率图像（放大超过预览精度时调用）"""
+        if (self.original_image is not None or self.image_path is None or
+                self.full_loader.is_busy()):
+            return
+        
+        self.info_label.set_text("正在加载完整分辨率 ...")
+        self.full_loader.load(
+            self.profiler.wrap("decode.full", partial(open_full, lazy=True)), self.image_path,
+            on_done=self.apply_full_resolution,
+            on_error=self.show_load_error,
+            on_progress=lambda fraction: self.info_label.set_text(
+                f"正在加载完整分辨率 ... {int(fraction * 100)}%")
+        )
+    
+    def apply_full_resolution(self, image):
+        """用完整分辨率图像替换预览（只在主线程中调用）"""
+        # 重放预览期间执行的90度旋转，并释放预览
+        self.image_state.set_full(image)
+        self.update_base_renderer()
+        self.refresh_display_image()
+        self.info_label.set_text("拖拽选择裁剪区域")
+        self.drawing_area.queue_draw()
+    
+    def needs_full_resolution(self, scale):
+        """当前显示的预览在该缩放比例下是否已经不够清晰"""
+        return (self.preview_image is not None and
+                scale > self.base_renderer.base_factor)
+    
+    def invalidate_display_surface(self):
+        """丢弃缓存的瓦片，下次绘制时重新生成"""
+        self.base_renderer.invalidate()
+        self.rotated_renderer.invalidate()
+    
+    # ========== 视图变换（缩放与平移） ==========
+    
+    def zoom_to_fit(self):
+        """缩放并居中，使整张图像适应显示区域"""
+        self.fit_to_window = True
+        if self.display_image is None:
+            return
+        
+        display_width = self.drawing_area.get_allocated_width()
+        display_height = self.drawing_area.get_allocated_height()
+        img_width, img_height = self.image_size
+        
+        # 计算缩放比例，保持纵横比
+        scale_x = display_width / img_width
+        scale_y = display_height / img_height
+        self.scale_factor = min(scale_x, scale_y, 1.0)  # 适应窗口时最大放大到原始尺寸
+        
+        # 居中
+        self.view_offset = (
+            (display_width - img_width * self.scale_factor) / 2,
+            (display_height - img_height * self.scale_factor) / 2
+        )
+    
+    def zoom_at(self, scale, widget_x, widget_y):
+        """以画布上的(widget_x, widget_y)为中心缩放，该点下的图像内容保持不动"""
+        scale = max(MIN_ZOOM, min(scale, MAX_ZOOM))
+        img_x, img_y = self.widget_to_image(widget_x, widget_y)
+        self.scale_factor = scale
+        self.view_offset = (widget_x - img_x * scale, widget_y - img_y * scale)
+        self.fit_to_window = False
+        
+        # 放大超过预览的分辨率时，才在后台进行完整分辨率解码
+        if self.needs_full_resolution(scale):
+            self.request_full_resolution()
+    
+    def widget_to_image(self, x, y):
+        """画布坐标转换为图像坐标"""
+        return ((x - self.view_offset[0]) / self.scale_factor,
+                (y - self.view_offset[1]) / self.scale_factor)
+    
+    def image_to_widget(self, x, y):
+        """图像坐标转换为画布坐标"""
+        return (x * self.scale_factor + self.view_offset[0],
+                y * self.scale_factor + self.view_offset[1])
+    
+    def on_canvas_size_allocate(self, widget, allocation):
+        """画布大小改变时，若处于适应窗口模式则重新计算缩放"""
+        if self.fit_to_window:
+            self.zoom_to_fit()
+    
+    def on_zoom_fit(self, widget):
+        """适应窗口"""
+        self.zoom_to_fit()
+        self.drawing_area.queue_draw()
+    
+    def on_zoom_actual(self, widget):
+        """以画布中心为基准缩放到原始大小"""
+        if self.display_image is None:
+            return
+        alloc = self.drawing_area.get_allocation()
+        self.zoom_at(1.0, alloc.width / 2, alloc.height / 2)
+        self.drawing_area.queue_draw()
+    
+    def on_scroll(self, widget, event):
+        """滚轮缩放（以鼠标位置为中心）"""
+        if self.display_image is None:
+            return False
+        
+        if event.direction == Gdk.ScrollDirection.UP:
+            factor = ZOOM_STEP
+        elif event.direction == Gdk.ScrollDirection.DOWN:
+            factor = 1 / ZOOM_STEP
+        elif event.direction == Gdk.ScrollDirection.SMOOTH:
+            # 触控板平滑滚动：按delta_y连续缩放
+            factor = ZOOM_STEP ** -event.delta_y
+        else:
+            return False
+        
+        self.zoom_at(self.scale_factor * factor, event.x, event.y)
+        widget.queue_draw()
+        return True
+    
+    def get_crop_widget_bounds(self):
+        """裁剪框在画布中的包围盒（含控制点和线宽边距），没有裁剪框时返回None"""
+        if not self.crop_rect:
+            return None
+        x1, y1, x2, y2 = self.crop_rect
+        wx1, wy1 = self.image_to_widget(min(x1, x2), min(y1, y2))
+        wx2, wy2 = self.image_to_widget(max(x1, x2), max(y1, y2))
+        return (wx1 - DAMAGE_MARGIN, wy1 - DAMAGE_MARGIN,
+                wx2 + DAMAGE_MARGIN, wy2 + DAMAGE_MARGIN)
+    
+    def queue_crop_redraw(self, old_bounds):
+        """只重绘裁剪框变化前后包围盒的并集
+        
+        old_bounds是变化前get_crop_widget_bounds()的结果
+        """
+        new_bounds = self.get_crop_widget_bounds()
+        boxes = [b for b in (old_bounds, new_bounds) if b is not None]
+        if not boxes:
+            return
+        
+        x1 = int(min(b[0] for b in boxes))
+        y1 = int(min(b[1] for b in boxes))
+        x2 = int(max(b[2] for b in boxes)) + 1
+        y2 = int(max(b[3] for b in boxes)) + 1
+        self.drawing_area.queue_draw_area(x1, y1, x2 - x1, y2 - y1)
+        
+        # 局部重绘时叠加层也需要刷新
+        if self.profiler.hud_visible:
+            self.drawing_area.queue_draw_area(*self.profiler.hud_rect())
     
     def on_draw(self, widget, cr):
+        """绘制一帧，开启性能分析时记录各阶段耗时并绘制叠加层"""
+        start = time.perf_counter()
+        self.draw_canvas(cr)
+        self.profiler.end_frame(start, time.perf_counter())
+        self.profiler.draw_hud(cr)
+    
+    def draw_canvas(self, cr):
         """绘制图像和裁剪框"""
         # 清除背景
         cr.set_source_rgb(0.9, 0.9, 0.9)
@@ -372,138 +1085,126 @@ class ImageCropper(Gtk.Window):
         if self.display_image is None:
             return
         
-        # 计算图像在画布中的位置（居中）
-        img_width, img_height = self.display_image.size
-        display_width = img_width * self.scale_factor
-        display_height = img_height * self.scale_factor
+        x_offset, y_offset = self.view_offset
         
-        alloc = widget.get_allocation()
-        x_offset = (alloc.width - display_width) / 2
-        y_offset = (alloc.height - display_height) / 2
+        # 只处理需要重绘的区域（局部重绘时远小于整个画布）
+        clip_x1, clip_y1, clip_x2, clip_y2 = cr.clip_extents()
         
-        # 将图像转换为RGBA格式（cairo需要）
-        if self.display_image.mode != 'RGBA':
-            # JPG通常是RGB格式，需要转换为RGBA
-            rgba_image = self.display_image.convert('RGBA')
-        else:
-            rgba_image = self.display_image
-        
-        # 获取RGBA格式的图像数据
-        img_data = rgba_image.tobytes()
-        
-        # 创建cairo图像表面
-        # cairo.FORMAT_ARGB32期望每像素4字节（BGRA或ARGB，取决于平台）
-        # 但PIL的RGBA是每像素4字节，顺序是R,G,B,A
-        # 我们需要进行字节顺序转换
-        import struct
-        import numpy as np
-        
-        # 方法1：使用numpy转换（如果可用，推荐）
-        # 将字节数据转换为numpy数组
-        np_data = np.frombuffer(img_data, dtype=np.uint8)
-        np_data = np_data.reshape((img_height, img_width, 4))
-        
-        # 重新排列通道：从RGBA转换为BGRA（cairo期望的格式）
-        # 注意：在little-endian系统上，cairo的ARGB32实际上是BGRA顺序
-        bgra_data = np.zeros((img_height, img_width, 4), dtype=np.uint8)
-        bgra_data[:, :, 0] = np_data[:, :, 2]  # B
-        bgra_data[:, :, 1] = np_data[:, :, 1]  # G
-        bgra_data[:, :, 2] = np_data[:, :, 0]  # R
-        bgra_data[:, :, 3] = np_data[:, :, 3]  # A
-        
-        # 将numpy数组转换回字节
-        img_data = bgra_data.tobytes()
-        
-        # 创建cairo图像表面
-        stride = cairo.ImageSurface.format_stride_for_width(
-            cairo.FORMAT_ARGB32, img_width)
-        
-        surface = cairo.ImageSurface.create_for_data(
-            bytearray(img_data),
-            cairo.FORMAT_ARGB32,
-            img_width,
-            img_height,
-            stride
-        )
+        # 分块绘制：只转换和绘制与可见区域相交的瓦片
+        # 渲染器从金字塔中选择刚好覆盖显示尺寸的层级，瓦片转换结果有LRU缓存
+        with self.profiler.span("draw.tiles"):
+            if self.rotation_preview:
+                # 旋转滑块预览：用cairo矩阵旋转底图，不做任何像素重采样
+                self.base_renderer.draw(cr, self.scale_factor, x_offset, y_offset,
+                                        angle=self.rotation, image_size=self.full_size)
+            else:
+                self.renderer.draw(cr, self.scale_factor, x_offset, y_offset)
+
+        # 其他区域只绘制虚线边框和名称
+        with self.profiler.span("draw.overlay"):
+            self.draw_other_regions(cr)
+            self.draw_suggestions(cr)
+        
+        # 绘制裁剪框（如果存在）
+        if self.crop_rect:
+            with self.profiler.span("draw.overlay"):
+                self.draw_crop_overlay(cr, (clip_x1, clip_y1, clip_x2, clip_y2))
         
-        # 缩放并绘制图像
+        self.record_motion_latency()
+    
+    def draw_other_regions(self, cr):
+        """绘制非当前区域的虚线边框和名称"""
         cr.save()
-        cr.translate(x_offset, y_offset)
-        cr.scale(self.scale_factor, self.scale_factor)
-        cr.set_source_surface(surface, 0, 0)
-        cr.paint()
+        cr.set_line_width(1)
+        cr.set_dash([4, 4])
+        cr.set_font_size(12)
+        for index, region in enumerate(self.regions):
+            if index == self.active_region or not region.rect:
+                continue
+            x1, y1, x2, y2 = region.rect
+            wx1, wy1 = self.image_to_widget(min(x1, x2), min(y1, y2))
+            wx2, wy2 = self.image_to_widget(max(x1, x2), max(y1, y2))
+            cr.set_source_rgb(1, 0.8, 0)
+            cr.rectangle(wx1, wy1, wx2 - wx1, wy2 - wy1)
+            cr.stroke()
+            cr.move_to(wx1 + 4, wy1 + 14)
+            cr.show_text(region.name)
         cr.restore()
-
- # 绘制裁剪框（如果存在）
-        if self.crop_rect:
-            x1, y1, x2, y2 = self.crop_rect
-            
-            # 转换为显示坐标
-            display_x1 = x1 * self.scale_factor + x_offset
-            display_y1 = y1 * self.scale_factor + y_offset
-            display_x2 = x2 * self.scale_factor + x_offset
-            display_y2 = y2 * self.scale_factor + y_offset
-            
-            width = display_x2 - display_x1
-            height = display_y2 - display_y1
-            
-            # 绘制半透明覆盖层
-            cr.set_source_rgba(0, 0, 0, 0.4)
-            cr.rectangle(0, 0, alloc.width, alloc.height)
-            cr.rectangle(display_x1, display_y1, width, height)
-            cr.set_fill_rule(cairo.FILL_RULE_EVEN_ODD)
-            cr.fill()
-            
-            # 绘制裁剪框边界
-            cr.set_line_width(2)
-            cr.set_source_rgb(1, 1, 1)
-            cr.rectangle(display_x1, display_y1, width, height)
+    
+    def draw_suggestions(self, cr):
+        """绘制内容感知裁剪建议的边框和比例"""
+        if not self.suggestions:
+            return
+        cr.save()
+        cr.set_line_width(2)
+        cr.set_dash([6, 3])
+        cr.set_font_size(12)
+        for ratio_index, (x1, y1, x2, y2) in self.suggestions:
+            wx1, wy1 = self.image_to_widget(x1, y1)
+            wx2, wy2 = self.image_to_widget(x2, y2)
+            cr.set_source_rgb(0.2, 0.8, 1)
+            cr.rectangle(wx1, wy1, wx2 - wx1, wy2 - wy1)
             cr.stroke()
-            
-            # 绘制控制点
-            point_size = 8
-            points = [
-                (display_x1, display_y1),  # 左上
-                (display_x2, display_y1),  # 右上
-                (display_x1, display_y2),  # 左下
-                (display_x2, display_y2)   # 右下
-            ]
-            
-            cr.set_source_rgb(0, 0.5, 1)
-            for px, py in points:
-                cr.rectangle(px - point_size/2, py - point_size/2, 
-                           point_size, point_size)
-                cr.fill()
-            
-            # 更新尺寸显示
-            actual_width =round(abs(x2 - x1),2)
-            actual_height = round(abs(y2 - y1),2)
-            self.width_label.set_text(str(actual_width))
-            self.height_label.set_text(str(actual_height))
+            cr.move_to(wx1 + 4, wy2 - 6)
+            cr.show_text(RATIO_PRESETS[ratio_index][1])
+        cr.restore()
+    
+    def draw_crop_overlay(self, cr, clip):
+        """绘制裁剪框之外的覆盖层、边框和控制点，clip是重绘区域"""
+        x1, y1, x2, y2 = self.crop_rect
+        
+        # 转换为显示坐标
+        display_x1, display_y1 = self.image_to_widget(x1, y1)
+        display_x2, display_y2 = self.image_to_widget(x2, y2)
+        
+        # 绘制半透明覆盖层（只覆盖重绘区域）
+        draw_crop_shade(cr, clip, display_x1, display_y1, display_x2, display_y2)
+        
+        # 更新尺寸显示
+        actual_width =round(abs(x2 - x1),2)
+        actual_height = round(abs(y2 - y1),2)
+        self.width_label.set_text(str(actual_width))
+        self.height_label.set_text(str(actual_height))
+        self.update_stats_label()
+        
+        # 裁剪框与重绘区域不相交时，边框和控制点不需要绘制
+        clip_x1, clip_y1, clip_x2, clip_y2 = clip
+        bx1, by1, bx2, by2 = self.get_crop_widget_bounds()
+        if bx2 < clip_x1 or bx1 > clip_x2 or by2 < clip_y1 or by1 > clip_y2:
+            return
+        
+        # 绘制裁剪框边界和控制点
+        draw_crop_frame(cr, display_x1, display_y1, display_x2, display_y2)
     
     def on_button_press(self, widget, event):
         """鼠标按下事件"""
         if self.display_image is None:
             return False
         
-        # 计算图像在画布中的位置
-        img_width, img_height = self.display_image.size
-        display_width = img_width * self.scale_factor
-        display_height = img_height * self.scale_factor
+        # 中键或右键拖动平移
+        if event.button in (2, 3):
+            self.panning = True
+            self.pan_start = (event.x, event.y) + tuple(self.view_offset)
+            return True
         
-        alloc = widget.get_allocation()
-        x_offset = (alloc.width - display_width) / 2
-        y_offset = (alloc.height - display_height) / 2
+        img_width, img_height = self.image_size
         
         # 转换为图像坐标
-        img_x = (event.x - x_offset) / self.scale_factor
-        img_y = (event.y - y_offset) / self.scale_factor
+        img_x, img_y = self.widget_to_image(event.x, event.y)
         
         # 检查是否在图像范围内
         if not (0 <= img_x < img_width and 0 <= img_y < img_height):
             return False
         
+        if event.button == 1 and self.suggestions:
+            # 有建议框时，点击建议框采用它，点击其他位置关闭建议
+            if self.apply_suggestion_at(img_x, img_y):
+                return True
+            self.suggestions = None
+            self.drawing_area.queue_draw()
+        
         if event.button == 1:  # 左键
+            old_bounds = self.get_crop_widget_bounds()
             if self.crop_rect:
                 x1, y1, x2, y2 = self.crop_rect
                 
@@ -522,10 +1223,18 @@ class ImageCropper(Gtk.Window):
                 # 检查是否在裁剪框内部
                 elif (x1 < img_x < x2 and y1 < img_y < y2):
                     self.drag_mode = 'move'
+                elif region_at(self.regions, img_x, img_y, self.active_region) is not None:
+                    # 点击其他区域：切换到该区域并开始移动
+                    self.select_region(region_at(self.regions, img_x, img_y, self.active_region))
+                    self.drag_mode = 'move'
                 else:
                     # 开始新的裁剪框
                     self.crop_rect = [img_x, img_y, img_x, img_y]
                     self.drag_mode = 'create'
+            elif region_at(self.regions, img_x, img_y) is not None:
+                # 当前区域还没有裁剪框时，点击其他区域切换过去
+                self.select_region(region_at(self.regions, img_x, img_y))
+                self.drag_mode = 'move'
             else:
                 # 开始新的裁剪框
                 self.crop_rect = [img_x, img_y, img_x, img_y]
@@ -534,13 +1243,24 @@ class ImageCropper(Gtk.Window):
             self.dragging = True
             self.drag_start = (img_x, img_y)
             self.save_btn.set_sensitive(False)
+            
+            # 开始新裁剪框时旧的裁剪框需要擦除
+            self.queue_crop_redraw(old_bounds)
             return True
         
         return False
     
     def on_button_release(self, widget, event):
         """鼠标释放事件"""
+        if event.button in (2, 3) and self.panning:
+            self.panning = False
+            self.pan_start = None
+            return True
+        
         if event.button == 1 and self.dragging:
+            # 先处理尚未合并的移动事件，保证松开时的位置不丢失
+            self.flush_pending_motion()
+            
             self.dragging = False
             self.drag_mode = None
             
@@ -558,26 +1278,110 @@ class ImageCropper(Gtk.Window):
                 if width > 10 and height > 10:  # 最小尺寸
                     self.save_btn.set_sensitive(True)
             
+            if self.report_latency:
+                self.print_latency_stats()
+            
             return True
         return False
     
     def on_motion_notify(self, widget, event):
         """鼠标移动事件"""
+        if self.panning:
+            # 平移视图
+            start_x, start_y, offset_x, offset_y = self.pan_start
+            self.view_offset = (offset_x + event.x - start_x,
+                                offset_y + event.y - start_y)
+            self.fit_to_window = False
+            widget.queue_draw()
+            if event.is_hint:
+                event.request_motions()
+            return True
+        
         if not self.dragging or self.display_image is None:
             return False
         
-        # 计算图像在画布中的位置
-        img_width, img_height = self.display_image.size
-        display_width = img_width * self.scale_factor
-        display_height = img_height * self.scale_factor
+        # 只记录最新的指针位置，几何计算推迟到下一帧的帧时钟回调中
+        # 高回报率鼠标和数位板每帧会产生多个事件，这里将它们合并为一次
+        self.pending_motion = (event.x, event.y)
+        if self.motion_event_since is None:
+            self.motion_event_since = self.get_event_timestamp(event)
         
-        alloc = widget.get_allocation()
-        x_offset = (alloc.width - display_width) / 2
-        y_offset = (alloc.height - display_height) / 2
+        if self.motion_tick_id is None:
+            self.motion_tick_id = widget.add_tick_callback(self.on_motion_tick)
+        
+        # 使用POINTER_MOTION_HINT_MASK时需要主动请求后续的移动事件
+        if event.is_hint:
+            event.request_motions()
+        return True
+    
+    def on_motion_tick(self, widget, frame_clock):
+        """帧时钟回调：用最新的指针位置更新一次裁剪框"""
+        self.motion_tick_id = None
+        self.flush_pending_motion()
+        return GLib.SOURCE_REMOVE
+    
+    def flush_pending_motion(self):
+        """立即处理合并后的指针位置"""
+        if self.motion_tick_id is not None:
+            self.drawing_area.remove_tick_callback(self.motion_tick_id)
+            self.motion_tick_id = None
+        
+        if self.pending_motion is None:
+            return
+        
+        x, y = self.pending_motion
+        self.pending_motion = None
+        if self.latency_since is None:
+            self.latency_since = self.motion_event_since
+        self.motion_event_since = None
+        
+        if self.dragging and self.display_image is not None:
+            with self.profiler.span("motion.geometry"):
+                self.update_crop_from_pointer(x, y)
+    
+    def get_event_timestamp(self, event):
+        """事件时间戳（微秒，与GLib单调时钟可比）
+        
+        X11/Wayland的事件时间通常就是单调时钟的毫秒数；
+        如果与当前单调时钟相差过大（时钟来源不同），则退回到事件到达的时间
+        """
+        now = GLib.get_monotonic_time()
+        event_time = event.get_time() * 1000
+        if 0 <= now - event_time < 1000000:
+            return event_time
+        return now
+    
+    def record_motion_latency(self):
+        """绘制完成时记录输入到绘制完成的延迟"""
+        if self.latency_since is None:
+            return
+        latency_ms = (GLib.get_monotonic_time() - self.latency_since) / 1000
+        self.motion_latencies.append(latency_ms)
+        self.latency_since = None
+    
+    def get_latency_stats(self):
+        """返回最近交互延迟的 (p50, p95, 最大值)，单位毫秒"""
+        if not self.motion_latencies:
+            return None
+        samples = sorted(self.motion_latencies)
+        p50 = samples[len(samples) // 2]
+        p95 = samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+        return p50, p95, samples[-1]
+    
+    def print_latency_stats(self):
+        stats = self.get_latency_stats()
+        if stats:
+            p50, p95, worst = stats
+            print(f"交互延迟: p50 {p50:.1f} ms, p95 {p95:.1f} ms, "
+                  f"最大 {worst:.1f} ms ({len(self.motion_latencies)} 帧)")
+    
+    def update_crop_from_pointer(self, x, y):
+        """根据画布上的指针位置更新裁剪框，并重绘受影响的区域"""
+        img_width, img_height = self.image_size
+        old_bounds = self.get_crop_widget_bounds()
         
         # 转换为图像坐标
-        img_x = (event.x - x_offset) / self.scale_factor
-        img_y = (event.y - y_offset) / self.scale_factor
+        img_x, img_y = self.widget_to_image(x, y)
         
         # 限制在图像范围内
         img_x = max(0, min(img_x, img_width))
@@ -629,488 +1433,34 @@ class ImageCropper(Gtk.Window):
             self.crop_rect = [x1, y1, x2, y2]
             self.apply_aspect_ratio()
         
-        # 重绘画布
-        widget.queue_draw()
-        return True
+        # 只重绘裁剪框扫过的区域
+        self.queue_crop_redraw(old_bounds)
     
     def apply_aspect_ratio(self):
-        """应用纵横比限制 - 修复边界问题"""
+        """应用纵横比限制（几何计算见crop_geometry）"""
         if self.aspect_ratio is None or self.crop_rect is None or self.display_image is None:
             return
         
-        # 获取图像尺寸
-        img_width, img_height = self.display_image.size
-        
-        x1, y1, x2, y2 = self.crop_rect
-        target_ratio = self.aspect_ratio[0] / self.aspect_ratio[1]
-        
-        # 确保坐标顺序（左上到右下）
-        x1, x2 = min(x1, x2), max(x1, x2)
-        y1, y2 = min(y1, y2), max(y1, y2)
-        
-        # 当前尺寸
-        current_width = max(x2 - x1,1)
-        current_height = max(y2 - y1,1)
-
-        
-        # 根据拖动模式确定固定角
-        if self.drag_mode is None:
-            # 如果没有拖动模式，默认固定左上角
-            fixed_corner = 'top-left'
-        elif 'tl' in self.drag_mode:
-            fixed_corner = 'top-left'
-        elif 'tr' in self.drag_mode:
-            fixed_corner = 'top-right'
-        elif 'bl' in self.drag_mode:
-            fixed_corner = 'bottom-left'
-        elif 'br' in self.drag_mode:
-            fixed_corner = 'bottom-right'
-        elif 'move' in self.drag_mode:
-            fixed_corner = 'center'  # 移动时保持中心不变
-        else:
-            fixed_corner = 'top-left'  # 默认
-        
-        # 根据固定角调整裁剪框
-        if fixed_corner == 'top-left':
-            # 固定左上角，调整右下角
-            if current_width / current_height > target_ratio:
-                # 太宽，调整高度
-                new_height = current_width / target_ratio
-                y2 = y1 + new_height
-            else:
-                # 太高，调整宽度
-                new_width = current_height * target_ratio
-                x2 = x1 + new_width
-            
-            # 边界检查：确保右下角不超出图像
-            if x2 > img_width:
-                x2 = img_width
-                # 根据新宽度调整高度以保持比例
-                new_height = (x2 - x1) / target_ratio
-                y2 = y1 + new_height
-            
-            if y2 > img_height:
-                y2 = img_height
-                # 根据新高度调整宽度以保持比例
-                new_width = (y2 - y1) * target_ratio
-                x2 = x1 + new_width
-            
-            # 如果调整后左上角超出了边界，需要整体移动
-            if x1 < 0 or y1 < 0:
-                # 向右下移动
-                if x1 < 0:
-                    shift = -x1
-                    x1 += shift
-                    x2 += shift
-                
-                if y1 < 0:
-                    shift = -y1
-                    y1 += shift
-                    y2 += shift
-                
-                # 再次检查右下角
-                if x2 > img_width:
-                    # 需要缩小宽度
-                    x2 = img_width
-                    new_height = (x2 - x1) / target_ratio
-                    y2 = y1 + new_height
-                
-                if y2 > img_height:
-                    y2 = img_height
-                    new_width = (y2 - y1) * target_ratio
-                    x2 = x1 + new_width
-        
-        elif fixed_corner == 'top-right':
-            # 固定右上角，调整左下角
-            if current_width / current_height > target_ratio:
-                # 太宽，调整高度
-                new_height = current_width / target_ratio
-                y2 = y1 + new_height
-            else:
-                # 太高，调整宽度
-                new_width = current_height * target_ratio
-                x1 = x2 - new_width
-            
-            # 边界检查
-            if x1 < 0:
-                x1 = 0
-                new_height = (x2 - x1) / target_ratio
-                y2 = y1 + new_height
-            
-            if y2 > img_height:
-                y2 = img_height
-                new_width = (y2 - y1) * target_ratio
-                x1 = x2 - new_width
-            
-            # 检查右上角
-            if x2 > img_width or y1 < 0:
-                if x2 > img_width:
-                    shift = x2 - img_width
-                    x1 -= shift
-                    x2 -= shift
-                
-                if y1 < 0:
-                    shift = -y1
-                    y1 += shift
-                    y2 += shift
-                
-                # 再次检查
-                if x1 < 0:
-                    x1 = 0
-                    new_height = (x2 - x1) / target_ratio
-                    y2 = y1 + new_height
-        
-        elif fixed_corner == 'bottom-left':
-            # 固定左下角，调整右上角
-            if current_width / current_height > target_ratio:
-                # 太宽，调整高度
-                new_height = current_width / target_ratio
-                y1 = y2 - new_height
-            else:
-                # 太高，调整宽度
-                new_width = current_height * target_ratio
-                x2 = x1 + new_width
-            
-            # 边界检查
-            if x2 > img_width:
-                x2 = img_width
-                new_height = (x2 - x1) / target_ratio
-                y1 = y2 - new_height
-            
-            if y1 < 0:
-                y1 = 0
-                new_width = (y2 - y1) * target_ratio
-                x2 = x1 + new_width
-            
-            # 检查左下角
-            if x1 < 0 or y2 > img_height:
-                if x1 < 0:
-                    shift = -x1
-                    x1 += shift
-                    x2 += shift
-                
-                if y2 > img_height:
-                    shift = y2 - img_height
-                    y1 -= shift
-                    y2 -= shift
-                
-                # 再次检查
-                if x2 > img_width:
-                    x2 = img_width
-                    new_height = (x2 - x1) / target_ratio
-                    y1 = y2 - new_height
-        
-        elif fixed_corner == 'bottom-right':
-            # 固定右下角，调整左上角
-            if current_width / current_height > target_ratio:
-                # 太宽，调整高度
-                new_height = current_width / target_ratio
-                y1 = y2 - new_height
-            else:
-                # 太高，调整宽度
-                new_width = current_height * target_ratio
-                x1 = x2 - new_width
-            
-            # 边界检查
-            if x1 < 0:
-                x1 = 0
-                new_height = (x2 - x1) / target_ratio
-                y1 = y2 - new_height
-            
-            if y1 < 0:
-                y1 = 0
-                new_width = (y2 - y1) * target_ratio
-                x1 = x2 - new_width
-            
-            # 检查右下角
-            if x2 > img_width or y2 > img_height:
-                if x2 > img_width:
-                    shift = x2 - img_width
-                    x1 -= shift
-                    x2 -= shift
-                
-                if y2 > img_height:
-                    shift = y2 - img_height
-                    y1 -= shift
-                    y2 -= shift
-                
-                # 再次检查
-                if x1 < 0:
-                    x1 = 0
-                    new_height = (x2 - x1) / target_ratio
-                    y1 = y2 - new_height
-        
-        elif fixed_corner == 'center':
-            # 保持中心不变，调整四个边
-            center_x = (x1 + x2) / 2
-            center_y = (y1 + y2) / 2
-            
-            if current_width / current_height > target_ratio:
-                # 太宽，调整高度
-                new_height = current_width / target_ratio
-                y1 = center_y - new_height / 2
-                y2 = center_y + new_height / 2
-            else:
-                # 太高，调整宽度
-                new_width = current_height * target_ratio
-                x1 = center_x - new_width / 2
-                x2 = center_x + new_width / 2
-            
-            # 边界检查
-            if x1 < 0:
-                shift = -x1
-                x1 += shift
-                x2 += shift
-            
-            if x2 > img_width:
-                shift = x2 - img_width
-                x1 -= shift
-                x2 -= shift
-            
-            if y1 < 0:
-                shift = -y1
-                y1 += shift
-                y2 += shift
-            
-            if y2 > img_height:
-                shift = y2 - img_height
-                y1 -= shift
-                y2 -= shift
-            
-            # 如果移动后仍然超出，需要缩小
-            if x1 < 0 or x2 > img_width or y1 < 0 or y2 > img_height:
-                # 缩小到适合图像
-                x1 = max(0, x1)
-                y1 = max(0, y1)
-                x2 = min(img_width, x2)
-                y2 = min(img_height, y2)
-                
-                # 根据实际尺寸和比例调整
-                actual_width = x2 - x1
-                actual_height = y2 - y1
-                
-                if actual_width / actual_height > target_ratio:
-                    # 太宽，调整高度
-                    new_height = actual_width / target_ratio
-                    if new_height > img_height:
-                        # 如果还是太高，缩小宽度
-                        new_width = img_height * target_ratio
-                        x1 = center_x - new_width / 2
-                        x2 = center_x + new_width / 2
-                        y1 = 0
-                        y2 = img_height
-                    else:
-                        # 调整高度
-                        y1 = center_y - new_height / 2
-                        y2 = center_y + new_height / 2
-                else:
-                    # 太高，调整宽度
-                    new_width = actual_height * target_ratio
-                    if new_width > img_width:
-                        # 如果还是太宽，缩小高度
-                        new_height = img_width / target_ratio
-                        x1 = 0
-                        x2 = img_width
-                        y1 = center_y - new_height / 2
-                        y2 = center_y + new_height / 2
-                    else:
-                        # 调整宽度
-                        x1 = center_x - new_width / 2
-                        x2 = center_x + new_width / 2
-        
-        # 最终边界检查
-        x1 = max(0, min(x1, img_width - 1))
-        y1 = max(0, min(y1, img_height - 1))
-        x2 = max(1, min(x2, img_width))
-        y2 = max(1, min(y2, img_height))
-        
-        # 确保有效尺寸
-        if x2 - x1 < 10 or y2 - y1 < 10:
-            # 如果太小，使用最小尺寸
-            min_size = 20
-            if target_ratio >= 1:
-                # 宽度 >= 高度
-                new_width = min_size
-                new_height = new_width / target_ratio
-            else:
-                # 高度 > 宽度
-                new_height = min_size
-                new_width = new_height * target_ratio
-            
-            # 根据固定角放置
-            if fixed_corner == 'top-left':
-                x2 = min(img_width, x1 + new_width)
-                y2 = min(img_height, y1 + new_height)
-            elif fixed_corner == 'top-right':
-                x1 = max(0, x2 - new_width)
-                y2 = min(img_height, y1 + new_height)
-            elif fixed_corner == 'bottom-left':
-                x2 = min(img_width, x1 + new_width)
-                y1 = max(0, y2 - new_height)
-            elif fixed_corner == 'bottom-right':
-                x1 = max(0, x2 - new_width)
-                y1 = max(0, y2 - new_height)
-            else:  # center
-                center_x = (x1 + x2) / 2
-                center_y = (y1 + y2) / 2
-                x1 = max(0, center_x - new_width / 2)
-                x2 = min(img_width, x1 + new_width)
-                y1 = max(0, center_y - new_height / 2)
-                y2 = min(img_height, y1 + new_height)
-        
-        self.crop_rect = [x1, y1, x2, y2]
+        with self.profiler.span("aspect"):
+            target_ratio = self.aspect_ratio[0] / self.aspect_ratio[1]
+            anchor = anchor_for_drag_mode(self.drag_mode)
+            rect = constrain_aspect([self.crop_rect], self.image_size, target_ratio, anchor)[0]
+            self.crop_rect = [float(v) for v in rect]
     
     def on_ratio_changed(self, widget):
         ratio_text = widget.get_active_text()
-        ratios = {
-            "自由": None,
-            "1:1 (正方形)": (1, 1),
-            "4:3 (标准)": (4, 3),
-            "16:9 (宽屏)": (16, 9),
-            "3:2 (照片)": (3, 2),
-            "2:3 (人像)": (2, 3)
-        }
-        self.aspect_ratio = ratios[ratio_text]
+        self.aspect_ratio = ratio_from_label(ratio_text)
+        self.region.ratio_index = widget.get_active()
         
         # 如果没有图像或没有裁剪框，直接返回
         if self.display_image is None or self.crop_rect is None:
             return
         
-        # 获取图像尺寸
-        img_width, img_height = self.display_image.size
-        
-        # 如果已有裁剪框，应用新的比例
+        # 如果已有裁剪框，以中心点为基准应用新的比例
         if self.crop_rect and self.aspect_ratio:
-            x1, y1, x2, y2 = self.crop_rect
-            
-            # 确保坐标顺序（左上到右下）
-            x1, x2 = min(x1, x2), max(x1, x2)
-            y1, y2 = min(y1, y2), max(y1, y2)
-            
-            # 计算当前中心点（用于保持位置）
-            center_x = (x1 + x2) / 2
-            center_y = (y1 + y2) / 2
-            
-            # 获取当前尺寸
-            current_width = max(x2 - x1,1)
-            current_height = max(y2 - y1,1)
-            
-            # 目标宽高比
             target_ratio = self.aspect_ratio[0] / self.aspect_ratio[1]
-            
-            # 根据当前尺寸和目标比例计算新尺寸
-            # 保持面积大致相同，或者保持宽度/高度中的一个
-            if current_width / current_height > target_ratio:
-                # 当前太宽，调整高度
-                new_height = current_width / target_ratio
-                new_width = current_width
-            else:
-                # 当前太高，调整宽度
-                new_width = current_height * target_ratio
-                new_height = current_height
-            
-            # 确保最小尺寸
-            min_size = 10
-            if new_width < min_size:
-                new_width = min_size
-                new_height = new_width / target_ratio
-            
-            if new_height < min_size:
-                new_height = min_size
-                new_width = new_height * target_ratio
-            
-            # 从中心点计算新坐标
-            new_x1 = center_x - new_width / 2
-            new_y1 = center_y - new_height / 2
-            new_x2 = center_x + new_width / 2
-            new_y2 = center_y + new_height / 2
-            
-            # ========== 关键：边界检查 ==========
-            # 1. 如果裁剪框超出左边界
-            if new_x1 < 0:
-                shift = -new_x1
-                new_x1 += shift
-                new_x2 += shift
-            
-            # 2. 如果裁剪框超出右边界
-            if new_x2 > img_width:
-                shift = new_x2 - img_width
-                new_x1 -= shift
-                new_x2 -= shift
-            
-            # 3. 如果裁剪框超出上边界
-            if new_y1 < 0:
-                shift = -new_y1
-                new_y1 += shift
-                new_y2 += shift
-            
-            # 4. 如果裁剪框超出下边界
-            if new_y2 > img_height:
-                shift = new_y2 - img_height
-                new_y1 -= shift
-                new_y2 -= shift
-            
-            # 再次检查所有边界（处理双重越界情况）
-            # 如果裁剪框仍然太大，调整大小而不是位置
-            if new_x1 < 0:
-                # 左边界越界，向右移动并缩小宽度
-                new_x1 = 0
-                new_width = new_x2 - new_x1
-                # 根据比例调整高度
-                new_height = new_width / target_ratio
-                new_y1 = center_y - new_height / 2
-                new_y2 = center_y + new_height / 2
-            
-            if new_x2 > img_width:
-                new_x2 = img_width
-                new_width = new_x2 - new_x1
-                new_height = new_width / target_ratio
-                new_y1 = center_y - new_height / 2
-                new_y2 = center_y + new_height / 2
-            
-            if new_y1 < 0:
-                new_y1 = 0
-                new_height = new_y2 - new_y1
-                new_width = new_height * target_ratio
-                new_x1 = center_x - new_width / 2
-                new_x2 = center_x + new_width / 2
-            
-            if new_y2 > img_height:
-                new_y2 = img_height
-                new_height = new_y2 - new_y1
-                new_width = new_height * target_ratio
-                new_x1 = center_x - new_width / 2
-                new_x2 = center_x + new_width / 2
-            
-            # 最终边界检查（防止缩小后再次越界）
-            new_x1 = max(0, min(new_x1, img_width - 1))
-            new_y1 = max(0, min(new_y1, img_height - 1))
-            new_x2 = max(1, min(new_x2, img_width))
-            new_y2 = max(1, min(new_y2, img_height))
-            
-            # 确保有有效的大小
-            if new_x2 - new_x1 < 10 or new_y2 - new_y1 < 10:
-                # 如果太小，创建一个默认大小的裁剪框
-                default_size = min(100, img_width, img_height)
-                new_x1 = max(0, center_x - default_size / 2)
-                new_y1 = max(0, center_y - default_size / 2)
-                new_x2 = min(img_width, new_x1 + default_size)
-                new_y2 = min(img_height, new_y1 + default_size)
-                
-                # 根据比例调整
-                if target_ratio > 1:  # 宽度 > 高度
-                    new_width = default_size
-                    new_height = new_width / target_ratio
-                else:  # 高度 >= 宽度
-                    new_height = default_size
-                    new_width = new_height * target_ratio
-                
-                new_x1 = max(0, center_x - new_width / 2)
-                new_y1 = max(0, center_y - new_height / 2)
-                new_x2 = min(img_width, new_x1 + new_width)
-                new_y2 = min(img_height, new_y1 + new_height)
-            
-            # 更新裁剪框
+            rect = fit_ratio([self.crop_rect], self.image_size, target_ratio)[0]
+            new_x1, new_y1, new_x2, new_y2 = (float(v) for v in rect)
             self.crop_rect = [new_x1, new_y1, new_x2, new_y2]
             
             # 更新保存按钮状态
@@ -1124,83 +1474,221 @@ class ImageCropper(Gtk.Window):
     def on_preset_changed(self, widget):
         """预设尺寸改变"""
         preset_text = widget.get_active_text()
+        self.region.preset_index = widget.get_active()
         
-        if preset_text == "自定义" or self.crop_rect is None:
+        if preset_text == "自定义" or self.crop_rect is None or self.display_image is None:
             return
         
         # 解析尺寸
         import re
         match = re.search(r'(\d+)x(\d+)', preset_text)
         if match:
-            target_width = int(match.group(1))
-            target_height = int(match.group(2))
+            target_size = (int(match.group(1)), int(match.group(2)))
             
-            # 计算当前裁剪框中心
+            # 保持中心点，超出图像时平移回图像内
+            rect = fit_size([self.crop_rect], self.image_size, target_size)[0]
+            self.crop_rect = [float(v) for v in rect]
+            self.drawing_area.queue_draw()
+    
+    # ========== 裁剪建议 ==========
+    
+    def on_suggest_crops(self, widget):
+        """在后台为每个固定比例搜索能量最高的裁剪框（使用预览，不需要完整分辨率）"""
+        image = (self.image_state.raster if self.image_state.display_shared
+                 else self.image_state.display)
+        if image is None:
+            return
+        indices = [i for i, (_, _, ratio) in enumerate(RATIO_PRESETS) if ratio is not None]
+        ratios = [RATIO_PRESETS[i][2] for i in indices]
+        self.suggest_worker.load(
+            self.profiler.wrap("suggest", lambda image, ratios, size, **_:
+                               suggest_crops(image, ratios, size)),
+            image, ratios, self.image_state.display_size,
+            on_done=lambda result: self.show_suggestions(image, indices, result),
+            on_error=self.show_load_error
+        )
+    
+    def show_suggestions(self, image, indices, result):
+        """显示建议框（显示图像已变化时丢弃）"""
+        current = (self.image_state.raster if self.image_state.display_shared
+                   else self.image_state.display)
+        if image is not current:
+            return
+        self.suggestions = [(index, box) for index, (_, box, _) in zip(indices, result)]
+        self.info_label.set_text("点击一个建议框采用该裁剪")
+        self.drawing_area.queue_draw()
+    
+    def apply_suggestion_at(self, img_x, img_y):
+        """采用包含该点的最小建议框，并切换到对应的比例；没有时返回False"""
+        hits = [(ratio_index, (x1, y1, x2, y2))
+                for ratio_index, (x1, y1, x2, y2) in self.suggestions
+                if x1 <= img_x < x2 and y1 <= img_y < y2]
+        if not hits:
+            return False
+        ratio_index, box = min(hits, key=lambda item: (item[1][2] - item[1][0]) *
+                               (item[1][3] - item[1][1]))
+        self.suggestions = None
+        self.crop_rect = [float(v) for v in box]
+        # 建议框已经是目标比例，切换下拉框时按中心修正不会改变它
+        self.ratio_combo.set_active(ratio_index)
+        self.update_save_button()
+        self.info_label.set_text("拖拽选择裁剪区域")
+        self.drawing_area.queue_draw()
+        return True
+    
+    def on_auto_trim(self, widget):
+        """去掉纯色边框：在预览上找内容框，已有完整分辨率（或区域源）时在原图上精确定位四条边"""
+        if self.display_image is None:
+            return
+        if not self.image_state.display_shared:
+            self.info_label.set_text("旋转后不能自动去边")
+            return
+        try:
+            with self.profiler.span("trim"):
+                box = trim_box(self.trim_preview(), self.image_state.original, self.full_size)
+        except Exception as e:
+            self.show_error_dialog(f"自动去边失败: {e}")
+            return
+        if box is None:
+            self.info_label.set_text("没有找到边框以外的内容")
+            return
+        # 去边的结果不保持固定比例，切换为自由比例
+        self.ratio_combo.set_active(0)
+        self.suggestions = None
+        self.crop_rect = [float(v) for v in box]
+        self.update_save_button()
+        self.drawing_area.queue_draw()
+    
+    def trim_preview(self):
+        """自动去边粗略扫描用的预览：底图金字塔中最长边不小于TRIM_SIDE的最小一层
+        
+        金字塔各层已经逐级缩小好，主线程中不必为粗略扫描再缩小整张底图；
+        区域源插在第0层，从它下面的预览开始选
+        """
+        raster = self.image_state.raster
+        levels = self.base_renderer.pyramid or [(1.0, raster)]
+        if levels[0][1] is not raster:
+            levels = levels[1:]
+        preview = raster
+        for _, level in levels:
+            if max(level.size) < TRIM_SIDE:
+                break
+            preview = level
+        return preview
+    
+    # ========== 裁剪区域 ==========
+    
+    def clear_crop_rects(self):
+        """清除所有区域的裁剪框（打开新图片或旋转后坐标失效）"""
+        for region in self.regions:
+            region.rect = None
+        self.save_btn.set_sensitive(False)
+    
+    def update_save_button(self):
+        """当前区域的裁剪框足够大时才允许保存"""
+        if self.crop_rect:
             x1, y1, x2, y2 = self.crop_rect
-            center_x = (x1 + x2) / 2
-            center_y = (y1 + y2) / 2
-            
-            # 设置新的裁剪框（保持中心点）
-            new_x1 = center_x - target_width / 2
-            new_y1 = center_y - target_height / 2
-            new_x2 = center_x + target_width / 2
-            new_y2 = center_y + target_height / 2
-            
-            # 确保在图像范围内
-            if self.display_image:
-                img_width, img_height = self.display_image.size
-                if new_x1 < 0:
-                    new_x2 -= new_x1
-                    new_x1 = 0
-                if new_y1 < 0:
-                    new_y2 -= new_y1
-                    new_y1 = 0
-                if new_x2 > img_width:
-                    new_x1 -= (new_x2 - img_width)
-                    new_x2 = img_width
-                if new_y2 > img_height:
-                    new_y1 -= (new_y2 - img_height)
-                    new_y2 = img_height
-            
-            self.crop_rect = [new_x1, new_y1, new_x2, new_y2]
+            self.save_btn.set_sensitive(abs(x2 - x1) > 10 and abs(y2 - y1) > 10)
+        else:
+            self.save_btn.set_sensitive(False)
+    
+    def select_region(self, index):
+        """切换当前区域，并让控制面板显示该区域的比例和预设"""
+        self.active_region = index
+        region = self.region
+        
+        # 只同步控件，不把比例或预设重新应用到裁剪框
+        for combo, handler, active in (
+                (self.region_combo, self.on_region_changed, index),
+                (self.ratio_combo, self.on_ratio_changed, region.ratio_index),
+                (self.preset_combo, self.on_preset_changed, region.preset_index)):
+            combo.handler_block_by_func(handler)
+            combo.set_active(active)
+            combo.handler_unblock_by_func(handler)
+        self.region_name_entry.set_text(region.name)
+        
+        self.update_save_button()
+        self.drawing_area.queue_draw()
+    
+    def on_region_changed(self, widget):
+        index = widget.get_active()
+        if 0 <= index < len(self.regions) and index != self.active_region:
+            self.select_region(index)
+    
+    def on_add_region(self, widget):
+        """添加一个新区域并切换过去"""
+        region = CropRegion(new_region_name(self.regions))
+        self.regions.append(region)
+        self.region_combo.append_text(region.name)
+        self.select_region(len(self.regions) - 1)
+    
+    def on_remove_region(self, widget):
+        """删除当前区域（只剩一个区域时只清除它的裁剪框）"""
+        if len(self.regions) == 1:
+            self.crop_rect = None
+            self.update_save_button()
             self.drawing_area.queue_draw()
+            return
+        
+        index = self.active_region
+        self.regions.pop(index)
+        self.region_combo.handler_block_by_func(self.on_region_changed)
+        self.region_combo.remove(index)
+        self.region_combo.handler_unblock_by_func(self.on_region_changed)
+        self.select_region(max(0, index - 1))
+    
+    def on_region_renamed(self, widget):
+        """名称输入框回车：重命名当前区域"""
+        name = widget.get_text().strip()
+        if not name:
+            widget.set_text(self.region.name)
+            return
+        self.region.name = name
+        
+        index = self.active_region
+        self.region_combo.handler_block_by_func(self.on_region_changed)
+        self.region_combo.remove(index)
+        self.region_combo.insert_text(index, name)
+        self.region_combo.set_active(index)
+        self.region_combo.handler_unblock_by_func(self.on_region_changed)
+        self.drawing_area.queue_draw()
     
     def on_rotate_changed(self, widget):
         """旋转滑块改变"""
         self.rotation = widget.get_value()
         self.rotate_label.set_text(f"{int(self.rotation)}°")
         
-        if self.original_image:
-            # 旋转图像
-            self.display_image = self.original_image.rotate(
-                self.rotation, expand=True, resample=Image.BICUBIC)
+        if self.get_base_image():
+            # 拖动期间只用cairo变换预览，停止后才在后台做双三次旋转
+            self.refresh_display_image()
             
             # 调整裁剪框（如果有）
-            if self.crop_rect:
-                # 这里简化处理：旋转时清除裁剪框
-                self.crop_rect = None
-                self.save_btn.set_sensitive(False)
+            if any(region.rect for region in self.regions):
+                # 这里简化处理：旋转时清除所有区域的裁剪框
+                self.clear_crop_rects()
             
             self.drawing_area.queue_draw()
     
     def on_rotate_left(self, widget):
         """左转90度"""
-        if self.original_image:
-            self.original_image = self.original_image.rotate(90, expand=True)
-            self.display_image = self.original_image.copy()
-            self.crop_rect = None
-            self.save_btn.set_sensitive(False)
+        if self.get_base_image():
+            self.rotate_quarter(1)
+            self.clear_crop_rects()
             self.drawing_area.queue_draw()
     
     def on_rotate_right(self, widget):
         """右转90度"""
-        if self.original_image:
-            self.original_image = self.original_image.rotate(-90, expand=True)
-            self.display_image = self.original_image.copy()
-            self.crop_rect = None
-            self.save_btn.set_sensitive(False)
+        if self.get_base_image():
+            self.rotate_quarter(-1)
+            self.clear_crop_rects()
             self.drawing_area.queue_draw()
     
+    def rotate_quarter(self, turns):
+        """旋转90度的整数倍（turns为正表示左转），预览和完整图像同步旋转"""
+        self.image_state.rotate_quarter(turns)
+        self.update_base_renderer()
+        self.refresh_display_image()
+    
     def on_save_image(self, widget):
         if not self.crop_rect or not self.display_image:
             return
@@ -1217,7 +1705,7 @@ class ImageCropper(Gtk.Window):
         )
 
         # 设置默认文件名
-        default_name = f"cropped_image_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+        default_name = default_output_name()
         dialog.set_current_name(default_name)
 
         # 添加格式过滤器
@@ -1242,6 +1730,12 @@ class ImageCropper(Gtk.Window):
         filter_gif.add_pattern("*.gif")
         dialog.add_filter(filter_gif)
 
+        filter_tiff = Gtk.FileFilter()
+        filter_tiff.set_name("TIFF 图像 (*.tif, *.tiff)")
+        filter_tiff.add_pattern("*.tif")
+        filter_tiff.add_pattern("*.tiff")
+        dialog.add_filter(filter_tiff)
+
         # 显示对话框
         response = dialog.run()
         if response == Gtk.ResponseType.OK:
@@ -1250,20 +1744,8 @@ class ImageCropper(Gtk.Window):
             # 获取用户选择的过滤器（格式）
             file_filter = dialog.get_filter()
 
-            if filename.lower().endswith(('.png', '.jpg', '.jpeg', '.bmp', '.gif')):
-                # 从扩展名推断格式
-                ext = filename.lower().split('.')[-1]
-                if ext in ['jpg', 'jpeg']:
-                    output_format = "JPEG"
-                elif ext == 'png':
-                    output_format = "PNG"
-                elif ext == 'bmp':
-                    output_format = "BMP"
-                elif ext == 'gif':
-                    output_format = "GIF"
-                else:
-                    output_format = "JPEG"  # 默认
-            else:
+            output_format = format_from_filename(filename)
+            if output_format is None:
                 if file_filter == filter_jpg:
                     output_format = "JPEG"
                     filename = filename + ".jpg"  # 添加扩展名
@@ -1276,67 +1758,28 @@ class ImageCropper(Gtk.Window):
                 elif file_filter == filter_gif:
                     output_format = "GIF"
                     filename = filename + ".gif"  # 添加扩展名
+                elif file_filter == filter_tiff:
+                    output_format = "TIFF"
+                    filename = filename + ".tif"  # 添加扩展名
 
             # 裁剪图像（与之前相同）
             x1, y1, x2, y2 = map(int, self.crop_rect)
-            img_width, img_height = self.display_image.size
+            img_width, img_height = self.image_size
             x1 = max(0, min(x1, img_width))
             y1 = max(0, min(y1, img_height))
             x2 = max(0, min(x2, img_width))
             y2 = max(0, min(y2, img_height))
+            dialog.destroy()
             if x2 <= x1 or y2 <= y1:
-                dialog.destroy()
                 self.show_error_dialog("无效的裁剪区域")
                 return
-            cropped = self.display_image.crop((x1, y1, x2, y2))
-           
-
-            if output_format == "JPG" or output_format == "JPEG":
-                # JPG格式不支持透明度，需要处理
-                if cropped.mode in ('RGBA', 'LA') or (cropped.mode == 'P' and 'transparency' in cropped.info):
-                    # 方法1：用白色背景填充透明区域（推荐）
-                    print(f"检测到透明图像，转换为JPG时用白色背景填充")
-                    
-                    # 创建白色背景
-                    background = Image.new('RGB', cropped.size, (255, 255, 255))
-                    
-                    if cropped.mode == 'RGBA':
-                        # 分离Alpha通道
-                        r, g, b, a = cropped.split()
-                        # 将RGB通道合并到背景上
-                        background.paste(cropped, mask=a)
-                    elif cropped.mode == 'LA':
-                        # 灰度+透明度
-                        cropped = cropped.convert('RGBA')
-                        r, g, b, a = cropped.split()
-                        background.paste(Image.merge('RGB', (r, g, b)), mask=a)
-                    elif cropped.mode == 'P':
-                        # 调色板模式
-                        cropped = cropped.convert('RGBA')
-                        r, g, b, a = cropped.split()
-                        background.paste(Image.merge('RGB', (r, g, b)), mask=a)
-                    
-                    cropped = background
-                elif cropped.mode != 'RGB':
-                    # 其他非RGB模式转换为RGB
-                    cropped = cropped.convert('RGB')
-            # 根据选择的格式处理图像并保存
-            try:
-                # 这里调用之前写的转换和保存逻辑，注意要传递output_format和filename
-                cropped.save(filename, format=output_format)
-            except Exception as e:
-                dialog = Gtk.MessageDialog(
-                    parent=self,
-                    flags=0,
-                    message_type=Gtk.MessageType.ERROR,
-                    buttons=Gtk.ButtonsType.OK,
-                    text=f"保存失败: {str(e)}"
-                )
+            
+            # 非破坏性导出：原图 + 旋转角度 + 旋转空间中的裁剪框，
+            # 在后台线程中一次仿射重采样只计算输出区域并编码
+            self.queue_export(filename, output_format, (x1, y1, x2, y2))
         else:
             # 用户取消
-            pass
-
-        dialog.destroy()
+            dialog.destroy()
         
         def on_browse_path(self, widget):
             """浏览保存路径"""
@@ -1359,6 +1802,147 @@ class ImageCropper(Gtk.Window):
                 self.path_entry.set_text(dialog.get_filename())
             
             dialog.destroy()
+    
+    def get_export_source(self):
+        """导出用的完整分辨率图像
+        
+        还只有预览时返回一个函数，由导出线程解码（并重放90度旋转），不阻塞界面
+        """
+        if self.original_image is not None:
+            return self.original_image
+        path, turns = self.image_path, self.image_state.quarter_turns
+        return lambda: transpose_quarter_turns(open_full(path, lazy=True), turns)
+    
+    def export_recipe(self, box, output_format, aspect_ratio, widths=None):
+        """写入裁剪清单的方案，rebuild子命令据此重新渲染"""
+        return make_recipe(self.image_path, self.image_state.quarter_turns, self.rotation,
+                           box, aspect_ratio, output_format, widths=widths)
+    
+    def queue_export(self, filename, output_format, box):
+        """把当前裁剪加入后台导出队列
+        
+        勾选多尺寸导出时，以filename的目录和主文件名输出 <主文件名>_<宽度>w.ext 和清单
+        """
+        if self.responsive_check.get_active():
+            try:
+                widths = parse_widths(self.responsive_widths_entry.get_text())
+            except ValueError as e:
+                self.show_error_dialog(str(e))
+                return
+            directory, name = os.path.split(filename)
+            job = self.export_queue.submit_responsive(
+                self.get_export_source(), self.rotation, box, directory,
+                os.path.splitext(name)[0], output_format, widths,
+                on_update=self.on_export_update,
+                recipe=self.export_recipe(box, output_format, self.aspect_ratio, widths)
+            )
+        else:
+            job = self.export_queue.submit(
+                self.get_export_source(), self.rotation, box, filename, output_format,
+                on_update=self.on_export_update,
+                recipe=self.export_recipe(box, output_format, self.aspect_ratio)
+            )
+        self.add_export_row(job)
+    
+    def on_export_regions(self, widget):
+        """把所有区域导出到一个目录：共用一次解码，各区域并行裁剪和编码"""
+        if self.display_image is None:
+            return
+        
+        regions = []
+        for region in self.regions:
+            box = region.export_box(self.image_size)
+            if box is not None:
+                regions.append((region, box))
+        if not regions:
+            self.show_error_dialog("没有可导出的裁剪区域")
+            return
+        
+        dialog = Gtk.FileChooserDialog(
+            title="导出全部区域到目录",
+            parent=self,
+            action=Gtk.FileChooserAction.SELECT_FOLDER
+        )
+        dialog.add_buttons(
+            Gtk.STOCK_CANCEL, Gtk.ResponseType.CANCEL,
+            Gtk.STOCK_SAVE, Gtk.ResponseType.OK
+        )
+        current_path = self.path_entry.get_text()
+        if os.path.isdir(current_path):
+            dialog.set_current_folder(current_path)
+        
+        # 输出格式，默认与原图相同
+        formats = ["JPEG", "PNG", "BMP", "GIF", "TIFF"]
+        format_combo = Gtk.ComboBoxText()
+        for fmt in formats:
+            format_combo.append_text(fmt)
+        format_combo.set_active(formats.index(self.image_format)
+                                if self.image_format in formats else 1)
+        dialog.set_extra_widget(format_combo)
+        
+        response = dialog.run()
+        directory = dialog.get_filename()
+        output_format = format_combo.get_active_text()
+        dialog.destroy()
+        if response != Gtk.ResponseType.OK:
+            return
+        
+        filenames = region_filenames(directory, default_output_name(),
+                                     [region.name for region, _ in regions],
+                                     FORMAT_EXTENSIONS[output_format])
+        items = [(box, filename, output_format, None)
+                 for (_, box), filename in zip(regions, filenames)]
+        recipes = [self.export_recipe(box, output_format, region.aspect_ratio)
+                   for region, box in regions]
+        for job in self.export_queue.submit_group(self.get_export_source(), self.rotation,
+                                                  items, on_update=self.on_export_update,
+                                                  recipes=recipes):
+            self.add_export_row(job)
+    
+    def add_export_row(self, job):
+        """在导出队列列表中添加一行"""
+        label = Gtk.Label(label=job.describe(), xalign=0)
+        label.set_ellipsize(Pango.EllipsizeMode.MIDDLE)
+        progress = Gtk.ProgressBar()
+        row_box = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=2)
+        row_box.pack_start(label, False, False, 0)
+        row_box.pack_start(progress, False, False, 0)
+        row = Gtk.ListBoxRow()
+        row.add(row_box)
+        row.show_all()
+        self.export_list.add(row)
+        self.export_rows[job.id] = (row, label, progress)
+    
+    def on_export_update(self, job, status):
+        """导出任务状态变化（主线程）"""
+        widgets = self.export_rows.get(job.id)
+        if widgets is not None:
+            _, label, progress = widgets
+            label.set_text(job.describe())
+            progress.set_fraction(job.progress)
+        
+        if status == ExportJob.FAILED:
+            self.show_error_dialog(f"保存失败: {job.error}")
+        elif status == ExportJob.DONE:
+            self.update_memory_label()
+    
+    def on_clear_exports(self, widget):
+        """移除已完成的导出任务"""
+        for job in self.export_queue.clear_finished():
+            row, _, _ = self.export_rows.pop(job.id)
+            self.export_list.remove(row)
+    
+    def show_error_dialog(self, message):
+        """非模态错误提示，不阻塞后续操作"""
+        dialog = Gtk.MessageDialog(
+            parent=self,
+            flags=0,
+            message_type=Gtk.MessageType.ERROR,
+            buttons=Gtk.ButtonsType.OK,
+            text=message
+        )
+        dialog.connect("response", lambda d, response: d.destroy())
+        dialog.show()
 
 
 def main():
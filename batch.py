@@ -0,0 +1,314 @@
+#!/usr/bin/env python3
+"""
+批量裁剪（不依赖GTK）
+对目录或通配符匹配的所有图片应用同一个裁剪方案，用多进程并行处理
+"""
+
+import glob
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from PIL import Image
+
+from export import EXTENSION_FORMATS, FORMAT_EXTENSIONS, default_output_name, save_image
+from crop_geometry import fit_ratio
+from loader import SUPPORTED_EXTENSIONS, open_preview
+from mapped import open_mapped
+from presets import parse_ratio, parse_size
+from responsive import export_responsive, parse_widths
+from streaming import open_stream, stream_crop
+from suggest import SUGGEST_SIDE, best_crop, working_image
+from tiff_roi import open_tiff_region
+from trim import DEFAULT_TOLERANCE, TRIM_SIDE, trim_box, trim_preview
+from transform import crop_rotated, rotate_image, rotated_size
+
+
+class CropSpec:
+    """裁剪方案
+
+    box（绝对像素）、relative（相对比例）、ratio（固定比例，取居中的最大区域）、
+    size（固定尺寸，居中）、suggest（固定比例，按内容选择位置和大小）、
+    trim（去掉纯色边框，容差为tolerance）六选一，都不指定时保留整张图像。
+    坐标都在旋转rotation度之后的图像上，与图形界面一致。
+    """
+
+    def __init__(self, box=None, relative=None, ratio=None, size=None, rotation=0.0,
+                 suggest=None, trim=False, tolerance=DEFAULT_TOLERANCE):
+        if trim and rotation % 360:
+            raise ValueError("自动去边不能与旋转同时使用")
+        self.box = box
+        self.relative = relative
+        self.ratio = ratio
+        self.size = size
+        self.rotation = rotation
+        self.suggest = suggest
+        self.trim = trim
+        self.tolerance = tolerance
+
+    @property
+    def preview_side(self):
+        """按内容确定裁剪框时需要的预览最长边，不需要预览时为None"""
+        if self.trim:
+            return TRIM_SIDE
+        if self.suggest is not None:
+            return SUGGEST_SIDE
+        return None
+
+    def resolve(self, image_size, preview=None, source=None):
+        """根据图像尺寸计算整数裁剪框 (x1, y1, x2, y2)
+
+        suggest和trim需要preview：未旋转的原图或任意尺寸的预览；
+        trim给出source（完整分辨率图像或区域源）时在原图上精确定位四条边
+        """
+        img_width, img_height = rotated_size(image_size, self.rotation)
+
+        if self.box is not None:
+            x1, y1, x2, y2 = self.box
+        elif self.relative is not None:
+            fx1, fy1, fx2, fy2 = self.relative
+            x1, y1 = fx1 * img_width, fy1 * img_height
+            x2, y2 = fx2 * img_width, fy2 * img_height
+        elif self.ratio is not None:
+            # 居中的最大区域：与图形界面切换比例时的计算相同
+            target_ratio = self.ratio[0] / self.ratio[1]
+            full = (0, 0, img_width, img_height)
+            x1, y1, x2, y2 = fit_ratio([full], (img_width, img_height), target_ratio)[0]
+        elif self.suggest is not None:
+            if preview is None:
+                raise ValueError("内容感知裁剪需要图像")
+            preview = working_image(preview)
+            if self.rotation % 360:
+                preview = rotate_image(preview, self.rotation)
+            x1, y1, x2, y2 = best_crop(preview, self.suggest, (img_width, img_height))
+        elif self.trim:
+            if preview is None:
+                raise ValueError("自动去边需要图像")
+            box = trim_box(preview, source, (img_width, img_height), self.tolerance)
+            x1, y1, x2, y2 = box if box is not None else (0, 0, img_width, img_height)
+        elif self.size is not None:
+            # 居中的固定尺寸，超出图像时平移回图像内，仍然放不下则截断
+            width = min(self.size[0], img_width)
+            height = min(self.size[1], img_height)
+            x1 = (img_width - width) / 2
+            y1 = (img_height - height) / 2
+            x2, y2 = x1 + width, y1 + height
+        else:
+            x1, y1, x2, y2 = 0, 0, img_width, img_height
+
+        x1 = max(0, min(int(round(x1)), img_width))
+        y1 = max(0, min(int(round(y1)), img_height))
+        x2 = max(0, min(int(round(x2)), img_width))
+        y2 = max(0, min(int(round(y2)), img_height))
+        if x2 <= x1 or y2 <= y1:
+            raise ValueError("无效的裁剪区域")
+        return x1, y1, x2, y2
+
+
+def collect_inputs(patterns, recursive=False):
+    """展开输入：目录取其中所有支持的图片，其他参数按通配符匹配"""
+    paths = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            if recursive:
+                for root, _, files in os.walk(pattern):
+                    paths.extend(os.path.join(root, name) for name in files)
+            else:
+                paths.extend(os.path.join(pattern, name) for name in os.listdir(pattern))
+        else:
+            paths.extend(glob.glob(pattern, recursive=recursive))
+
+    seen = set()
+    result = []
+    for path in sorted(paths):
+        if path.lower().endswith(SUPPORTED_EXTENSIONS) and os.path.isfile(path) and path not in seen:
+            seen.add(path)
+            result.append(path)
+    return result
+
+
+def output_paths(inputs, output_dir, output_format, prefix, unique_stems=False):
+    """按 cropped_image_<时间戳>_<原文件名> 生成输出路径，重名时追加序号
+
+    unique_stems为True（多尺寸输出）时按不含扩展名的主文件名去重：
+    各尺寸的文件和清单JSON都以主文件名命名，x.jpg和x.png不能共用一个
+    """
+    used = set()
+    result = []
+    for path in inputs:
+        stem = os.path.splitext(os.path.basename(path))[0]
+        fmt = output_format or EXTENSION_FORMATS.get(
+            os.path.splitext(path)[1].lower().lstrip('.'), 'PNG')
+        ext = FORMAT_EXTENSIONS[fmt]
+
+        name = candidate = f"{prefix}_{stem}"
+        n = 1
+        while (candidate if unique_stems else candidate + ext) in used:
+            candidate = f"{name}_{n}"
+            n += 1
+        used.add(candidate if unique_stems else candidate + ext)
+        result.append((os.path.join(output_dir, candidate + ext), fmt))
+    return result
+
+
+def process_one(task):
+    """在工作进程中处理一张图片，返回 (输入路径, 输入字节数, 输出字节数, 错误信息)
+
+    指定widths时按多个宽度输出 <输出主文件名>_<宽度>w.ext 和清单JSON，
+    各尺寸在本进程中依次编码（并行度已经由进程池提供）。
+    不旋转时PNG和BMP按条带流式裁剪，不解码整张图像；
+    未压缩的格式内存映射后只读取裁剪框覆盖的区域，TIFF只解码裁剪框覆盖的块。
+    按内容裁剪（suggest、trim）时先在预览上计算裁剪框，JPEG的预览在DCT阶段缩小解码。
+    """
+    path, output_path, output_format, spec, params, widths = task
+    try:
+        input_bytes = os.path.getsize(path)
+        side = spec.preview_side
+        streamable = not widths and side is None and spec.rotation % 360 == 0
+        source = open_stream(path) if streamable else None
+        if source is not None:
+            stream_crop(source, spec.resolve(source.size), output_path, output_format, params)
+            return path, input_bytes, os.path.getsize(output_path), None
+        region = open_mapped(path) or open_tiff_region(path)
+        if region is not None:
+            preview = region.preview((side, side)) if side else None
+            box = spec.resolve(region.size, preview, region)
+            cropped = crop_rotated(region, spec.rotation, box)
+        else:
+            with Image.open(path) as image:
+                preview = image
+                if side and image.format == 'JPEG':
+                    # JPEG在DCT阶段缩小解码一份预览，比缩小完整图像快得多
+                    preview = open_preview(path, (side, side))[0]
+                elif side:
+                    # 其他格式只缩小一次，按内容计算裁剪框时都在这份预览上进行
+                    preview = trim_preview(image, side)
+                box = spec.resolve(image.size, preview, image)
+                cropped = crop_rotated(image, spec.rotation, box)
+        if widths:
+            directory, name = os.path.split(output_path)
+            manifest = export_responsive(cropped, widths, directory, os.path.splitext(name)[0],
+                                         output_format, params, workers=1, source=path)
+            return path, input_bytes, sum(entry["bytes"] for entry in manifest["files"]), None
+        save_image(cropped, output_path, output_format, **params)
+        return path, input_bytes, os.path.getsize(output_path), None
+    except Exception as e:
+        return path, 0, 0, str(e)
+
+
+def run_batch(inputs, spec, output_dir, output_format=None, workers=None,
+              params=None, prefix=None, widths=None):
+    """并行处理所有输入，返回统计信息字典"""
+    os.makedirs(output_dir, exist_ok=True)
+    prefix = prefix or default_output_name()
+    params = params or {}
+    workers = workers or os.cpu_count() or 1
+
+    tasks = [
+        (path, output_path, fmt, spec, params, widths)
+        for path, (output_path, fmt) in zip(
+            inputs, output_paths(inputs, output_dir, output_format, prefix, bool(widths)))
+    ]
+
+    stats = {"images": 0, "failed": 0, "input_bytes": 0, "output_bytes": 0}
+    start = time.perf_counter()
+
+    # 图片很多时按块分发，减少进程间通信
+    chunksize = max(1, len(tasks) // (workers * 8))
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for path, input_bytes, output_bytes, error in executor.map(
+                process_one, tasks, chunksize=chunksize):
+            if error:
+                stats["failed"] += 1
+                print(f"处理失败 {path}: {error}", file=sys.stderr)
+                continue
+            stats["images"] += 1
+            stats["input_bytes"] += input_bytes
+            stats["output_bytes"] += output_bytes
+
+    stats["seconds"] = time.perf_counter() - start
+    return stats
+
+
+def report(stats, workers):
+    """打印吞吐量"""
+    seconds = max(stats["seconds"], 1e-9)
+    mb = stats["input_bytes"] / (1024 * 1024)
+    print(f"完成 {stats['images']} 张，失败 {stats['failed']} 张，"
+          f"用时 {stats['seconds']:.2f} s（{workers} 个进程）")
+    print(f"吞吐量: {stats['images'] / seconds:.1f} 张/s, "
+          f"{mb / seconds:.1f} MB/s（输入 {mb:.1f} MB）")
+
+
+def parse_numbers(text, count, cast=float):
+    """解析逗号分隔的数字"""
+    values = [cast(v) for v in text.split(',')]
+    if len(values) != count:
+        raise ValueError(f"需要 {count} 个数字: {text}")
+    return tuple(values)
+
+
+def add_arguments(parser):
+    """注册 batch 子命令的参数"""
+    parser.add_argument("inputs", nargs="+", help="输入目录或通配符（如 'scans/*.jpg'）")
+    parser.add_argument("-o", "--output", default=os.path.expanduser("~/Pictures/cropped"),
+                        help="输出目录")
+
+    crop = parser.add_mutually_exclusive_group()
+    crop.add_argument("--box", help="绝对像素裁剪框 x1,y1,x2,y2")
+    crop.add_argument("--relative", help="相对裁剪框 x1,y1,x2,y2（0~1）")
+    crop.add_argument("--ratio", help="固定比例，如 16:9、1:1，取居中的最大区域")
+    crop.add_argument("--size", help="固定尺寸，如 1920x1080，居中裁剪")
+    crop.add_argument("--suggest", help="固定比例，如 16:9，按内容选择裁剪位置和大小")
+    crop.add_argument("--trim", action="store_true", help="自动去掉纯色边框")
+
+    parser.add_argument("--rotate", type=float, default=0.0, help="旋转角度（逆时针，度）")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help=f"自动去边的颜色容差，默认{DEFAULT_TOLERANCE}")
+    parser.add_argument("--format", choices=sorted(set(EXTENSION_FORMATS)),
+                        help="输出格式，默认与输入相同")
+    parser.add_argument("--quality", type=int, help="JPEG质量（1-95）")
+    parser.add_argument("--widths",
+                        help="多尺寸输出的宽度列表，如 2560,1920,1280,640,320（同时写入清单JSON）")
+    parser.add_argument("-j", "--workers", type=int, default=os.cpu_count(),
+                        help="并行进程数，默认为CPU核数")
+    parser.add_argument("-r", "--recursive", action="store_true", help="递归处理子目录")
+    parser.set_defaults(func=main)
+
+
+def spec_from_args(args):
+    """由命令行参数构造裁剪方案"""
+    return CropSpec(
+        box=parse_numbers(args.box, 4, int) if args.box else None,
+        relative=parse_numbers(args.relative, 4) if args.relative else None,
+        ratio=parse_ratio(args.ratio) if args.ratio else None,
+        size=parse_size(args.size) if args.size else None,
+        rotation=args.rotate,
+        suggest=parse_ratio(args.suggest) if args.suggest else None,
+        trim=args.trim,
+        tolerance=args.tolerance
+    )
+
+
+def main(args):
+    try:
+        spec = spec_from_args(args)
+        widths = parse_widths(args.widths) if args.widths else None
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 2
+
+    inputs = collect_inputs(args.inputs, args.recursive)
+    if not inputs:
+        print("没有找到可处理的图片", file=sys.stderr)
+        return 1
+
+    output_format = EXTENSION_FORMATS[args.format] if args.format else None
+    params = {"quality": args.quality} if args.quality else {}
+
+    workers = max(1, args.workers or 1)
+    stats = run_batch(inputs, spec, args.output, output_format, workers, params,
+                      widths=widths)
+    report(stats, workers)
+    return 1 if stats["failed"] else 0
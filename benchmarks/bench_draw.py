@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+on_draw 每帧耗时基准测试
+对比旧的“每帧转换”路径与缓存cairo表面后的路径
+用法: python3 benchmarks/bench_draw.py --megapixels 40 --frames 20
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import cairo
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from render import image_to_surface
+
+CANVAS_WIDTH = 1000
+CANVAS_HEIGHT = 700
+
+
+def make_image(megapixels):
+    """生成指定像素数的随机RGB图像（宽高比3:2）"""
+    height = int((megapixels * 1e6 / 1.5) ** 0.5)
+    width = int(height * 1.5)
+    rng = np.random.default_rng(0)
+    data = rng.integers(0, 256, (height, width, 3), dtype=np.uint8)
+    return Image.fromarray(data, 'RGB')
+
+
+def legacy_surface(image):
+    """旧版on_draw中的转换流程（每帧执行）"""
+    img_width, img_height = image.size
+    rgba_image = image.convert('RGBA') if image.mode != 'RGBA' else image
+    img_data = rgba_image.tobytes()
+    np_data = np.frombuffer(img_data, dtype=np.uint8)
+    np_data = np_data.reshape((img_height, img_width, 4))
+    bgra_data = np.zeros((img_height, img_width, 4), dtype=np.uint8)
+    bgra_data[:, :, 0] = np_data[:, :, 2]
+    bgra_data[:, :, 1] = np_data[:, :, 1]
+    bgra_data[:, :, 2] = np_data[:, :, 0]
+    bgra_data[:, :, 3] = np_data[:, :, 3]
+    img_data = bgra_data.tobytes()
+    stride = cairo.ImageSurface.format_stride_for_width(
+        cairo.FORMAT_ARGB32, img_width)
+    return cairo.ImageSurface.create_for_data(
+        bytearray(img_data), cairo.FORMAT_ARGB32,
+        img_width, img_height, stride)
+
+
+def paint(cr, surface, scale):
+    """按on_draw的方式缩放并绘制表面"""
+    cr.set_source_rgb(0.9, 0.9, 0.9)
+    cr.paint()
+    cr.save()
+    cr.scale(scale, scale)
+    cr.set_source_surface(surface, 0, 0)
+    cr.paint()
+    cr.restore()
+
+
+def time_frames(frame, frames):
+    """执行frames次并返回每帧耗时（毫秒）"""
+    samples = []
+    for _ in range(frames):
+        start = time.perf_counter()
+        frame()
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def report(name, samples):
+    samples = sorted(samples)
+    print(f"{name:<10} 平均 {sum(samples) / len(samples):9.2f} ms  "
+          f"中位 {samples[len(samples) // 2]:9.2f} ms  "
+          f"最大 {samples[-1]:9.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="on_draw 每帧耗时基准测试")
+    parser.add_argument("--megapixels", type=float, default=40)
+    parser.add_argument("--frames", type=int, default=20)
+    args = parser.parse_args()
+
+    image = make_image(args.megapixels)
+    width, height = image.size
+    scale = min(CANVAS_WIDTH / width, CANVAS_HEIGHT / height, 1.0)
+
+    target = cairo.ImageSurface(cairo.FORMAT_ARGB32, CANVAS_WIDTH, CANVAS_HEIGHT)
+    cr = cairo.Context(target)
+
+    print(f"图像尺寸: {width} × {height} px, 画布: {CANVAS_WIDTH} × {CANVAS_HEIGHT}")
+
+    legacy = time_frames(
+        lambda: paint(cr, legacy_surface(image), scale), args.frames)
+    report("转换每帧", legacy)
+
+    start = time.perf_counter()
+    cached_surface = image_to_surface(image)
+    build_ms = (time.perf_counter() - start) * 1000
+    cached = time_frames(
+        lambda: paint(cr, cached_surface, scale), args.frames)
+    report("缓存表面", cached)
+    print(f"缓存构建一次耗时: {build_ms:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
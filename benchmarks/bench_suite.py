@@ -0,0 +1,361 @@
+#!/usr/bin/env python3
+"""
+性能基准测试套件
+生成合成图像（JPEG/PNG/BMP/GIF，RGB/RGBA/P/L），无界面地测量加载、绘制、
+拖动、旋转和保存的耗时，输出p50/p95/max和峰值内存的JSON，并与基线比较。
+
+每个测试用例在独立的子进程中运行，峰值RSS互不影响。
+用法:
+    python3 benchmarks/bench_suite.py --megapixels 1,12 -o results.json
+    python3 benchmarks/bench_suite.py --update-baseline      # 记录基线
+    python3 benchmarks/bench_suite.py                        # 与基线比较，退化时返回1
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import shutil
+import sys
+import tempfile
+import time
+
+import cairo
+import numpy as np
+import PIL
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from crop_geometry import ANCHOR_BOTTOM_RIGHT, constrain_aspect
+from export import FORMAT_EXTENSIONS, save_image
+from loader import open_full, open_preview
+from render import DAMAGE_MARGIN, TiledRenderer, draw_crop_frame, draw_crop_shade
+from transform import crop_rotated, rotate_image, rotated_size
+
+CANVAS_WIDTH = 1000
+CANVAS_HEIGHT = 700
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+# 各格式能直接保存的模式
+FORMAT_MODES = {
+    "JPEG": ("RGB", "L"),
+    "PNG": ("RGB", "RGBA", "P", "L"),
+    "BMP": ("RGB", "P", "L"),
+    "GIF": ("P", "L"),
+}
+
+# 模拟拖动的事件数和旋转滑块扫过的角度
+DRAG_EVENTS = 500
+ROTATE_SWEEP = range(0, 46, 3)
+
+
+def make_image(megapixels, mode):
+    """生成可重复的合成图像（平滑渐变加噪声，宽高比3:2）"""
+    height = max(1, int((megapixels * 1e6 / 1.5) ** 0.5))
+    width = max(1, int(height * 1.5))
+    rng = np.random.default_rng(0)
+
+    y = np.linspace(0, 255, height, dtype=np.float32)[:, None]
+    x = np.linspace(0, 255, width, dtype=np.float32)[None, :]
+    noise = rng.integers(0, 32, (height, width), dtype=np.uint8)
+    channels = [
+        (x * 0.7 + y * 0.3).astype(np.uint8) + noise,
+        (255 - x * 0.5 - y * 0.2).astype(np.uint8) + noise // 2,
+        ((x + y) * 0.5).astype(np.uint8),
+    ]
+    image = Image.fromarray(np.dstack(channels), "RGB")
+
+    if mode == "RGBA":
+        alpha = Image.fromarray(np.broadcast_to(x.astype(np.uint8), (height, width)).copy(), "L")
+        image.putalpha(alpha)
+    elif mode == "P":
+        image = image.quantize(256)
+    elif mode == "L":
+        image = image.convert("L")
+    return image
+
+
+def percentiles(samples):
+    """毫秒样本的p50/p95/max"""
+    values = np.asarray(samples, dtype=np.float64)
+    return {
+        "p50": round(float(np.percentile(values, 50)), 3),
+        "p95": round(float(np.percentile(values, 95)), 3),
+        "max": round(float(values.max()), 3),
+        "n": len(samples),
+    }
+
+
+def timed(func, *args, **kwargs):
+    """执行一次并返回 (结果, 耗时毫秒)"""
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, (time.perf_counter() - start) * 1000
+
+
+def fit_view(image_size):
+    """与zoom_to_fit相同的缩放比例和偏移"""
+    width, height = image_size
+    scale = min(CANVAS_WIDTH / width, CANVAS_HEIGHT / height, 1.0)
+    return scale, ((CANVAS_WIDTH - width * scale) / 2, (CANVAS_HEIGHT - height * scale) / 2)
+
+
+def draw_frame(cr, renderer, scale, offset, rect, clip=None, angle=0, image_size=None):
+    """按on_draw的顺序绘制一帧：背景、瓦片、覆盖层、边框和控制点"""
+    cr.save()
+    if clip is not None:
+        cr.rectangle(clip[0], clip[1], clip[2] - clip[0], clip[3] - clip[1])
+        cr.clip()
+    cr.set_source_rgb(0.9, 0.9, 0.9)
+    cr.paint()
+    renderer.draw(cr, scale, offset[0], offset[1], angle=angle, image_size=image_size)
+
+    x1, y1, x2, y2 = (v * scale + o for v, o in zip(rect, offset * 2))
+    draw_crop_shade(cr, cr.clip_extents(), x1, y1, x2, y2)
+    draw_crop_frame(cr, x1, y1, x2, y2)
+    cr.restore()
+    cr.get_target().flush()
+
+
+def crop_bounds(rect, scale, offset):
+    """裁剪框在画布中的包围盒（与get_crop_widget_bounds一致）"""
+    x1, y1, x2, y2 = rect
+    return (min(x1, x2) * scale + offset[0] - DAMAGE_MARGIN,
+            min(y1, y2) * scale + offset[1] - DAMAGE_MARGIN,
+            max(x1, x2) * scale + offset[0] + DAMAGE_MARGIN,
+            max(y1, y2) * scale + offset[1] + DAMAGE_MARGIN)
+
+
+def bench_load(path, repeat):
+    """load_image：按画布尺寸预览解码、完整解码、建立金字塔"""
+    results = {"load_preview": [], "load_full": [], "build_pyramid": []}
+    image = None
+    for _ in range(repeat):
+        _, ms = timed(open_preview, path, (CANVAS_WIDTH, CANVAS_HEIGHT))
+        results["load_preview"].append(ms)
+        image, ms = timed(open_full, path)
+        results["load_full"].append(ms)
+        _, ms = timed(TiledRenderer().set_image, image)
+        results["build_pyramid"].append(ms)
+    return image, results
+
+
+def bench_draw(image, frames):
+    """on_draw：适应窗口时的整帧绘制（首帧为冷缓存）和放大到1:1时的绘制"""
+    target = cairo.ImageSurface(cairo.FORMAT_ARGB32, CANVAS_WIDTH, CANVAS_HEIGHT)
+    cr = cairo.Context(target)
+    width, height = image.size
+    rect = (width * 0.1, height * 0.1, width * 0.9, height * 0.9)
+
+    renderer = TiledRenderer()
+    renderer.set_image(image)
+    scale, offset = fit_view(image.size)
+    _, cold = timed(draw_frame, cr, renderer, scale, offset, rect)
+    fit = [timed(draw_frame, cr, renderer, scale, offset, rect)[1] for _ in range(frames)]
+
+    # 1:1显示图像中心
+    offset = (CANVAS_WIDTH / 2 - width / 2, CANVAS_HEIGHT / 2 - height / 2)
+    actual = [timed(draw_frame, cr, renderer, 1.0, offset, rect)[1] for _ in range(frames)]
+    return renderer, {"draw_cold": [cold], "draw_fit": fit, "draw_actual": actual}
+
+
+def bench_drag(image, renderer):
+    """on_motion_notify：固定比例拖动右下角，每个事件约束裁剪框并局部重绘"""
+    target = cairo.ImageSurface(cairo.FORMAT_ARGB32, CANVAS_WIDTH, CANVAS_HEIGHT)
+    cr = cairo.Context(target)
+    width, height = image.size
+    scale, offset = fit_view(image.size)
+
+    rect = [width * 0.1, height * 0.1, width * 0.3, height * 0.3]
+    # 指针沿对角线来回移动，并超出图像边界
+    path = np.linspace(0.2, 1.1, DRAG_EVENTS // 2)
+    path = np.concatenate([path, path[::-1]])
+
+    samples = []
+    for t in path:
+        start = time.perf_counter()
+        old_bounds = crop_bounds(rect, scale, offset)
+        x = min(max(t * width, 0), width)
+        y = min(max(t * height * 0.8, 0), height)
+        rect = [float(v) for v in constrain_aspect(
+            [[rect[0], rect[1], x, y]], image.size, 16 / 9, ANCHOR_BOTTOM_RIGHT)[0]]
+        new_bounds = crop_bounds(rect, scale, offset)
+        damage = (min(old_bounds[0], new_bounds[0]), min(old_bounds[1], new_bounds[1]),
+                  max(old_bounds[2], new_bounds[2]) + 1, max(old_bounds[3], new_bounds[3]) + 1)
+        draw_frame(cr, renderer, scale, offset, rect, clip=damage)
+        samples.append((time.perf_counter() - start) * 1000)
+    return {"drag_event": samples}
+
+
+def bench_rotate(image, renderer):
+    """on_rotate_changed：滑块扫过时的cairo预览帧，以及停止后的一次双三次旋转"""
+    target = cairo.ImageSurface(cairo.FORMAT_ARGB32, CANVAS_WIDTH, CANVAS_HEIGHT)
+    cr = cairo.Context(target)
+    preview = []
+    for angle in ROTATE_SWEEP:
+        size = rotated_size(image.size, angle)
+        scale, offset = fit_view(size)
+        rect = (size[0] * 0.1, size[1] * 0.1, size[0] * 0.9, size[1] * 0.9)
+        _, ms = timed(draw_frame, cr, renderer, scale, offset, rect,
+                      angle=angle, image_size=image.size)
+        preview.append(ms)
+
+    _, settle = timed(rotate_image, image, ROTATE_SWEEP[-1])
+    return {"rotate_preview": preview, "rotate_settle": [settle]}
+
+
+def bench_save(image, fmt, workdir, repeat):
+    """on_save_image：裁剪（含旋转）并编码"""
+    width, height = image.size
+    box = (int(width * 0.1), int(height * 0.1), int(width * 0.9), int(height * 0.9))
+    output = os.path.join(workdir, "output" + FORMAT_EXTENSIONS[fmt])
+    results = {"save": [], "save_rotated": []}
+    for _ in range(repeat):
+        _, ms = timed(lambda: save_image(crop_rotated(image, 0, box), output, fmt))
+        results["save"].append(ms)
+        _, ms = timed(lambda: save_image(crop_rotated(image, 7.5, box), output, fmt))
+        results["save_rotated"].append(ms)
+    return results
+
+
+def run_case(case):
+    """在子进程中运行一个用例，返回 (用例名, 结果)"""
+    fmt, mode, megapixels, workdir, repeat, frames = case
+    name = f"{fmt}/{mode}/{megapixels:g}MP"
+
+    path = os.path.join(workdir, f"{fmt}_{mode}_{megapixels:g}{FORMAT_EXTENSIONS[fmt]}")
+    if not os.path.exists(path):
+        make_image(megapixels, mode).save(path, fmt)
+
+    samples = {}
+    image, results = bench_load(path, repeat)
+    samples.update(results)
+    renderer, results = bench_draw(image, frames)
+    samples.update(results)
+    samples.update(bench_drag(image, renderer))
+    samples.update(bench_rotate(image, renderer))
+    samples.update(bench_save(image, fmt, workdir, repeat))
+
+    result = {op: percentiles(values) for op, values in samples.items()}
+    # Linux以KB为单位，macOS以字节为单位
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    peak = peak if sys.platform == "darwin" else peak * 1024
+    result["peak_rss_mb"] = round(peak / (1024 * 1024), 1)
+    result["image_size"] = list(image.size)
+    return name, result
+
+
+def compare(results, baseline, tolerance, min_ms):
+    """与基线比较p50，返回退化列表 [(用例, 操作, 基线, 当前)]"""
+    regressions = []
+    for name, ops in results["cases"].items():
+        base_ops = baseline.get("cases", {}).get(name)
+        if base_ops is None:
+            continue
+        for op, stats in ops.items():
+            if not isinstance(stats, dict) or op not in base_ops:
+                continue
+            old, new = base_ops[op]["p50"], stats["p50"]
+            if new > old * (1 + tolerance) and new - old > min_ms:
+                regressions.append((name, op, old, new))
+        if "peak_rss_mb" in base_ops:
+            old, new = base_ops["peak_rss_mb"], ops["peak_rss_mb"]
+            if new > old * (1 + tolerance):
+                regressions.append((name, "peak_rss_mb", old, new))
+    return regressions
+
+
+def print_summary(results):
+    for name, ops in results["cases"].items():
+        print(f"{name}  {ops['image_size'][0]} × {ops['image_size'][1]} px, "
+              f"峰值RSS {ops['peak_rss_mb']} MB")
+        for op, stats in ops.items():
+            if isinstance(stats, dict):
+                print(f"    {op:<16} p50 {stats['p50']:9.2f} ms  "
+                      f"p95 {stats['p95']:9.2f} ms  最大 {stats['max']:9.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ImageCropper 性能基准测试套件")
+    parser.add_argument("--megapixels", default="1,12",
+                        help="逗号分隔的百万像素数（1~100）")
+    parser.add_argument("--formats", default=",".join(FORMAT_MODES),
+                        help="逗号分隔的格式")
+    parser.add_argument("--modes", default="RGB,RGBA,P,L", help="逗号分隔的图像模式")
+    parser.add_argument("--repeat", type=int, default=3, help="加载和保存的重复次数")
+    parser.add_argument("--frames", type=int, default=20, help="绘制的帧数")
+    parser.add_argument("-o", "--output", help="结果JSON文件，默认输出到标准输出")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="基线JSON文件")
+    parser.add_argument("--update-baseline", action="store_true", help="把结果写入基线文件")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="允许的相对退化（默认20%%）")
+    parser.add_argument("--min-ms", type=float, default=1.0,
+                        help="小于该绝对差值（毫秒）的变化不算退化")
+    parser.add_argument("--workdir", help="合成图像目录，默认使用临时目录并在结束后删除")
+    args = parser.parse_args()
+
+    formats = [f.strip().upper() for f in args.formats.split(",")]
+    modes = [m.strip().upper() for m in args.modes.split(",")]
+    sizes = [float(v) for v in args.megapixels.split(",")]
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="imagecropper-bench-")
+    os.makedirs(workdir, exist_ok=True)
+    cases = [(fmt, mode, mp, workdir, args.repeat, args.frames)
+             for mp in sizes for fmt in formats for mode in modes
+             if mode in FORMAT_MODES.get(fmt, ())]
+
+    results = {
+        "meta": {
+            "python": platform.python_version(),
+            "pillow": PIL.__version__,
+            "cairo": cairo.version,
+            "machine": platform.machine(),
+            "cpus": os.cpu_count(),
+        },
+        "cases": {},
+    }
+
+    # 每个用例一个新进程，峰值RSS只反映该用例
+    context = multiprocessing.get_context("spawn")
+    try:
+        with context.Pool(1, maxtasksperchild=1) as pool:
+            for name, result in pool.imap(run_case, cases):
+                results["cases"][name] = result
+                print(f"完成 {name}", file=sys.stderr)
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    text = json.dumps(results, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+        print_summary(results)
+    else:
+        print(text)
+
+    if args.update_baseline:
+        with open(args.baseline, "w") as f:
+            f.write(text + "\n")
+        print(f"基线已写入 {args.baseline}", file=sys.stderr)
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"没有基线文件 {args.baseline}，使用 --update-baseline 生成", file=sys.stderr)
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    regressions = compare(results, baseline, args.tolerance, args.min_ms)
+    for name, op, old, new in regressions:
+        print(f"退化 {name} {op}: {old} -> {new}", file=sys.stderr)
+    if not regressions:
+        print("与基线相比没有退化", file=sys.stderr)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
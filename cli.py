@@ -0,0 +1,29 @@
+#!/usr/bin/env python3
+"""
+命令行入口（不依赖GTK）
+用法: imagecropper batch <输入> [选项]
+      imagecropper rebuild <清单目录> [选项]
+"""
+
+import argparse
+import sys
+
+import batch
+import sidecar
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="imagecropper", description="ImageCropper 命令行工具")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    batch.add_arguments(subparsers.add_parser(
+        "batch", help="批量裁剪/旋转目录中的图片"))
+    sidecar.add_arguments(subparsers.add_parser(
+        "rebuild", help="按裁剪清单增量重新渲染导出结果"))
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,405 @@
+#!/usr/bin/env python3
+"""
+裁剪框几何计算（不依赖GTK）
+固定比例、预设尺寸和边界限制，一次调用处理N个裁剪框。
+图形界面对单个裁剪框调用同样的函数，批处理可以一次约束大量候选框。
+
+约定：
+    rects        形状 (N, 4) 的 [x1, y1, x2, y2]
+    image_sizes  形状 (N, 2) 或 (2,) 的 [宽, 高]
+    ratios       形状 (N,) 或标量，目标宽高比（宽 / 高）
+    anchors      形状 (N,) 或标量，固定角（见 ANCHOR_*）
+"""
+
+import numpy as np
+
+# 调整比例时保持不动的位置
+ANCHOR_TOP_LEFT = 0
+ANCHOR_TOP_RIGHT = 1
+ANCHOR_BOTTOM_LEFT = 2
+ANCHOR_BOTTOM_RIGHT = 3
+ANCHOR_CENTER = 4
+
+# 裁剪框的最小尺寸：小于MIN_VALID_SIZE时重新设为默认大小
+MIN_VALID_SIZE = 10
+MIN_RATIO_SIZE = 20  # 固定比例拖动时的默认边长
+DEFAULT_RATIO_SIZE = 100  # 切换比例时的默认边长
+
+
+def anchor_for_drag_mode(drag_mode):
+    """根据拖动模式确定固定角"""
+    if drag_mode is None:
+        # 如果没有拖动模式，默认固定左上角
+        return ANCHOR_TOP_LEFT
+    if 'tl' in drag_mode:
+        return ANCHOR_TOP_LEFT
+    if 'tr' in drag_mode:
+        return ANCHOR_TOP_RIGHT
+    if 'bl' in drag_mode:
+        return ANCHOR_BOTTOM_LEFT
+    if 'br' in drag_mode:
+        return ANCHOR_BOTTOM_RIGHT
+    if 'move' in drag_mode:
+        return ANCHOR_CENTER  # 移动时保持中心不变
+    return ANCHOR_TOP_LEFT
+
+
+def _prepare(rects, image_sizes, *columns):
+    """统一为float64数组并广播到N行，返回 (x1, y1, x2, y2, W, H, *columns)"""
+    rects = np.asarray(rects, dtype=np.float64).reshape(-1, 4)
+    n = len(rects)
+    sizes = np.broadcast_to(np.asarray(image_sizes, dtype=np.float64), (n, 2))
+    extra = [np.broadcast_to(np.asarray(c), (n,)) for c in columns]
+    x1, y1, x2, y2 = (rects[:, i].copy() for i in range(4))
+    return (x1, y1, x2, y2, sizes[:, 0], sizes[:, 1], *extra)
+
+
+def _sorted_corners(x1, y1, x2, y2):
+    """确保坐标顺序（左上到右下）"""
+    return np.minimum(x1, x2), np.minimum(y1, y2), np.maximum(x1, x2), np.maximum(y1, y2)
+
+
+def _shift_into(low, high, limit):
+    """整体平移区间，使low不小于0、high不超过limit（依次检查）"""
+    shift = np.where(low < 0, -low, 0.0)
+    low, high = low + shift, high + shift
+    shift = np.where(high > limit, high - limit, 0.0)
+    return low - shift, high - shift
+
+
+def _stack(x1, y1, x2, y2):
+    return np.stack([x1, y1, x2, y2], axis=1)
+
+
+def _restore_ratio(x1, y1, x2, y2, r, anchors):
+    """边界限制后比例可能被破坏：把多出的一边朝固定角缩短，只缩不放，不会越界"""
+    width = x2 - x1
+    height = y2 - y1
+    too_wide = width > height * r
+    new_width = np.where(too_wide, height * r, width)
+    new_height = np.where(too_wide, height, width / r)
+
+    left = (anchors == ANCHOR_TOP_LEFT) | (anchors == ANCHOR_BOTTOM_LEFT)
+    right = (anchors == ANCHOR_TOP_RIGHT) | (anchors == ANCHOR_BOTTOM_RIGHT)
+    top = (anchors == ANCHOR_TOP_LEFT) | (anchors == ANCHOR_TOP_RIGHT)
+    bottom = (anchors == ANCHOR_BOTTOM_LEFT) | (anchors == ANCHOR_BOTTOM_RIGHT)
+
+    cx = (x1 + x2) / 2
+    cy = (y1 + y2) / 2
+    nx1 = np.select([left, right], [x1, x2 - new_width], cx - new_width / 2)
+    ny1 = np.select([top, bottom], [y1, y2 - new_height], cy - new_height / 2)
+    return nx1, ny1, nx1 + new_width, ny1 + new_height
+
+
+def _anchor_top_left(x1, y1, x2, y2, W, H, r, wide, cw, ch):
+    # 固定左上角，调整右下角
+    y2 = np.where(wide, y1 + cw / r, y2)
+    x2 = np.where(wide, x2, x1 + ch * r)
+
+    # 边界检查：确保右下角不超出图像
+    over = x2 > W
+    x2 = np.where(over, W, x2)
+    y2 = np.where(over, y1 + (x2 - x1) / r, y2)
+    over = y2 > H
+    y2 = np.where(over, H, y2)
+    x2 = np.where(over, x1 + (y2 - y1) * r, x2)
+
+    # 如果左上角超出了边界，需要整体向右下移动，然后再次检查右下角
+    moved = (x1 < 0) | (y1 < 0)
+    shift = np.where(moved & (x1 < 0), -x1, 0.0)
+    x1, x2 = x1 + shift, x2 + shift
+    shift = np.where(moved & (y1 < 0), -y1, 0.0)
+    y1, y2 = y1 + shift, y2 + shift
+    over = moved & (x2 > W)
+    x2 = np.where(over, W, x2)
+    y2 = np.where(over, y1 + (x2 - x1) / r, y2)
+    over = moved & (y2 > H)
+    y2 = np.where(over, H, y2)
+    x2 = np.where(over, x1 + (y2 - y1) * r, x2)
+    return x1, y1, x2, y2
+
+
+def _anchor_top_right(x1, y1, x2, y2, W, H, r, wide, cw, ch):
+    # 固定右上角，调整左下角
+    y2 = np.where(wide, y1 + cw / r, y2)
+    x1 = np.where(wide, x1, x2 - ch * r)
+
+    over = x1 < 0
+    x1 = np.where(over, 0.0, x1)
+    y2 = np.where(over, y1 + (x2 - x1) / r, y2)
+    over = y2 > H
+    y2 = np.where(over, H, y2)
+    x1 = np.where(over, x2 - (y2 - y1) * r, x1)
+
+    # 检查右上角
+    moved = (x2 > W) | (y1 < 0)
+    shift = np.where(moved & (x2 > W), x2 - W, 0.0)
+    x1, x2 = x1 - shift, x2 - shift
+    shift = np.where(moved & (y1 < 0), -y1, 0.0)
+    y1, y2 = y1 + shift, y2 + shift
+    over = moved & (x1 < 0)
+    x1 = np.where(over, 0.0, x1)
+    y2 = np.where(over, y1 + (x2 - x1) / r, y2)
+    return x1, y1, x2, y2
+
+
+def _anchor_bottom_left(x1, y1, x2, y2, W, H, r, wide, cw, ch):
+    # 固定左下角，调整右上角
+    y1 = np.where(wide, y2 - cw / r, y1)
+    x2 = np.where(wide, x2, x1 + ch * r)
+
+    over = x2 > W
+    x2 = np.where(over, W, x2)
+    y1 = np.where(over, y2 - (x2 - x1) / r, y1)
+    over = y1 < 0
+    y1 = np.where(over, 0.0, y1)
+    x2 = np.where(over, x1 + (y2 - y1) * r, x2)
+
+    # 检查左下角
+    moved = (x1 < 0) | (y2 > H)
+    shift = np.where(moved & (x1 < 0), -x1, 0.0)
+    x1, x2 = x1 + shift, x2 + shift
+    shift = np.where(moved & (y2 > H), y2 - H, 0.0)
+    y1, y2 = y1 - shift, y2 - shift
+    over = moved & (x2 > W)
+    x2 = np.where(over, W, x2)
+    y1 = np.where(over, y2 - (x2 - x1) / r, y1)
+    return x1, y1, x2, y2
+
+
+def _anchor_bottom_right(x1, y1, x2, y2, W, H, r, wide, cw, ch):
+    # 固定右下角，调整左上角
+    y1 = np.where(wide, y2 - cw / r, y1)
+    x1 = np.where(wide, x1, x2 - ch * r)
+
+    over = x1 < 0
+    x1 = np.where(over, 0.0, x1)
+    y1 = np.where(over, y2 - (x2 - x1) / r, y1)
+    over = y1 < 0
+    y1 = np.where(over, 0.0, y1)
+    x1 = np.where(over, x2 - (y2 - y1) * r, x1)
+
+    # 检查右下角
+    moved = (x2 > W) | (y2 > H)
+    shift = np.where(moved & (x2 > W), x2 - W, 0.0)
+    x1, x2 = x1 - shift, x2 - shift
+    shift = np.where(moved & (y2 > H), y2 - H, 0.0)
+    y1, y2 = y1 - shift, y2 - shift
+    over = moved & (x1 < 0)
+    x1 = np.where(over, 0.0, x1)
+    y1 = np.where(over, y2 - (x2 - x1) / r, y1)
+    return x1, y1, x2, y2
+
+
+def _anchor_center(x1, y1, x2, y2, W, H, r, wide, cw, ch):
+    # 保持中心不变，调整四个边
+    cx = (x1 + x2) / 2
+    cy = (y1 + y2) / 2
+    half_h = cw / r / 2
+    half_w = ch * r / 2
+    y1 = np.where(wide, cy - half_h, y1)
+    y2 = np.where(wide, cy + half_h, y2)
+    x1 = np.where(wide, x1, cx - half_w)
+    x2 = np.where(wide, x2, cx + half_w)
+
+    x1, x2 = _shift_into(x1, x2, W)
+    y1, y2 = _shift_into(y1, y2, H)
+
+    # 如果移动后仍然超出，缩小到适合图像
+    out = (x1 < 0) | (x2 > W) | (y1 < 0) | (y2 > H)
+    cx1 = np.maximum(0, x1)
+    cy1 = np.maximum(0, y1)
+    cx2 = np.minimum(W, x2)
+    cy2 = np.minimum(H, y2)
+    actual_width = cx2 - cx1
+    actual_height = cy2 - cy1
+    with np.errstate(divide='ignore', invalid='ignore'):
+        too_wide = actual_width / actual_height > r
+    new_height = actual_width / r
+    new_width = actual_height * r
+
+    # 太宽：调整高度，如果还是太高则缩小宽度
+    tall = too_wide & (new_height > H)
+    fit_w = H * r
+    # 太高：调整宽度，如果还是太宽则缩小高度
+    wide2 = ~too_wide & (new_width > W)
+    fit_h = W / r
+
+    nx1 = np.select([tall, too_wide, wide2], [cx - fit_w / 2, cx1, 0.0], cx - new_width / 2)
+    nx2 = np.select([tall, too_wide, wide2], [cx + fit_w / 2, cx2, W], cx + new_width / 2)
+    ny1 = np.select([tall, too_wide, wide2], [0.0, cy - new_height / 2, cy - fit_h / 2], cy1)
+    ny2 = np.select([tall, too_wide, wide2], [H, cy + new_height / 2, cy + fit_h / 2], cy2)
+
+    return (np.where(out, nx1, x1), np.where(out, ny1, y1),
+            np.where(out, nx2, x2), np.where(out, ny2, y2))
+
+
+_ANCHOR_FUNCTIONS = (
+    _anchor_top_left,
+    _anchor_top_right,
+    _anchor_bottom_left,
+    _anchor_bottom_right,
+    _anchor_center,
+)
+
+
+def constrain_aspect(rects, image_sizes, ratios, anchors=ANCHOR_TOP_LEFT):
+    """应用纵横比限制：保持固定角不动，调整裁剪框到目标比例并限制在图像内
+
+    返回形状 (N, 4) 的新裁剪框。
+    """
+    x1, y1, x2, y2, W, H, r, anchors = _prepare(rects, image_sizes, ratios, anchors)
+    r = r.astype(np.float64)
+    x1, y1, x2, y2 = _sorted_corners(x1, y1, x2, y2)
+
+    # 当前尺寸
+    cw = np.maximum(x2 - x1, 1)
+    ch = np.maximum(y2 - y1, 1)
+    wide = cw / ch > r
+
+    # 每种固定角都向量化计算一遍，再按anchors逐行选择
+    results = [f(x1, y1, x2, y2, W, H, r, wide, cw, ch) for f in _ANCHOR_FUNCTIONS]
+    choices = [anchors == a for a in range(len(_ANCHOR_FUNCTIONS))]
+    x1, y1, x2, y2 = (np.select(choices, [res[i] for res in results], results[0][i])
+                      for i in range(4))
+
+    # 最终边界检查
+    x1 = np.maximum(0, np.minimum(x1, W - 1))
+    y1 = np.maximum(0, np.minimum(y1, H - 1))
+    x2 = np.maximum(1, np.minimum(x2, W))
+    y2 = np.maximum(1, np.minimum(y2, H))
+
+    # 确保有效尺寸：太小时按固定角放置默认大小的裁剪框
+    small = (x2 - x1 < MIN_VALID_SIZE) | (y2 - y1 < MIN_VALID_SIZE)
+    landscape = r >= 1
+    new_width = np.where(landscape, MIN_RATIO_SIZE, MIN_RATIO_SIZE * r)
+    new_height = np.where(landscape, MIN_RATIO_SIZE / r, MIN_RATIO_SIZE)
+
+    left = (anchors == ANCHOR_TOP_LEFT) | (anchors == ANCHOR_BOTTOM_LEFT)
+    right = (anchors == ANCHOR_TOP_RIGHT) | (anchors == ANCHOR_BOTTOM_RIGHT)
+    top = (anchors == ANCHOR_TOP_LEFT) | (anchors == ANCHOR_TOP_RIGHT)
+    bottom = (anchors == ANCHOR_BOTTOM_LEFT) | (anchors == ANCHOR_BOTTOM_RIGHT)
+    center = ~(left | right)
+
+    cx = np.clip((x1 + x2) / 2, 0, W)
+    cy = np.clip((y1 + y2) / 2, 0, H)
+    sx1 = np.select([right, center], [np.maximum(0, x2 - new_width),
+                                      np.maximum(0, cx - new_width / 2)], x1)
+    sy1 = np.select([bottom, center], [np.maximum(0, y2 - new_height),
+                                       np.maximum(0, cy - new_height / 2)], y1)
+    sx2 = np.where(right, x2, np.minimum(W, sx1 + new_width))
+    sy2 = np.where(bottom, y2, np.minimum(H, sy1 + new_height))
+    # 左/上固定时，右下角由左上角加默认尺寸得到
+    sx2 = np.where(left, np.minimum(W, x1 + new_width), sx2)
+    sy2 = np.where(top, np.minimum(H, y1 + new_height), sy2)
+
+    x1, y1, x2, y2 = (np.where(small, sx1, x1), np.where(small, sy1, y1),
+                      np.where(small, sx2, x2), np.where(small, sy2, y2))
+    return _stack(*_restore_ratio(x1, y1, x2, y2, r, anchors))
+
+
+def fit_ratio(rects, image_sizes, ratios):
+    """切换固定比例：以裁剪框中心为基准调整到目标比例，并限制在图像内
+
+    返回形状 (N, 4) 的新裁剪框。
+    """
+    x1, y1, x2, y2, W, H, r = _prepare(rects, image_sizes, ratios)
+    r = r.astype(np.float64)
+    x1, y1, x2, y2 = _sorted_corners(x1, y1, x2, y2)
+
+    # 计算当前中心点（用于保持位置）
+    cx = (x1 + x2) / 2
+    cy = (y1 + y2) / 2
+    cw = np.maximum(x2 - x1, 1)
+    ch = np.maximum(y2 - y1, 1)
+
+    # 当前太宽时调整高度，太高时调整宽度
+    wide = cw / ch > r
+    new_width = np.where(wide, cw, ch * r)
+    new_height = np.where(wide, cw / r, ch)
+
+    # 确保最小尺寸
+    small = new_width < MIN_VALID_SIZE
+    new_width = np.where(small, MIN_VALID_SIZE, new_width)
+    new_height = np.where(small, new_width / r, new_height)
+    small = new_height < MIN_VALID_SIZE
+    new_height = np.where(small, MIN_VALID_SIZE, new_height)
+    new_width = np.where(small, new_height * r, new_width)
+
+    # 从中心点计算新坐标，越界时先平移
+    nx1, nx2 = _shift_into(cx - new_width / 2, cx + new_width / 2, W)
+    ny1, ny2 = _shift_into(cy - new_height / 2, cy + new_height / 2, H)
+
+    # 仍然越界（裁剪框比图像大）时调整大小而不是位置
+    over = nx1 < 0
+    nx1 = np.where(over, 0.0, nx1)
+    half = (nx2 - nx1) / r / 2
+    ny1 = np.where(over, cy - half, ny1)
+    ny2 = np.where(over, cy + half, ny2)
+
+    over = nx2 > W
+    nx2 = np.where(over, W, nx2)
+    half = (nx2 - nx1) / r / 2
+    ny1 = np.where(over, cy - half, ny1)
+    ny2 = np.where(over, cy + half, ny2)
+
+    over = ny1 < 0
+    ny1 = np.where(over, 0.0, ny1)
+    half = (ny2 - ny1) * r / 2
+    nx1 = np.where(over, cx - half, nx1)
+    nx2 = np.where(over, cx + half, nx2)
+
+    over = ny2 > H
+    ny2 = np.where(over, H, ny2)
+    half = (ny2 - ny1) * r / 2
+    nx1 = np.where(over, cx - half, nx1)
+    nx2 = np.where(over, cx + half, nx2)
+
+    # 最终边界检查（防止缩小后再次越界）
+    nx1 = np.maximum(0, np.minimum(nx1, W - 1))
+    ny1 = np.maximum(0, np.minimum(ny1, H - 1))
+    nx2 = np.maximum(1, np.minimum(nx2, W))
+    ny2 = np.maximum(1, np.minimum(ny2, H))
+
+    # 太小时创建一个默认大小的裁剪框
+    small = (nx2 - nx1 < MIN_VALID_SIZE) | (ny2 - ny1 < MIN_VALID_SIZE)
+    default_size = np.minimum(np.minimum(DEFAULT_RATIO_SIZE, W), H)
+    landscape = r > 1
+    dw = np.where(landscape, default_size, default_size * r)
+    dh = np.where(landscape, default_size / r, default_size)
+    # 中心点限制在图像内，避免远离图像的裁剪框生成反向的默认框
+    dx1 = np.maximum(0, np.minimum(cx, W) - dw / 2)
+    dy1 = np.maximum(0, np.minimum(cy, H) - dh / 2)
+
+    nx1, ny1, nx2, ny2 = (np.where(small, dx1, nx1), np.where(small, dy1, ny1),
+                          np.where(small, np.minimum(W, dx1 + dw), nx2),
+                          np.where(small, np.minimum(H, dy1 + dh), ny2))
+    return _stack(*_restore_ratio(nx1, ny1, nx2, ny2, r, ANCHOR_CENTER))
+
+
+def fit_size(rects, image_sizes, sizes):
+    """预设尺寸：以裁剪框中心为基准设为固定尺寸，越界时平移回图像内
+
+    sizes形状为 (N, 2) 或 (2,)。返回形状 (N, 4) 的新裁剪框。
+    """
+    x1, y1, x2, y2, W, H = _prepare(rects, image_sizes)
+    sizes = np.broadcast_to(np.asarray(sizes, dtype=np.float64), (len(x1), 2))
+
+    center_x = (x1 + x2) / 2
+    center_y = (y1 + y2) / 2
+    nx1 = center_x - sizes[:, 0] / 2
+    ny1 = center_y - sizes[:, 1] / 2
+    nx2 = center_x + sizes[:, 0] / 2
+    ny2 = center_y + sizes[:, 1] / 2
+
+    # 左上越界时右下角跟着移动，右下越界时左上角跟着移动
+    shift = np.where(nx1 < 0, -nx1, 0.0)
+    nx1, nx2 = nx1 + shift, nx2 + shift
+    shift = np.where(ny1 < 0, -ny1, 0.0)
+    ny1, ny2 = ny1 + shift, ny2 + shift
+    shift = np.where(nx2 > W, nx2 - W, 0.0)
+    nx1, nx2 = nx1 - shift, nx2 - shift
+    shift = np.where(ny2 > H, ny2 - H, 0.0)
+    ny1, ny2 = ny1 - shift, ny2 - shift
+
+    return _stack(nx1, ny1, nx2, ny2)
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+导出辅助（不依赖GTK）
+输出格式判断、透明度处理和默认文件名，图形界面和批处理共用
+"""
+
+import os
+from datetime import datetime
+
+from PIL import Image
+
+# 扩展名 -> PIL格式
+EXTENSION_FORMATS = {
+    'jpg': 'JPEG',
+    'jpeg': 'JPEG',
+    'png': 'PNG',
+    'bmp': 'BMP',
+    'gif': 'GIF',
+    'tif': 'TIFF',
+    'tiff': 'TIFF',
+}
+
+# PIL格式 -> 默认扩展名
+FORMAT_EXTENSIONS = {
+    'JPEG': '.jpg',
+    'PNG': '.png',
+    'BMP': '.bmp',
+    'GIF': '.gif',
+    'TIFF': '.tif',
+}
+
+
+def format_from_filename(filename):
+    """从扩展名推断输出格式，不支持的扩展名返回None"""
+    ext = os.path.splitext(filename)[1].lower().lstrip('.')
+    return EXTENSION_FORMATS.get(ext)
+
+
+def default_output_name(now=None):
+    """默认输出文件名（不含扩展名）：cropped_image_<时间戳>"""
+    now = now or datetime.now()
+    return f"cropped_image_{now.strftime('%Y%m%d_%H%M%S')}"
+
+
+def prepare_for_format(image, output_format):
+    """根据输出格式转换图像模式
+
+    JPG格式不支持透明度，透明区域用白色背景填充，其他非RGB模式转换为RGB
+    """
+    if output_format not in ("JPG", "JPEG"):
+        return image
+
+    if image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info):
+        # 创建白色背景
+        background = Image.new('RGB', image.size, (255, 255, 255))
+
+        if image.mode == 'RGBA':
+            # 分离Alpha通道，将RGB通道合并到背景上
+            r, g, b, a = image.split()
+            background.paste(image, mask=a)
+        else:
+            # 灰度+透明度 / 调色板模式
+            image = image.convert('RGBA')
+            r, g, b, a = image.split()
+            background.paste(Image.merge('RGB', (r, g, b)), mask=a)
+
+        return background
+
+    if image.mode != 'RGB':
+        # 其他非RGB模式转换为RGB
+        return image.convert('RGB')
+    return image
+
+
+def save_image(image, filename, output_format, **params):
+    """转换模式后保存，params原样传给 Image.save（如quality）"""
+    prepare_for_format(image, output_format).save(filename, format=output_format, **params)
@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+"""
+后台导出队列（不依赖GTK）
+裁剪和编码在线程池中执行，界面可以继续裁剪或打开下一张图片。
+每个任务的状态变化通过dispatch（GUI中为GLib.idle_add）送回主线程。
+"""
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from itertools import count
+
+from export import save_image
+from responsive import export_responsive
+from sidecar import write_sidecar
+from transform import crop_rotated
+
+# 同时进行的导出数，Pillow裁剪和编码时会释放GIL
+EXPORT_WORKERS = max(2, min(4, os.cpu_count() or 1))
+
+
+class ExportJob:
+    """一个导出任务的状态"""
+
+    QUEUED = "等待中"
+    DECODING = "解码中"
+    CROPPING = "裁剪中"
+    ENCODING = "编码中"
+    DONE = "完成"
+    FAILED = "失败"
+
+    # 各阶段对应的进度
+    PROGRESS = {QUEUED: 0.0, DECODING: 0.1, CROPPING: 0.4, ENCODING: 0.6, DONE: 1.0, FAILED: 1.0}
+
+    def __init__(self, job_id, filename, output_format, recipe=None):
+        self.id = job_id
+        self.filename = filename
+        self.format = output_format
+        # 裁剪方案（sidecar.make_recipe），导出成功后写入输出旁的清单
+        self.recipe = recipe
+        self.status = self.QUEUED
+        self.error = None
+        self.output_bytes = 0
+
+    @property
+    def finished(self):
+        return self.status in (self.DONE, self.FAILED)
+
+    @property
+    def progress(self):
+        return self.PROGRESS[self.status]
+
+    def describe(self):
+        """状态列表中显示的文字"""
+        name = os.path.basename(self.filename)
+        if self.status == self.DONE:
+            return f"{name}  {self.status} ({self.output_bytes / 1024:.0f} KB)"
+        if self.status == self.FAILED:
+            return f"{name}  {self.status}: {self.error}"
+        return f"{name}  {self.status}"
+
+
+class ExportQueue:
+    """按提交顺序在后台导出裁剪结果"""
+
+    def __init__(self, dispatch, workers=EXPORT_WORKERS, profiler=None):
+        self.dispatch = dispatch
+        self.profiler = profiler
+        self.executor = ThreadPoolExecutor(max_workers=workers,
+                                           thread_name_prefix="export")
+        self.jobs = []
+        self._ids = count(1)
+
+    def submit(self, source, angle, box, filename, output_format, params=None,
+               on_update=None, recipe=None):
+        """提交导出任务
+
+        source是完整分辨率图像，或者返回它的函数（延迟解码时在后台线程中调用）。
+        图像在提交后不会再被修改（变换总是生成新图像），可以安全地跨线程读取。
+        on_update(job, status)在主线程中于每次状态变化时调用，status是变化时的状态
+        （送达时job.status可能已经更新）。
+        recipe不为None时，导出成功后在输出旁写入裁剪清单（见sidecar模块）。
+        """
+        return self.submit_group(source, angle, [(box, filename, output_format, params)],
+                                 on_update, [recipe])[0]
+
+    def submit_group(self, source, angle, items, on_update=None, recipes=None):
+        """从同一张源图像导出多个裁剪区域
+
+        items是 [(裁剪框, 文件名, 格式, 编码参数), ...]。源图像只解码一次，
+        之后每个区域的裁剪和编码作为独立任务分发到线程池。返回任务列表。
+        recipes是与items对应的裁剪方案列表。
+        """
+        jobs = []
+        recipes = recipes or [None] * len(items)
+        for (_, filename, output_format, _), recipe in zip(items, recipes):
+            job = ExportJob(next(self._ids), filename, output_format, recipe)
+            self.jobs.append(job)
+            self._notify(job, job.status, on_update)
+            jobs.append(job)
+        self.executor.submit(self._run_group, jobs, source, angle, items, on_update)
+        return jobs
+
+    def submit_responsive(self, source, angle, box, directory, stem, output_format, widths,
+                          params=None, on_update=None, recipe=None):
+        """提交多尺寸导出任务：裁剪一次，按widths输出多个尺寸和清单 <stem>.json"""
+        manifest = os.path.join(directory, stem + ".json")
+        job = ExportJob(next(self._ids), manifest, output_format, recipe)
+        self.jobs.append(job)
+        self._notify(job, job.status, on_update)
+        self.executor.submit(self._run_responsive, job, source, angle, box, directory, stem,
+                             widths, params or {}, on_update)
+        return job
+
+    def pending(self):
+        """尚未完成的任务数"""
+        return sum(1 for job in self.jobs if not job.finished)
+
+    def clear_finished(self):
+        """从列表中移除已完成的任务，返回被移除的任务"""
+        finished = [job for job in self.jobs if job.finished]
+        self.jobs = [job for job in self.jobs if not job.finished]
+        return finished
+
+    def shutdown(self, wait=True):
+        self.executor.shutdown(wait=wait)
+
+    def _span(self, name):
+        return self.profiler.span(name) if self.profiler else nullcontext()
+
+    def _run_group(self, jobs, source, angle, items, on_update):
+        """解码一次，然后把每个区域分发到线程池"""
+        if callable(source):
+            for job in jobs:
+                self._set_status(job, ExportJob.DECODING, on_update)
+            try:
+                with self._span("decode.full"):
+                    source = source()
+            except Exception as e:
+                for job in jobs:
+                    job.error = str(e)
+                    self._set_status(job, ExportJob.FAILED, on_update)
+                return
+
+        # 第一个区域在当前线程中完成，其余区域分发给空闲线程
+        tasks = [(job, source, angle, box, params or {}, on_update)
+                 for job, (box, _, _, params) in zip(jobs, items)]
+        for task in tasks[1:]:
+            try:
+                self.executor.submit(self._run, *task)
+            except RuntimeError:
+                # 线程池正在关闭，不再接受新任务：在当前线程中完成
+                self._run(*task)
+        self._run(*tasks[0])
+
+    def _run(self, job, source, angle, box, params, on_update):
+        try:
+            self._set_status(job, ExportJob.CROPPING, on_update)
+            with self._span("export.crop"):
+                cropped = crop_rotated(source, angle, box)
+            # 不再需要原图，尽早释放引用
+            source = None
+
+            self._set_status(job, ExportJob.ENCODING, on_update)
+            with self._span("export.encode"):
+                save_image(cropped, job.filename, job.format, **params)
+            job.output_bytes = os.path.getsize(job.filename)
+            self._write_sidecar(job)
+        except Exception as e:
+            job.error = str(e)
+            self._set_status(job, ExportJob.FAILED, on_update)
+            return
+        self._set_status(job, ExportJob.DONE, on_update)
+
+    def _run_responsive(self, job, source, angle, box, directory, stem, widths, params,
+                        on_update):
+        try:
+            if callable(source):
+                self._set_status(job, ExportJob.DECODING, on_update)
+                with self._span("decode.full"):
+                    source = source()
+
+            self._set_status(job, ExportJob.CROPPING, on_update)
+            with self._span("export.crop"):
+                cropped = crop_rotated(source, angle, box)
+            source = None
+
+            self._set_status(job, ExportJob.ENCODING, on_update)
+            with self._span("export.responsive"):
+                manifest = export_responsive(cropped, widths, directory, stem, job.format,
+                                             params)
+            job.output_bytes = sum(entry["bytes"] for entry in manifest["files"])
+            self._write_sidecar(job)
+        except Exception as e:
+            job.error = str(e)
+            self._set_status(job, ExportJob.FAILED, on_update)
+            return
+        self._set_status(job, ExportJob.DONE, on_update)
+
+    def _write_sidecar(self, job):
+        if job.recipe is not None:
+            with self._span("export.sidecar"):
+                write_sidecar(job.recipe, job.filename)
+
+    def _set_status(self, job, status, on_update):
+        job.status = status
+        self._notify(job, status, on_update)
+
+    def _notify(self, job, status, on_update):
+        if on_update is not None:
+            self.dispatch(self._deliver, on_update, job, status)
+
+    @staticmethod
+    def _deliver(on_update, job, status):
+        """在主线程中执行"""
+        on_update(job, status)
+        return False
@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+"""
+图像状态（不依赖GTK）
+原图、预览和显示图像共用同一个像素缓冲区，只有变换真正改变像素时才生成新的缓冲区。
+同时统计每个存活缓冲区占用的字节数和进程的峰值常驻内存。
+"""
+
+import resource
+import sys
+
+from PIL import Image
+
+# reduce()和高质量缩放支持的模式（预览、金字塔和多尺寸导出共用），其他模式需要先转换
+REDUCIBLE_MODES = ('L', 'LA', 'RGB', 'RGBA')
+
+# 累计左转次数对应的无损转置
+QUARTER_TURN_TRANSPOSE = {
+    1: Image.Transpose.ROTATE_90,
+    2: Image.Transpose.ROTATE_180,
+    3: Image.Transpose.ROTATE_270,
+}
+
+
+def is_region_source(image):
+    """是否为区域源（内存映射或TIFF按块读取），而不是完整解码的PIL图像"""
+    return image is not None and not isinstance(image, Image.Image)
+
+
+def image_nbytes(image):
+    """PIL图像像素缓冲区的字节数
+
+    Pillow内部按每像素1、2或4字节存储（RGB也占4字节）。
+    区域源报告自己占用的堆内存（内存映射为0，TIFF为解码块缓存）。
+    """
+    if image is None:
+        return 0
+    if is_region_source(image):
+        return image.nbytes
+    if image.mode in ('1', 'L', 'P'):
+        pixel_size = 1
+    elif image.mode.startswith('I;16'):
+        pixel_size = 2
+    else:
+        pixel_size = 4
+    return image.width * image.height * pixel_size
+
+
+def transpose_quarter_turns(image, turns):
+    """左转90度的turns倍，一次转置完成"""
+    transpose = QUARTER_TURN_TRANSPOSE.get(turns % 4)
+    return image if transpose is None else image.transpose(transpose)
+
+
+def peak_rss_bytes():
+    """进程的峰值常驻内存（字节）"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux以KB为单位，macOS以字节为单位
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+class ImageState:
+    """当前打开的图像
+
+    original  完整分辨率图像，JPEG只解码了预览时为None（延迟解码），
+              未压缩格式和TIFF为区域源（MappedImage或TiffRegionSource）
+    preview   缩小解码的预览，得到完整分辨率后释放（区域源时保留）
+    display   显示图像；未经滑块旋转时就是底图本身，不另外复制
+    90度旋转直接替换底图，旧缓冲区随即释放，同一时刻只保留一份底图。
+    """
+
+    def __init__(self):
+        self.peak_bytes = 0
+        self.clear()
+
+    def clear(self):
+        self.original = None
+        self.preview = None
+        self.full_size = None  # 完整分辨率尺寸（已包含90度旋转）
+        self.quarter_turns = 0  # 累计左转90度的次数，延迟解码时需要重放
+        self.image_format = None
+        self._display = None  # 只有显示图像与底图不同时才持有
+        self._display_size = None
+
+    @property
+    def base(self):
+        """当前可用的最高分辨率图像（完整分辨率或预览）"""
+        return self.original if self.original is not None else self.preview
+
+    @property
+    def region_source(self):
+        """完整分辨率的区域源，没有时为None"""
+        return self.original if is_region_source(self.original) else None
+
+    @property
+    def raster(self):
+        """可以整体做PIL变换（如任意角度旋转）的最高分辨率图像，区域源时为预览"""
+        return self.preview if self.region_source is not None else self.base
+
+    @property
+    def display(self):
+        return self._display if self._display is not None else self.base
+
+    @property
+    def display_size(self):
+        """显示图像对应的完整分辨率尺寸"""
+        return self._display_size if self._display is not None else self.full_size
+
+    @property
+    def display_shared(self):
+        """显示图像是否与底图共用缓冲区"""
+        return self._display is None
+
+    def load(self, image, full_size, image_format, is_full):
+        """设置新打开的图像（预览或完整分辨率）"""
+        self.clear()
+        if is_full:
+            self.original = image
+        else:
+            self.preview = image
+        self.full_size = full_size
+        self.image_format = image_format
+        self._account()
+
+    def set_full(self, image):
+        """延迟解码完成：重放90度旋转，释放预览和由预览生成的显示图像
+
+        区域源保留预览，作为金字塔的缩小层和旋转预览
+        """
+        self._account(image_nbytes(image))
+        self.original = transpose_quarter_turns(image, self.quarter_turns)
+        if not is_region_source(image):
+            self.preview = None
+        self._display = None
+        self._display_size = None
+        self._account()
+
+    def set_display(self, image=None, image_size=None):
+        """设置显示图像，None或底图本身表示与底图共用缓冲区"""
+        if image is None or image is self.base:
+            self._display = None
+            self._display_size = None
+        else:
+            self._display = image
+            self._display_size = image_size or image.size
+        self._account()
+
+    def rotate_quarter(self, turns):
+        """旋转90度的整数倍（turns为正表示左转），预览和完整图像同步旋转"""
+        if self.original is not None:
+            self._account(image_nbytes(self.original))
+            self.original = transpose_quarter_turns(self.original, turns)
+        if self.preview is not None:
+            self._account(image_nbytes(self.preview))
+            self.preview = transpose_quarter_turns(self.preview, turns)
+        self.quarter_turns += turns
+        if turns % 2:
+            self.full_size = (self.full_size[1], self.full_size[0])
+        # 基于旧底图生成的显示图像已失效
+        self._display = None
+        self._display_size = None
+        self._account()
+
+    def buffers(self):
+        """每个存活缓冲区占用的字节数（共用的缓冲区只计一次）"""
+        result = {}
+        seen = set()
+        for name, image in (('original', self.original), ('preview', self.preview),
+                            ('display', self._display)):
+            if image is not None and id(image) not in seen:
+                seen.add(id(image))
+                if is_region_source(image):
+                    name = image.kind
+                result[name] = image_nbytes(image)
+        return result
+
+    @property
+    def held_bytes(self):
+        return sum(self.buffers().values())
+
+    def _account(self, transient=0):
+        """更新峰值；transient是变换过程中新旧缓冲区同时存在的额外字节数"""
+        self.peak_bytes = max(self.peak_bytes, self.held_bytes + transient)
+
+    def memory_summary(self, extra=None):
+        """内存占用的文字说明，extra是其他需要列出的 {名称: 字节数}"""
+        mb = 1024 * 1024
+        parts = [f"{name} {nbytes / mb:.1f}" for name, nbytes in self.buffers().items()]
+        for name, nbytes in (extra or {}).items():
+            parts.append(f"{name} {nbytes / mb:.1f}")
+        return (f"内存(MB): {', '.join(parts) or '无'}\n"
+                f"峰值: 图像 {self.peak_bytes / mb:.1f}, RSS {peak_rss_bytes() / mb:.1f}")
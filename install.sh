@@ -37,5 +37,13 @@ EOF
 
 chmod +x image-cropper-launcher.sh
 
+
+cat > imagecropper << EOF
+#!/bin/bash
+exec python3 "$(pwd)/cli.py" "\$@"
+EOF
+
+chmod +x imagecropper
+
 echo "Install succeed"
 
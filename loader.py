@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+"""
+图像加载
+JPEG先按显示尺寸缩小解码作为预览，完整分辨率的解码推迟到真正需要时。
+未压缩的格式（BMP、PPM/PGM、TIFF、.npy）不解码，直接内存映射；
+压缩的分块或分条TIFF按块读取，只解码用到的区域。
+解码可以放到后台线程执行，支持进度报告和取消；浏览文件夹时预先解码相邻的图片。
+"""
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from PIL import Image
+
+from export import EXTENSION_FORMATS
+from mapped import MAPPED_EXTENSIONS, open_mapped
+from image_state import image_nbytes
+from tile_cache import TileCache
+from tiff_roi import DEFAULT_TIFF_CACHE_BYTES, open_tiff_region
+
+# 可以打开的图片扩展名（批处理的输入和文件夹浏览；可以内存映射的格式只作为输入）
+SUPPORTED_EXTENSIONS = tuple(sorted({'.' + ext for ext in EXTENSION_FORMATS} |
+                                    set(MAPPED_EXTENSIONS)))
+
+# 所有TIFF区域源共用的解码块缓存（键包含文件路径和修改时间）
+tiff_tile_cache = TileCache(DEFAULT_TIFF_CACHE_BYTES, image_nbytes)
+
+
+class LoadCancelled(Exception):
+    """加载被取消"""
+
+
+class ProgressFile:
+    """包装文件对象：每次读取时报告进度并检查是否已取消
+
+    PIL按块读取文件进行解码，读取位置就是解码进度的近似值。
+    """
+
+    def __init__(self, fp, on_progress=None, cancelled=None):
+        self.fp = fp
+        self.on_progress = on_progress
+        self.cancelled = cancelled
+        self.total = max(1, os.fstat(fp.fileno()).st_size)
+
+    def read(self, size=-1):
+        if self.cancelled is not None and self.cancelled.is_set():
+            raise LoadCancelled()
+        data = self.fp.read(size)
+        if self.on_progress is not None:
+            self.on_progress(min(1.0, self.fp.tell() / self.total))
+        return data
+
+    def __getattr__(self, name):
+        return getattr(self.fp, name)
+
+
+def _decode(path, progress=None, cancelled=None, draft_size=None):
+    """解码图像文件，返回 (图像, 原始尺寸, 格式)
+
+    draft_size不为None时，JPEG按不小于该尺寸的比例缩小解码
+    """
+    with open(path, 'rb') as fp:
+        image = Image.open(ProgressFile(fp, progress, cancelled))
+        full_size = image.size
+        image_format = image.format
+
+        if (draft_size is not None and image_format == 'JPEG' and
+                draft_size[0] > 0 and draft_size[1] > 0):
+            image.draft(image.mode, draft_size)
+
+        image.load()
+    return image, full_size, image_format
+
+
+def open_region(path):
+    """不解码像素的区域源：内存映射或TIFF按块读取，都不支持时返回None"""
+    source = open_mapped(path)
+    if source is None:
+        source = open_tiff_region(path, tiff_tile_cache)
+    return source
+
+
+def open_preview(path, target_size, progress=None, cancelled=None):
+    """打开图像，尽快得到一张可以显示的图像
+
+    JPEG使用draft()在IDCT阶段直接按1/2、1/4或1/8解码，
+    得到不小于target_size的预览图；可以内存映射的格式隔行采样，
+    只读取用到的行；TIFF有缩小页时从缩小页读取；其他格式直接完整解码。
+    返回 (图像, 原始尺寸, 格式, 是否为完整分辨率)。
+    """
+    source = open_region(path)
+    if source is not None:
+        def report(fraction):
+            if cancelled is not None and cancelled.is_set():
+                raise LoadCancelled()
+            if progress is not None:
+                progress(fraction)
+
+        image = source.preview(target_size, report)
+        return image, source.size, source.format, image.size == source.size
+
+    image, full_size, image_format = _decode(path, progress, cancelled, target_size)
+    return image, full_size, image_format, image.size == full_size
+
+
+def open_full(path, progress=None, cancelled=None, lazy=False):
+    """完整分辨率解码
+
+    lazy为True时，可以内存映射或按块读取的文件直接返回区域源（不读取像素），
+    调用方需要能处理只支持crop()和transpose()的区域源
+    """
+    if lazy:
+        source = open_region(path)
+        if source is not None:
+            return source
+    image, _, _ = _decode(path, progress, cancelled)
+    return image
+
+
+class BackgroundLoader:
+    """在后台线程中解码图像
+
+    每次调用load()都会取消尚未完成的上一次加载；结果通过dispatch
+    （GUI中为GLib.idle_add）送回主线程，并且只有最新一次请求的结果
+    会被送达，因此连续打开多个文件不会出现过期的图像。
+    """
+
+    # 进度变化小于这个值时不通知主线程，避免事件过多
+    PROGRESS_STEP = 0.01
+
+    def __init__(self, dispatch):
+        self.dispatch = dispatch
+        self.generation = 0
+        self._cancelled = None
+        self._lock = threading.Lock()
+
+    def load(self, func, *args, on_done=None, on_error=None, on_progress=None):
+        """在后台执行func(*args, progress=..., cancelled=...)"""
+        with self._lock:
+            if self._cancelled is not None:
+                self._cancelled.set()
+            self.generation += 1
+            generation = self.generation
+            cancelled = threading.Event()
+            self._cancelled = cancelled
+
+        thread = threading.Thread(
+            target=self._run,
+            args=(generation, cancelled, func, args, on_done, on_error, on_progress),
+            daemon=True
+        )
+        thread.start()
+        return generation
+
+    def cancel(self):
+        """取消正在进行的加载，已排队的结果也会被丢弃"""
+        with self._lock:
+            if self._cancelled is not None:
+                self._cancelled.set()
+                self._cancelled = None
+            self.generation += 1
+
+    def is_busy(self):
+        with self._lock:
+            return self._cancelled is not None
+
+    def _run(self, generation, cancelled, func, args, on_done, on_error, on_progress):
+        last_progress = [0.0]
+
+        def progress(fraction):
+            if on_progress is not None and fraction - last_progress[0] >= self.PROGRESS_STEP:
+                last_progress[0] = fraction
+                self.dispatch(self._deliver, generation, on_progress, fraction)
+
+        try:
+            result = func(*args, progress=progress, cancelled=cancelled)
+        except LoadCancelled:
+            return
+        except Exception as e:
+            self.dispatch(self._deliver, generation, on_error, e, True)
+            return
+        self.dispatch(self._deliver, generation, on_done, result, True)
+
+    def _deliver(self, generation, callback, value, finished=False):
+        """在主线程中执行：丢弃已被新请求取代的结果"""
+        if generation != self.generation:
+            return False
+        if finished:
+            with self._lock:
+                self._cancelled = None
+        if callback is not None:
+            callback(value)
+        return False
+
+
+class PrefetchCache:
+    """预先解码相邻图片（上一张、下一张）的预览，切换时直接使用
+
+    只保留最近一次prefetch()指定的文件，其余的结果随即丢弃，内存中最多只有几张预览。
+    结果按文件修改时间和目标尺寸匹配，文件被修改或窗口大小变化后不会用到过期的结果。
+    """
+
+    # 等待正在进行的预解码时检查取消的间隔（秒）
+    POLL_INTERVAL = 0.05
+
+    def __init__(self, workers=1):
+        self._entries = {}  # 路径 -> (匹配键, future)
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="prefetch")
+
+    @staticmethod
+    def _key(path, target_size):
+        return os.stat(path).st_mtime_ns, tuple(target_size)
+
+    def prefetch(self, paths, target_size):
+        """在后台解码paths的预览，已经在解码或已完成的不重复解码"""
+        entries = {}
+        with self._lock:
+            for path in paths:
+                try:
+                    key = self._key(path, target_size)
+                except OSError:
+                    continue
+                entry = self._entries.get(path)
+                if entry is None or entry[0] != key:
+                    entry = (key, self._executor.submit(open_preview, path, target_size))
+                entries[path] = entry
+            for path, (_, future) in self._entries.items():
+                if path not in entries:
+                    future.cancel()
+            self._entries = entries
+
+    def take(self, path, target_size):
+        """取出path的预解码（future），没有或已过期时返回None"""
+        with self._lock:
+            entry = self._entries.pop(path, None)
+        if entry is None:
+            return None
+        try:
+            if entry[0] != self._key(path, target_size):
+                return None
+        except OSError:
+            return None
+        return entry[1]
+
+    def shutdown(self):
+        with self._lock:
+            for _, future in self._entries.values():
+                future.cancel()
+            self._entries = {}
+        self._executor.shutdown(wait=False)
+
+
+def wait_prefetched(future, progress=None, cancelled=None):
+    """等待预解码完成（供BackgroundLoader调用），返回open_preview的结果"""
+    while not wait([future], timeout=PrefetchCache.POLL_INTERVAL).done:
+        if cancelled is not None and cancelled.is_set():
+            raise LoadCancelled()
+    return future.result()
@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+"""
+内存映射加载（不依赖GTK）
+未压缩的BMP、PPM/PGM、TIFF和.npy不经过解码，直接把文件映射为numpy视图。
+预览、显示瓦片和导出裁剪都只读取用到的行，由操作系统的页缓存负责读入和回收，
+常驻内存只随实际查看或导出的区域增长。
+"""
+
+import mmap
+import os
+
+import numpy as np
+from PIL import BmpImagePlugin, Image, PpmImagePlugin, TiffImagePlugin
+
+from image_state import REDUCIBLE_MODES
+
+# 可以内存映射的扩展名（文件对话框和批处理使用）
+MAPPED_EXTENSIONS = ('.bmp', '.ppm', '.pgm', '.pnm', '.tif', '.tiff', '.npy')
+
+# 文件中的像素排列 -> (每像素字节数, 换算为图像模式通道顺序的索引，None表示相同)
+RAW_LAYOUTS = {
+    'L': (1, None),
+    'P': (1, None),
+    'LA': (2, None),
+    'RGB': (3, None),
+    'RGBA': (4, None),
+    'RGBX': (4, (0, 1, 2)),
+    'BGR': (3, (2, 1, 0)),
+    'BGRX': (4, (2, 1, 0)),
+    'BGRA': (4, (2, 1, 0, 3)),
+}
+
+# .npy的通道数 -> 图像模式
+NPY_MODES = {1: 'L', 2: 'LA', 3: 'RGB', 4: 'RGBA'}
+
+# 生成预览时每次复制的采样行数
+PREVIEW_STRIP_ROWS = 256
+
+# transpose()支持的90度旋转 -> np.rot90的次数
+ROT90_TURNS = {
+    Image.Transpose.ROTATE_90: 1,
+    Image.Transpose.ROTATE_180: 2,
+    Image.Transpose.ROTATE_270: 3,
+}
+
+
+class MappedImage:
+    """内存映射的图像，接口与PIL图像的只读部分相同（size、mode、crop、transpose）
+
+    array是自上而下的 (高, 宽, 通道) numpy视图，自下而上存储的BMP用负步长表示；
+    order把文件中的通道顺序（如BGR）换算为mode的通道顺序，只在复制区域时应用。
+    """
+
+    kind = "mapped"
+    nbytes = 0  # 文件页由操作系统的页缓存管理，不占用堆内存
+
+    def __init__(self, array, mode, image_format, order=None, palette=None, info=None):
+        self.array = array
+        self.mode = mode
+        self.format = image_format
+        self.order = order
+        self.palette = palette  # (rawmode, 数据)，只有P模式才有
+        self.info = info or {}
+
+    @property
+    def size(self):
+        return self.array.shape[1], self.array.shape[0]
+
+    @property
+    def width(self):
+        return self.array.shape[1]
+
+    @property
+    def height(self):
+        return self.array.shape[0]
+
+    def _to_image(self, array):
+        """把视图的一部分复制为PIL图像"""
+        if self.order is not None:
+            array = array[..., self.order]
+        if array.shape[2] == 1:
+            array = array[..., 0]
+        # 视图本身连续（如整行的灰度图像）时不复制，PIL图像直接引用只读映射
+        array = np.ascontiguousarray(array)
+        image = Image.frombuffer(self.mode, (array.shape[1], array.shape[0]), array,
+                                 'raw', self.mode, 0, 1)
+        if self.palette is not None:
+            image.putpalette(self.palette[1], self.palette[0])
+        return image
+
+    def crop(self, box):
+        """复制box区域为PIL图像，超出图像的部分与PIL一样填充为0"""
+        x1, y1, x2, y2 = map(int, box)
+        width, height = self.size
+        inner = (max(x1, 0), max(y1, 0), min(x2, width), min(y2, height))
+        if inner == (x1, y1, x2, y2):
+            return self._to_image(self.array[y1:y2, x1:x2])
+
+        image = Image.new(self.mode, (x2 - x1, y2 - y1))
+        if self.palette is not None:
+            image.putpalette(self.palette[1], self.palette[0])
+        if inner[0] < inner[2] and inner[1] < inner[3]:
+            part = self._to_image(self.array[inner[1]:inner[3], inner[0]:inner[2]])
+            image.paste(part, (inner[0] - x1, inner[1] - y1))
+        return image
+
+    def transpose(self, method):
+        """90度的整数倍旋转：只交换视图的步长，不复制像素"""
+        if method not in ROT90_TURNS:
+            raise ValueError(f"内存映射图像不支持该变换: {method}")
+        array = np.rot90(self.array, ROT90_TURNS[method], axes=(0, 1))
+        return MappedImage(array, self.mode, self.format, self.order, self.palette, self.info)
+
+    def preview(self, target_size, progress=None):
+        """按整数倍缩小的预览，不小于target_size（与JPEG的draft()相同）
+
+        只读取每隔factor行的一行；行内用reduce()做水平方向的平均，
+        不能reduce()的模式（如调色板）隔点采样。progress(比例)在每个条带后调用。
+        """
+        width, height = self.size
+        factor = max(1, min(width // max(1, target_size[0]),
+                            height // max(1, target_size[1])))
+        rows = self.array[::factor]
+        if factor > 1 and self.mode not in REDUCIBLE_MODES:
+            rows = rows[:, ::factor]
+
+        preview = None
+        for top in range(0, rows.shape[0], PREVIEW_STRIP_ROWS):
+            strip = self._to_image(rows[top:top + PREVIEW_STRIP_ROWS])
+            if factor > 1 and self.mode in REDUCIBLE_MODES:
+                strip = strip.reduce((factor, 1))
+            if preview is None:
+                preview = Image.new(self.mode, (strip.width, rows.shape[0]))
+                if self.palette is not None:
+                    preview.putpalette(self.palette[1], self.palette[0])
+            preview.paste(strip, (0, top))
+            if progress is not None:
+                progress(min(1.0, (top + PREVIEW_STRIP_ROWS) / rows.shape[0]))
+        preview.info.update(self.info)
+        return preview
+
+
+def _map_rows(path, offset, size, row_bytes, stride, bottom_up=False):
+    """把文件中从offset开始的像素行映射为 (高, 宽, 通道) 视图"""
+    width, height = size
+    with open(path, 'rb') as fp:
+        if offset + stride * (height - 1) + width * row_bytes > os.fstat(fp.fileno()).st_size:
+            return None
+        buffer = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+    if hasattr(buffer, 'madvise'):
+        # 预览隔行采样、瓦片和裁剪只读取少量行，关闭预读避免把整个文件读入
+        buffer.madvise(mmap.MADV_RANDOM)
+    array = np.ndarray((height, width, row_bytes), dtype=np.uint8, buffer=buffer,
+                       offset=offset, strides=(stride, row_bytes, 1))
+    return array[::-1] if bottom_up else array
+
+
+def _open_raw(path, image):
+    """用PIL插件解析出的文件头映射BMP、PPM和TIFF，布局不支持时返回None"""
+    tiles = image.tile
+    if not tiles or any(tile[0] != 'raw' for tile in tiles):
+        return None
+    args = tiles[0][3]
+    rawmode, stride, direction = (args, 0, 1) if isinstance(args, str) else args
+    if rawmode not in RAW_LAYOUTS:
+        return None
+    pixel_bytes, order = RAW_LAYOUTS[rawmode]
+    width, height = image.size
+    stride = stride or width * pixel_bytes
+
+    # TIFF的每个条带是一个瓦片，只有连续存储的条带才能作为一个视图
+    offset = tiles[0][2]
+    for _, (x1, y1, x2, _), tile_offset, _ in tiles:
+        if x1 != 0 or x2 != width or tile_offset != offset + y1 * stride:
+            return None
+
+    array = _map_rows(path, offset, image.size, pixel_bytes, stride, direction < 0)
+    if array is None:
+        return None
+    palette = None
+    if image.mode == 'P' and image.palette is not None:
+        palette = (image.palette.rawmode or image.palette.mode, image.palette.palette)
+    return MappedImage(array, image.mode, image.format, order, palette,
+                       {k: v for k, v in image.info.items() if k == 'transparency'})
+
+
+def _open_npy(path):
+    array = np.load(path, mmap_mode='r')
+    if array.dtype != np.uint8 or array.ndim not in (2, 3):
+        return None
+    if array.ndim == 2:
+        array = array[..., np.newaxis]
+    mode = NPY_MODES.get(array.shape[2])
+    if mode is None:
+        return None
+    return MappedImage(array, mode, 'NPY')
+
+
+def open_mapped(path):
+    """内存映射未压缩的图像文件，不支持的文件返回None
+
+    直接用格式插件解析文件头，不经过Image.open的像素数上限检查：
+    像素不会被解码到内存中，正是为超大扫描件准备的。
+    """
+    try:
+        with open(path, 'rb') as fp:
+            magic = fp.read(6)
+    except OSError:
+        return None
+
+    if magic == b'\x93NUMPY':
+        try:
+            return _open_npy(path)
+        except (OSError, ValueError):
+            return None
+
+    if magic[:2] == b'BM':
+        plugin = BmpImagePlugin.BmpImageFile
+    elif magic[:2] in (b'P5', b'P6'):
+        plugin = PpmImagePlugin.PpmImageFile
+    elif magic[:4] in (b'II*\x00', b'MM\x00*'):
+        plugin = TiffImagePlugin.TiffImageFile
+    else:
+        return None
+    try:
+        image = plugin(path)
+    except (OSError, SyntaxError, ValueError):
+        return None
+    with image:
+        return _open_raw(path, image)
@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+"""
+裁剪预设（不依赖GTK）
+固定比例和预设尺寸，图形界面的下拉框和批处理命令共用
+"""
+
+import re
+
+# (显示名称, 命令行名称, 比例)，比例为None表示自由比例
+RATIO_PRESETS = [
+    ("自由", "free", None),
+    ("1:1 (正方形)", "1:1", (1, 1)),
+    ("4:3 (标准)", "4:3", (4, 3)),
+    ("16:9 (宽屏)", "16:9", (16, 9)),
+    ("3:2 (照片)", "3:2", (3, 2)),
+    ("2:3 (人像)", "2:3", (2, 3)),
+]
+
+# (显示名称, 尺寸)，尺寸为None表示自定义
+SIZE_PRESETS = [
+    ("自定义", None),
+    ("1920x1080", (1920, 1080)),
+    ("1280x720", (1280, 720)),
+    ("150x150", (150, 150)),
+]
+
+
+def ratio_from_label(label):
+    """下拉框显示名称 -> 比例"""
+    for name, _, ratio in RATIO_PRESETS:
+        if name == label:
+            return ratio
+    raise KeyError(label)
+
+
+def parse_ratio(text):
+    """解析命令行比例：预设名称（如16:9）或任意的 W:H"""
+    for _, key, ratio in RATIO_PRESETS:
+        if text == key:
+            return ratio
+    match = re.fullmatch(r'(\d+(?:\.\d+)?):(\d+(?:\.\d+)?)', text)
+    if not match or float(match.group(1)) <= 0 or float(match.group(2)) <= 0:
+        raise ValueError(f"无效的比例: {text}")
+    return (float(match.group(1)), float(match.group(2)))
+
+
+def parse_size(text):
+    """解析尺寸 WxH（预设下拉框的文本也是这个格式）"""
+    match = re.search(r'(\d+)x(\d+)', text)
+    if not match:
+        raise ValueError(f"无效的尺寸: {text}")
+    return int(match.group(1)), int(match.group(2))
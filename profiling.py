@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""
+交互性能分析（不依赖GTK）
+记录绘制各阶段、指针处理、比例约束、解码和编码的耗时，
+在画布上绘制帧耗时曲线和最近一帧的分解，并导出Chrome trace-event JSON
+（可以用Perfetto或chrome://tracing打开）。
+
+环境变量：
+    IMAGECROPPER_PROFILE=1            启动时开启分析和画布叠加层
+    IMAGECROPPER_TRACE=/path/x.json   退出时写入trace文件（同时开启分析）
+"""
+
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import nullcontext
+from functools import wraps
+
+# 保留的trace事件数和帧数
+TRACE_EVENTS = 200000
+FRAME_SAMPLES = 120
+
+# 叠加层尺寸和每帧预算（60 Hz）
+HUD_WIDTH = 240
+HUD_HEIGHT = 110
+HUD_MARGIN = 8
+FRAME_BUDGET_MS = 1000 / 60
+
+_NULL_SPAN = nullcontext()
+
+
+class _Span:
+    """计时区间，结束时写入trace事件和当前帧的分解"""
+
+    __slots__ = ('profiler', 'name', 'start')
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        end = time.perf_counter()
+        self.profiler.record(self.name, self.start, end)
+        return False
+
+
+class Profiler:
+    """可随时开关的计时器
+
+    关闭时span()返回共享的空上下文，几乎没有开销。
+    事件的时间戳以微秒记录在单调时钟上，与线程ID一起导出，
+    后台解码和编码线程在trace中显示为单独的轨道。
+    """
+
+    def __init__(self, enabled=False, trace_path=None):
+        self.enabled = enabled
+        self.hud_visible = enabled
+        self.trace_path = trace_path
+        self.events = deque(maxlen=TRACE_EVENTS)
+        self.frame_times = deque(maxlen=FRAME_SAMPLES)
+        self.last_frame = {}  # 最近一帧各阶段的耗时（毫秒）
+        self._current_frame = {}  # 上一帧结束后主线程上的各阶段耗时
+        self._main_thread = threading.get_ident()
+        self._origin = time.perf_counter()
+
+    @classmethod
+    def from_environment(cls):
+        trace_path = os.environ.get("IMAGECROPPER_TRACE")
+        enabled = bool(os.environ.get("IMAGECROPPER_PROFILE")) or bool(trace_path)
+        return cls(enabled, trace_path)
+
+    def toggle(self):
+        """隐藏开关：同时切换计时和叠加层"""
+        self.enabled = not self.enabled
+        self.hud_visible = self.enabled
+        return self.enabled
+
+    def span(self, name):
+        """with profiler.span("draw.tiles"): ..."""
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, name)
+
+    def wrap(self, name, func):
+        """返回计时版本的func（用于交给后台线程执行的函数）"""
+        @wraps(func)
+        def timed(*args, **kwargs):
+            with self.span(name):
+                return func(*args, **kwargs)
+        return timed
+
+    def record(self, name, start, end):
+        """记录一个区间（perf_counter秒）"""
+        tid = threading.get_ident()
+        self.events.append((name, start, end, tid))
+        if tid == self._main_thread:
+            frame = self._current_frame
+            frame[name] = frame.get(name, 0.0) + (end - start) * 1000
+
+    def end_frame(self, start, end):
+        """结束一帧（perf_counter秒）
+
+        两帧之间主线程上的指针处理、比例约束等也计入这一帧的分解
+        """
+        if not self.enabled:
+            return
+        self.events.append(("frame", start, end, self._main_thread))
+        self.frame_times.append((end - start) * 1000)
+        self.last_frame = self._current_frame
+        self._current_frame = {}
+
+    # ========== trace导出 ==========
+
+    def trace_events(self):
+        """Chrome trace-event格式的完整事件（ph = "X"）"""
+        pid = os.getpid()
+        origin = self._origin
+        return [
+            {
+                "name": name,
+                "cat": name.split('.')[0],
+                "ph": "X",
+                "ts": round((start - origin) * 1e6, 1),
+                "dur": round((end - start) * 1e6, 1),
+                "pid": pid,
+                "tid": tid,
+            }
+            for name, start, end, tid in list(self.events)
+        ]
+
+    def write_trace(self, path=None):
+        """写入trace文件，返回路径（没有路径时返回None）"""
+        path = path or self.trace_path
+        if not path:
+            return None
+        with open(path, "w") as f:
+            json.dump({"traceEvents": self.trace_events(), "displayTimeUnit": "ms"}, f)
+        return path
+
+    # ========== 画布叠加层 ==========
+
+    def hud_rect(self):
+        """叠加层在画布中的位置 (x, y, 宽, 高)"""
+        return HUD_MARGIN, HUD_MARGIN, HUD_WIDTH, HUD_HEIGHT
+
+    def draw_hud(self, cr):
+        """绘制帧耗时曲线和最近一帧的分解（cr为cairo上下文）"""
+        if not self.hud_visible:
+            return
+        x, y, width, height = self.hud_rect()
+        graph_height = 50
+
+        cr.save()
+        cr.set_source_rgba(0, 0, 0, 0.7)
+        cr.rectangle(x, y, width, height)
+        cr.fill()
+
+        # 帧耗时柱状图：纵轴为两倍帧预算，超出预算的帧标为红色
+        scale = graph_height / (FRAME_BUDGET_MS * 2)
+        bar_width = width / FRAME_SAMPLES
+        base = y + graph_height
+        for i, ms in enumerate(self.frame_times):
+            bar = min(ms * scale, graph_height)
+            if ms > FRAME_BUDGET_MS:
+                cr.set_source_rgb(1, 0.3, 0.3)
+            else:
+                cr.set_source_rgb(0.3, 0.9, 0.4)
+            cr.rectangle(x + i * bar_width, base - bar, max(bar_width - 0.5, 0.5), bar)
+            cr.fill()
+
+        # 帧预算参考线
+        cr.set_source_rgba(1, 1, 1, 0.5)
+        cr.set_line_width(1)
+        cr.move_to(x, base - FRAME_BUDGET_MS * scale)
+        cr.line_to(x + width, base - FRAME_BUDGET_MS * scale)
+        cr.stroke()
+
+        # 文字：最近一帧和各阶段耗时
+        cr.set_source_rgb(1, 1, 1)
+        cr.set_font_size(11)
+        last = self.frame_times[-1] if self.frame_times else 0.0
+        lines = [f"frame {last:.2f} ms"]
+        phases = sorted(self.last_frame.items(), key=lambda item: -item[1])
+        lines.append("  ".join(f"{name} {ms:.2f}" for name, ms in phases[:2]))
+        lines.append("  ".join(f"{name} {ms:.2f}" for name, ms in phases[2:4]))
+        for i, line in enumerate(lines):
+            cr.move_to(x + 4, base + 16 + i * 14)
+            cr.show_text(line)
+        cr.restore()
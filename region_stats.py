@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+裁剪区域统计（不依赖GTK）
+对显示图像建立一次积分图（summed-area table），之后任意矩形的
+平均亮度、各通道平均值、高光溢出比例和清晰度能量都只需每个通道查表四次，
+拖动裁剪框时每一帧都可以刷新，与图像大小无关。
+"""
+
+from math import ceil, sqrt
+
+import numpy as np
+
+from image_state import REDUCIBLE_MODES
+
+# 建表使用的最大像素数，更大的显示图像先用reduce()缩小（统计值本身是平均量）
+STATS_MAX_PIXELS = 4_000_000
+
+# 任一通道不低于该值即视为高光溢出
+CLIP_LEVEL = 250
+
+# ITU-R BT.601亮度权重，与PIL的convert('L')相同
+LUMA_WEIGHTS = (0.299, 0.587, 0.114)
+
+
+def integral_image(array, dtype):
+    """积分图：前面补一行一列0，S[y, x]是array[:y, :x]的和"""
+    table = np.zeros((array.shape[0] + 1, array.shape[1] + 1) + array.shape[2:], dtype=dtype)
+    np.cumsum(array, axis=0, dtype=dtype, out=table[1:, 1:])
+    np.cumsum(table[1:, 1:], axis=1, dtype=dtype, out=table[1:, 1:])
+    return table
+
+
+def box_sum(table, x1, y1, x2, y2):
+    """积分图上[x1, x2) × [y1, y2)的和，四次查表"""
+    return table[y2, x2] - table[y1, x2] - table[y2, x1] + table[y1, x1]
+
+
+class RegionStats:
+    """一张图像的积分图
+
+    channels  R、G、B和高光溢出计数共用一张 (高+1, 宽+1, 4) 的uint32表
+    energy    亮度拉普拉斯平方的float64表（清晰度能量）
+    image_size是图像对应的完整分辨率尺寸，stats()的坐标以此为准。
+    """
+
+    def __init__(self, image, image_size=None):
+        image_size = image_size or image.size
+        factor = ceil(sqrt(image.width * image.height / STATS_MAX_PIXELS))
+        if image.mode not in REDUCIBLE_MODES:
+            # 调色板、1位等模式不能reduce()，只能先转换
+            image = image.convert('RGB')
+        if factor > 1:
+            # 先缩小再转换为RGB，不为整张图像分配一份RGB副本
+            image = image.reduce(factor)
+        if image.mode != 'RGB':
+            image = image.convert('RGB')
+        self.size = image.size
+        self.scale = (image.width / image_size[0], image.height / image_size[1])
+
+        rgb = np.asarray(image)
+        clipped = (rgb.max(axis=2) >= CLIP_LEVEL)[..., np.newaxis]
+        # 4百万像素 × 255 < 2**32，uint32不会溢出
+        self.channels = integral_image(np.concatenate((rgb, clipped), axis=2), np.uint32)
+
+        luma = rgb.astype(np.float32) @ np.array(LUMA_WEIGHTS, dtype=np.float32)
+        laplacian = np.zeros_like(luma)
+        laplacian[1:-1, 1:-1] = (4 * luma[1:-1, 1:-1] - luma[:-2, 1:-1] - luma[2:, 1:-1] -
+                                 luma[1:-1, :-2] - luma[1:-1, 2:])
+        self.energy = integral_image(np.square(laplacian), np.float64)
+
+    @property
+    def nbytes(self):
+        return self.channels.nbytes + self.energy.nbytes
+
+    def stats(self, box):
+        """box（完整分辨率坐标）内的统计，区域为空时返回None
+
+        返回字典：mean 平均亮度，channels 各通道平均值，
+        clipped 高光溢出像素的百分比，sharpness 拉普拉斯平方的平均值
+        """
+        width, height = self.size
+        x1, x2 = sorted(min(max(round(v * self.scale[0]), 0), width) for v in box[0::2])
+        y1, y2 = sorted(min(max(round(v * self.scale[1]), 0), height) for v in box[1::2])
+        area = (x2 - x1) * (y2 - y1)
+        if area == 0:
+            return None
+
+        sums = box_sum(self.channels, x1, y1, x2, y2).astype(np.float64) / area
+        channels = tuple(float(v) for v in sums[:3])
+        return {
+            "mean": sum(w * v for w, v in zip(LUMA_WEIGHTS, channels)),
+            "channels": channels,
+            "clipped": float(sums[3]) * 100,
+            "sharpness": float(box_sum(self.energy, x1, y1, x2, y2)) / area,
+        }
+
+
+def format_stats(stats):
+    """统计面板的文字"""
+    if stats is None:
+        return "亮度: -"
+    r, g, b = stats["channels"]
+    return (f"亮度: {stats['mean']:.1f}  RGB: {r:.0f}/{g:.0f}/{b:.0f}\n"
+            f"高光溢出: {stats['clipped']:.2f}%  清晰度: {stats['sharpness']:.0f}")
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+多个命名裁剪区域（不依赖GTK）
+一张图像上可以有多个裁剪区域，每个区域有自己的比例和预设尺寸，
+导出时共用同一次完整分辨率解码。
+"""
+
+import os
+import re
+
+
+class CropRegion:
+    """一个命名的裁剪区域
+
+    rect是旋转后完整分辨率坐标中的 [x1, y1, x2, y2]，None表示尚未绘制；
+    ratio_index/preset_index是控制面板中比例和预设下拉框的选项。
+    """
+
+    def __init__(self, name, rect=None, aspect_ratio=None, ratio_index=0, preset_index=0):
+        self.name = name
+        self.rect = rect
+        self.aspect_ratio = aspect_ratio  # (width, height) 比例，None表示自由比例
+        self.ratio_index = ratio_index
+        self.preset_index = preset_index
+
+    def contains(self, x, y):
+        if not self.rect:
+            return False
+        x1, y1, x2, y2 = self.rect
+        return min(x1, x2) < x < max(x1, x2) and min(y1, y2) < y < max(y1, y2)
+
+    def export_box(self, image_size):
+        """限制在图像内的整数裁剪框，无效时返回None"""
+        if not self.rect:
+            return None
+        img_width, img_height = image_size
+        x1, y1, x2, y2 = map(int, self.rect)
+        x1, x2 = sorted((max(0, min(x1, img_width)), max(0, min(x2, img_width))))
+        y1, y2 = sorted((max(0, min(y1, img_height)), max(0, min(y2, img_height))))
+        if x2 <= x1 or y2 <= y1:
+            return None
+        return x1, y1, x2, y2
+
+
+def new_region_name(regions):
+    """下一个未被使用的默认名称：区域 1、区域 2 ..."""
+    names = {region.name for region in regions}
+    n = 1
+    while f"区域 {n}" in names:
+        n += 1
+    return f"区域 {n}"
+
+
+def region_at(regions, x, y, exclude=None):
+    """包含点 (x, y) 的区域索引（后添加的优先），没有时返回None"""
+    for index in range(len(regions) - 1, -1, -1):
+        if index != exclude and regions[index].contains(x, y):
+            return index
+    return None
+
+
+def region_filenames(directory, prefix, names, extension):
+    """每个区域的输出路径 <prefix>_<区域名><ext>，名称中的特殊字符替换为下划线，重名时追加序号"""
+    used = set()
+    result = []
+    for name in names:
+        safe_name = re.sub(r'[^\w-]+', '_', name).strip('_') or 'region'
+        stem = f"{prefix}_{safe_name}"
+        candidate = stem + extension
+        n = 1
+        while candidate in used:
+            candidate = f"{stem}_{n}{extension}"
+            n += 1
+        used.add(candidate)
+        result.append(os.path.join(directory, candidate))
+    return result
@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+"""
+图像渲染辅助
+负责把PIL图像转换为cairo表面，供绘图区域直接绘制
+"""
+
+from contextlib import nullcontext
+from itertools import count
+from math import ceil, floor, radians
+
+import cairo
+import numpy as np
+
+from image_state import REDUCIBLE_MODES
+from tile_cache import TileCache
+from transform import rotated_size
+
+
+def image_to_surface(image):
+    """将PIL图像转换为cairo ARGB32表面
+
+    只做一次RGBA转换和一次通道重排，结果可以被缓存并在每帧重复绘制。
+    """
+    # cairo需要每像素4字节，JPG通常是RGB格式，需要先转换为RGBA
+    if image.mode != 'RGBA':
+        image = image.convert('RGBA')
+
+    width, height = image.size
+    stride = cairo.ImageSurface.format_stride_for_width(
+        cairo.FORMAT_ARGB32, width)
+
+    # 在little-endian系统上，cairo的ARGB32实际上是BGRA顺序
+    # 花式索引一次性生成连续的BGRA数组，不再经过tobytes/bytearray中转
+    rgba = np.asarray(image)
+    bgra = np.ascontiguousarray(rgba[:, :, [2, 1, 0, 3]])
+
+    # cairo表面会持有bgra的引用，数组在表面释放前不会被回收
+    return cairo.ImageSurface.create_for_data(
+        bgra,
+        cairo.FORMAT_ARGB32,
+        width,
+        height,
+        stride
+    )
+
+
+# 金字塔最小层的短边下限，再小就没有意义了
+PYRAMID_MIN_SIZE = 256
+
+def build_pyramid(image, min_size=PYRAMID_MIN_SIZE, base_factor=1.0):
+    """生成多分辨率预览金字塔（1, 1/2, 1/4, 1/8 ...）
+
+    返回 [(缩放系数, 图像), ...] 列表，第0层为传入的图像。
+    缩放系数是该层相对完整分辨率图像的比例，传入的图像本身是
+    缩小解码的预览时，base_factor为它相对完整分辨率的比例。
+    每一层都由上一层 reduce(2) 得到，总开销约为原图的1/3。
+    """
+    levels = [(base_factor, image)]
+
+    current = image
+    if current.mode not in REDUCIBLE_MODES:
+        # 其他模式（P、1、CMYK等）先转换为RGBA
+        current = current.convert('RGBA')
+
+    factor = base_factor
+    while min(current.size) // 2 >= min_size:
+        current = current.reduce(2)
+        factor /= 2
+        levels.append((factor, current))
+
+    return levels
+
+
+def select_pyramid_level(levels, scale):
+    """选择仍能覆盖屏幕显示尺寸的最小层级
+
+    scale是原图到屏幕的缩放比例，返回 (层级索引, 缩放系数, 图像)。
+    如果连第0层都不够清晰（缩放系数小于scale），返回第0层。
+    """
+    index = 0
+    for i, (factor, _) in enumerate(levels):
+        if factor < scale:
+            break
+        index = i
+    factor, image = levels[index]
+    return index, factor, image
+
+
+# 瓦片边长（像素），每个金字塔层级都按这个尺寸切分
+TILE_SIZE = 256
+
+# 瓦片缓存默认内存上限
+DEFAULT_TILE_CACHE_BYTES = 256 * 1024 * 1024
+
+
+def surface_nbytes(surface):
+    """cairo图像表面占用的字节数"""
+    return surface.get_stride() * surface.get_height()
+
+
+class TiledRenderer:
+    """分块渲染器
+
+    每个金字塔层级切分为固定尺寸的瓦片，绘制时只转换并绘制
+    与当前裁剪区域相交的瓦片，转换结果保存在LRU缓存中。
+    多个渲染器可以共享同一个缓存，从而共用一个内存上限。
+    profiler不为None时，瓦片转换计入 "draw.convert" 阶段。
+    """
+
+    # 每次更换图像都分配新的编号，作为瓦片键的第一项
+    _image_ids = count()
+
+    def __init__(self, tile_size=TILE_SIZE, cache_bytes=DEFAULT_TILE_CACHE_BYTES,
+                 cache=None, profiler=None):
+        self.tile_size = tile_size
+        self.profiler = profiler
+        self.cache = cache if cache is not None else TileCache(cache_bytes, surface_nbytes)
+        self.pyramid = None
+        self.image_id = next(self._image_ids)
+
+    def set_image(self, image, base_factor=1.0, source=None):
+        """更换图像：重建金字塔并丢弃旧图像的瓦片
+
+        base_factor是image相对完整分辨率的比例（缩小解码的预览小于1）。
+        source是可以按区域读取的完整分辨率图像（如内存映射的文件或按块读取的TIFF），
+        作为第0层放在预览金字塔之前，放大时瓦片直接从它读取。
+        """
+        if image is None:
+            self.pyramid = None
+        else:
+            self.pyramid = build_pyramid(image, base_factor=base_factor)
+            if source is not None and base_factor < 1.0:
+                self.pyramid.insert(0, (1.0, source))
+        self.invalidate()
+
+    def invalidate(self):
+        """丢弃已缓存的瓦片，下次绘制时重新转换"""
+        self.cache.discard(self.image_id)
+        self.image_id = next(self._image_ids)
+
+    @property
+    def base_factor(self):
+        """第0层相对完整分辨率的比例"""
+        return self.pyramid[0][0] if self.pyramid else 1.0
+
+    def get_tile(self, index, level_image, tx, ty):
+        """获取指定层级的瓦片表面（按需转换并缓存）"""
+        key = (self.image_id, index, tx, ty)
+        surface = self.cache.get(key)
+        if surface is None:
+            t = self.tile_size
+            level_width, level_height = level_image.size
+            box = (tx * t, ty * t,
+                   min((tx + 1) * t, level_width),
+                   min((ty + 1) * t, level_height))
+            with self.profiler.span("draw.convert") if self.profiler else nullcontext():
+                surface = image_to_surface(level_image.crop(box))
+            self.cache.put(key, surface)
+        return surface
+
+    def draw(self, cr, scale, offset_x, offset_y, angle=0, image_size=None):
+        """绘制可见瓦片
+
+        scale是原图到画布的缩放比例，(offset_x, offset_y)是图像原点在画布中的位置。
+        angle不为0时，图像绕中心旋转angle度（逆时针，与PIL一致）后绘制，
+        此时(offset_x, offset_y)是旋转后包围盒的原点，image_size是未旋转图像
+        的完整分辨率尺寸。返回实际绘制的瓦片数量。
+        """
+        if self.pyramid is None:
+            return 0
+
+        index, factor, level_image = select_pyramid_level(self.pyramid, scale)
+        level_scale = scale / factor
+        level_width, level_height = level_image.size
+
+        cr.save()
+        cr.translate(offset_x, offset_y)
+        if angle:
+            width, height = image_size
+            rotated_width, rotated_height = rotated_size(image_size, angle)
+            cr.translate(rotated_width * scale / 2, rotated_height * scale / 2)
+            cr.rotate(-radians(angle))
+            cr.translate(-width * scale / 2, -height * scale / 2)
+        cr.scale(level_scale, level_scale)
+
+        # 裁剪区域换算到层级图像坐标（旋转时为包围盒），只处理相交的瓦片
+        clip_x1, clip_y1, clip_x2, clip_y2 = cr.clip_extents()
+        visible_x1 = max(0, clip_x1)
+        visible_y1 = max(0, clip_y1)
+        visible_x2 = min(level_width, clip_x2)
+        visible_y2 = min(level_height, clip_y2)
+        if visible_x1 >= visible_x2 or visible_y1 >= visible_y2:
+            cr.restore()
+            return 0
+
+        t = self.tile_size
+        painted = 0
+
+        for ty in range(floor(visible_y1 / t), ceil(visible_y2 / t)):
+            for tx in range(floor(visible_x1 / t), ceil(visible_x2 / t)):
+                surface = self.get_tile(index, level_image, tx, ty)
+                x, y = tx * t, ty * t
+                cr.set_source_surface(surface, x, y)
+                # 边缘像素向外延伸，避免缩放插值时瓦片之间出现缝隙
+                cr.get_source().set_extend(cairo.EXTEND_PAD)
+                cr.rectangle(x, y, surface.get_width(), surface.get_height())
+                cr.fill()
+                painted += 1
+        cr.restore()
+
+        return painted
+
+
+# 裁剪框绘制参数
+HANDLE_SIZE = 8  # 控制点边长
+CROP_LINE_WIDTH = 2  # 边框线宽
+
+# 局部重绘时在裁剪框外额外包含的边距：控制点、线宽和抗锯齿
+DAMAGE_MARGIN = HANDLE_SIZE / 2 + CROP_LINE_WIDTH + 2
+
+
+def draw_crop_shade(cr, clip, x1, y1, x2, y2):
+    """在clip (x1, y1, x2, y2) 范围内给裁剪框以外的区域绘制半透明覆盖层"""
+    clip_x1, clip_y1, clip_x2, clip_y2 = clip
+    cr.set_source_rgba(0, 0, 0, 0.4)
+    cr.rectangle(clip_x1, clip_y1, clip_x2 - clip_x1, clip_y2 - clip_y1)
+    cr.rectangle(x1, y1, x2 - x1, y2 - y1)
+    cr.set_fill_rule(cairo.FILL_RULE_EVEN_ODD)
+    cr.fill()
+
+
+def draw_crop_frame(cr, x1, y1, x2, y2):
+    """绘制裁剪框边界和四个控制点（画布坐标）"""
+    cr.set_line_width(CROP_LINE_WIDTH)
+    cr.set_source_rgb(1, 1, 1)
+    cr.rectangle(x1, y1, x2 - x1, y2 - y1)
+    cr.stroke()
+
+    points = [
+        (x1, y1),  # 左上
+        (x2, y1),  # 右上
+        (x1, y2),  # 左下
+        (x2, y2)   # 右下
+    ]
+
+    cr.set_source_rgb(0, 0.5, 1)
+    for px, py in points:
+        cr.rectangle(px - HANDLE_SIZE / 2, py - HANDLE_SIZE / 2, HANDLE_SIZE, HANDLE_SIZE)
+        cr.fill()
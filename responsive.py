@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+多尺寸导出（不依赖GTK）
+同一个裁剪结果按多个宽度输出（用于网页srcset），并生成清单JSON。
+较小的尺寸从最近的较大中间结果逐级缩小得到：先用reduce()按整数倍快速缩小，
+最后一步再用Lanczos精确缩放到目标尺寸，不会每次都从完整裁剪结果开始。
+"""
+
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image
+
+from export import FORMAT_EXTENSIONS, save_image
+from image_state import REDUCIBLE_MODES
+
+# 默认输出宽度
+DEFAULT_WIDTHS = (2560, 1920, 1280, 640, 320)
+
+# 最后一步Lanczos缩放前至少保留的倍数，reduce()只负责超出部分
+REDUCING_GAP = 2.0
+
+
+def parse_widths(text):
+    """解析逗号分隔的宽度列表，如 "2560,1920,1280" """
+    widths = sorted({int(v) for v in text.split(',') if v.strip()}, reverse=True)
+    if not widths or widths[-1] <= 0:
+        raise ValueError(f"无效的宽度列表: {text}")
+    return widths
+
+
+def prepare_for_resample(image):
+    """P、1、CMYK等模式转换为可以高质量缩放的模式"""
+    if image.mode in REDUCIBLE_MODES:
+        return image
+    if (image.mode == 'P' and 'transparency' in image.info) or image.mode == 'PA':
+        return image.convert('RGBA')
+    return image.convert('RGB')
+
+
+def resize_chain(image, widths):
+    """按宽度从大到小依次生成 (宽度, 缩小的图像)
+
+    生成器：每个尺寸都由上一个结果缩小得到，调用方可以边生成边编码。
+    比原图宽的目标宽度会被跳过（不放大）；所有宽度都超过原图时按原图宽度输出一个，
+    不会什么都不生成。
+    """
+    image = prepare_for_resample(image)
+    width, height = image.size
+    current = image
+    targets = sorted({w for w in widths if w <= width}, reverse=True) or [width]
+    for target_width in targets:
+        target_height = max(1, round(height * target_width / width))
+        if target_width == current.width:
+            resized = current
+        else:
+            # 整数倍的部分交给reduce()（盒式滤波，很快），保留REDUCING_GAP倍给Lanczos
+            factor = int(current.width / (target_width * REDUCING_GAP))
+            if factor >= 2:
+                current = current.reduce(factor)
+            resized = current.resize((target_width, target_height), Image.Resampling.LANCZOS)
+        yield target_width, resized
+        current = resized
+
+
+def responsive_filename(stem, width, output_format):
+    return f"{stem}_{width}w{FORMAT_EXTENSIONS[output_format]}"
+
+
+def export_responsive(image, widths, directory, stem, output_format, params=None,
+                      workers=None, source=None):
+    """把image按多个宽度保存到directory，并写入清单 <stem>.json
+
+    缩小链按顺序生成，每生成一个尺寸就交给线程池编码（Pillow编码时释放GIL），
+    编码与后续的缩小同时进行。
+    workers为1时在当前线程中依次编码。返回清单字典。
+    """
+    params = params or {}
+    os.makedirs(directory, exist_ok=True)
+    workers = workers or min(len(widths), os.cpu_count() or 1)
+
+    def encode(width, resized):
+        filename = os.path.join(directory, responsive_filename(stem, width, output_format))
+        save_image(resized, filename, output_format, **params)
+        return {
+            "file": os.path.basename(filename),
+            "width": resized.width,
+            "height": resized.height,
+            "bytes": os.path.getsize(filename),
+        }
+
+    if workers <= 1:
+        files = [encode(width, resized) for width, resized in resize_chain(image, widths)]
+    else:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(encode, width, resized)
+                       for width, resized in resize_chain(image, widths)]
+            files = [future.result() for future in futures]
+
+    manifest = {
+        "source": source,
+        "crop": {"width": image.width, "height": image.height},
+        "format": output_format,
+        "files": files,
+    }
+    with open(os.path.join(directory, stem + ".json"), "w") as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+    return manifest
@@ -0,0 +1,309 @@
+#!/usr/bin/env python3
+"""
+裁剪清单和增量重建（不依赖GTK）
+每次导出都在输出旁写一个 <输出文件名>.crop.json（如 a.jpg.crop.json），记录源文件哈希和裁剪方案
+（90度旋转、旋转角度、裁剪框、比例、格式、编码参数）。
+rebuild 子命令像构建系统一样按清单重新渲染：源文件哈希和方案哈希都与上次渲染相同、
+输出也还在时跳过。源文件的哈希按 (大小, 修改时间) 缓存，未改动的目录只需要stat，
+不读取文件内容。
+"""
+
+import glob
+import hashlib
+import json
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from export import EXTENSION_FORMATS, FORMAT_EXTENSIONS, save_image
+from image_state import transpose_quarter_turns
+from loader import open_full
+from responsive import export_responsive
+from transform import crop_rotated
+
+SIDECAR_SUFFIX = ".crop.json"
+SIDECAR_VERSION = 1
+
+# 渲染方式改变（如重采样算法）时加一，所有输出都会重新生成
+RENDER_VERSION = 1
+
+# 计算哈希时每次读取的字节数
+HASH_CHUNK = 1024 * 1024
+
+# 影响输出像素或文件的方案字段；ratio只作记录（裁剪框已经是该比例）
+RENDER_FIELDS = ("quarter_turns", "rotation", "rect", "format", "params", "widths", "output")
+
+
+def sidecar_path(output):
+    """输出文件对应的清单路径（多尺寸导出时output是清单JSON）
+
+    保留完整的输出文件名，同一目录中的 a.jpg、a.png 和 a.json 各有自己的清单
+    """
+    return output + SIDECAR_SUFFIX
+
+
+def file_hash(path):
+    """文件内容的SHA-256"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def file_stat(path):
+    """判断文件是否改动用的 [大小, 修改时间(ns)]"""
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+# 本进程中算过的源文件哈希 {(路径, 大小, 修改时间): 哈希}，同一张图导出多个区域时只读一次
+_hash_cache = {}
+
+
+def hash_source(path):
+    """源文件的 (哈希, [大小, 修改时间])，大小和修改时间没变时使用缓存的哈希"""
+    stat = file_stat(path)
+    key = (path, *stat)
+    digest = _hash_cache.get(key)
+    if digest is None:
+        digest = _hash_cache[key] = file_hash(path)
+    return digest, stat
+
+
+def make_recipe(source, quarter_turns, rotation, rect, ratio, output_format, params=None,
+                widths=None):
+    """裁剪方案，坐标与图形界面相同（重放quarter_turns次左转90度之后、旋转rotation度之后）"""
+    return {
+        "source": os.path.abspath(source),
+        "quarter_turns": quarter_turns % 4,
+        "rotation": rotation,
+        "rect": [int(v) for v in rect],
+        "ratio": list(ratio) if ratio else None,
+        "format": output_format,
+        "params": dict(params or {}),
+        "widths": list(widths) if widths else None,
+        "output": None,
+    }
+
+
+def recipe_hash(recipe):
+    """方案中影响输出的字段的哈希"""
+    fields = {name: recipe.get(name) for name in RENDER_FIELDS}
+    fields["render_version"] = RENDER_VERSION
+    text = json.dumps(fields, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+def _write_json(data, filename):
+    """先写入同目录的临时文件再改名，中断时不会留下半个清单"""
+    fd, temp = tempfile.mkstemp(suffix='.tmp', dir=os.path.dirname(filename) or '.')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(data, f, indent=2, ensure_ascii=False)
+        os.replace(temp, filename)
+    except BaseException:
+        os.unlink(temp)
+        raise
+
+
+def record_build(recipe, filename, source_hash=None, source_stat=None):
+    """渲染成功后写入清单，source_hash为None时计算源文件哈希"""
+    if source_hash is None:
+        source_hash, source_stat = hash_source(recipe["source"])
+    data = {
+        "version": SIDECAR_VERSION,
+        "recipe": recipe,
+        "source": {"hash": source_hash, "stat": source_stat},
+        "built": {"source_hash": source_hash, "recipe_hash": recipe_hash(recipe)},
+    }
+    _write_json(data, filename)
+    return data
+
+
+def write_sidecar(recipe, output):
+    """导出完成后记录方案（在导出线程中调用，计算源文件哈希需要读取整个文件）"""
+    recipe = dict(recipe, output=os.path.basename(output))
+    return record_build(recipe, sidecar_path(output))
+
+
+def load_sidecar(filename):
+    with open(filename) as f:
+        data = json.load(f)
+    if data.get("version") != SIDECAR_VERSION:
+        raise ValueError(f"不支持的清单版本: {data.get('version')}")
+    return data
+
+
+def apply_overrides(recipe, output_format=None, quality=None):
+    """按命令行覆盖格式和质量，格式改变时输出文件的扩展名随之改变
+
+    质量只对JPEG有意义，其他格式的方案不变，不会因此重新渲染
+    """
+    recipe = dict(recipe, params=dict(recipe["params"]))
+    if output_format is not None and output_format != recipe["format"]:
+        recipe["format"] = output_format
+        if not recipe["widths"]:
+            stem = os.path.splitext(recipe["output"])[0]
+            recipe["output"] = stem + FORMAT_EXTENSIONS[output_format]
+    if quality is not None and recipe["format"] == "JPEG":
+        recipe["params"]["quality"] = quality
+    return recipe
+
+
+def is_built(data, recipe, source_hash, directory):
+    """上次渲染用的源文件和方案都没有变，输出也还在"""
+    built = data.get("built") or {}
+    return (built.get("source_hash") == source_hash and
+            built.get("recipe_hash") == recipe_hash(recipe) and
+            os.path.exists(os.path.join(directory, recipe["output"])))
+
+
+def render(recipe, directory):
+    """按方案重新渲染，返回输出的字节数"""
+    source = transpose_quarter_turns(open_full(recipe["source"], lazy=True),
+                                     recipe["quarter_turns"])
+    cropped = crop_rotated(source, recipe["rotation"], recipe["rect"])
+    source = None
+    output = os.path.join(directory, recipe["output"])
+    if recipe["widths"]:
+        stem = os.path.splitext(recipe["output"])[0]
+        manifest = export_responsive(cropped, recipe["widths"], directory, stem,
+                                     recipe["format"], recipe["params"], workers=1,
+                                     source=recipe["source"])
+        return sum(entry["bytes"] for entry in manifest["files"])
+    save_image(cropped, output, recipe["format"], **recipe["params"])
+    return os.path.getsize(output)
+
+
+def rebuild_one(task):
+    """在工作进程中处理一个清单，返回 (清单路径, 状态, 输出字节数, 错误信息)
+
+    状态为 'built'、'skipped'（源文件被touch但内容没变）或 'failed'。
+    source_hash为None表示源文件的大小或修改时间变了，需要重新计算哈希。
+    --format改变了输出文件名时，清单随输出改名。
+    """
+    filename, data, recipe, source_hash, source_stat, force = task
+    directory = os.path.dirname(filename)
+    try:
+        if source_hash is None:
+            source_hash, source_stat = hash_source(recipe["source"])
+            if not force and is_built(data, recipe, source_hash, directory):
+                data = dict(data, source={"hash": source_hash, "stat": source_stat})
+                _write_json(data, filename)
+                return filename, "skipped", 0, None
+        output_bytes = render(recipe, directory)
+        target = sidecar_path(os.path.join(directory, recipe["output"]))
+        record_build(recipe, target, source_hash, source_stat)
+        if target != filename:
+            os.remove(filename)
+        return filename, "built", output_bytes, None
+    except Exception as e:
+        return filename, "failed", 0, str(e)
+
+
+def plan(filename, output_format=None, quality=None, force=False):
+    """在主进程中只用stat判断：不需要重建时返回None，否则返回交给工作进程的任务"""
+    data = load_sidecar(filename)
+    recipe = apply_overrides(data["recipe"], output_format, quality)
+    source_stat = file_stat(recipe["source"])
+    recorded = data.get("source") or {}
+    source_hash = recorded.get("hash") if recorded.get("stat") == source_stat else None
+    if (not force and source_hash is not None and
+            is_built(data, recipe, source_hash, os.path.dirname(filename))):
+        return None
+    return filename, data, recipe, source_hash, source_stat, force
+
+
+def collect_sidecars(patterns, recursive=False):
+    """展开输入：目录取其中所有 *.crop.json 清单，其他参数按通配符匹配
+
+    清单中记录了输出文件名，重建时不依赖清单自身的文件名
+    """
+    result = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            if recursive:
+                for root, _, files in os.walk(pattern):
+                    result.extend(os.path.join(root, name) for name in files
+                                  if name.endswith(SIDECAR_SUFFIX))
+            else:
+                result.extend(glob.glob(os.path.join(glob.escape(pattern), '*' + SIDECAR_SUFFIX)))
+        else:
+            result.extend(glob.glob(pattern, recursive=recursive))
+    return sorted(set(result))
+
+
+def run_rebuild(sidecars, workers=None, output_format=None, quality=None, force=False):
+    """并行重建所有清单，返回统计信息字典"""
+    workers = workers or os.cpu_count() or 1
+    stats = {"built": 0, "skipped": 0, "failed": 0, "output_bytes": 0}
+    start = time.perf_counter()
+
+    planned = []
+    for filename in sidecars:
+        try:
+            planned.append(plan(filename, output_format, quality, force))
+        except (OSError, ValueError, KeyError) as e:
+            stats["failed"] += 1
+            print(f"处理失败 {filename}: {e}", file=sys.stderr)
+
+    # 改格式后 a.jpg 和 a.png 的清单可能指向同一个输出：每个清单先占用与之同名的输出，
+    # 其余的按顺序占用，已被占用的任务报告失败而不是覆盖它
+    outputs = {filename[:-len(SIDECAR_SUFFIX)]: filename
+               for filename in sidecars if filename.endswith(SIDECAR_SUFFIX)}
+    tasks = []
+    for task in planned:
+        if task is None:
+            stats["skipped"] += 1
+            continue
+        filename, recipe = task[0], task[2]
+        output = os.path.join(os.path.dirname(filename), recipe["output"])
+        owner = outputs.setdefault(output, filename)
+        if owner != filename:
+            stats["failed"] += 1
+            print(f"处理失败 {filename}: 输出与 {owner} 相同: {output}", file=sys.stderr)
+            continue
+        tasks.append(task)
+
+    if tasks:
+        chunksize = max(1, len(tasks) // (workers * 8))
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for filename, status, output_bytes, error in executor.map(
+                    rebuild_one, tasks, chunksize=chunksize):
+                stats[status] += 1
+                stats["output_bytes"] += output_bytes
+                if error:
+                    print(f"处理失败 {filename}: {error}", file=sys.stderr)
+
+    stats["seconds"] = time.perf_counter() - start
+    return stats
+
+
+def add_arguments(parser):
+    """注册 rebuild 子命令的参数"""
+    parser.add_argument("inputs", nargs="+", help="清单所在的目录或清单文件（*.crop.json）")
+    parser.add_argument("--format", choices=sorted(set(EXTENSION_FORMATS)),
+                        help="改用该输出格式（只重建受影响的输出）")
+    parser.add_argument("--quality", type=int, help="JPEG输出改用该质量（1-95）")
+    parser.add_argument("--force", action="store_true", help="忽略哈希，全部重新渲染")
+    parser.add_argument("-j", "--workers", type=int, default=os.cpu_count(),
+                        help="并行进程数，默认为CPU核数")
+    parser.add_argument("-r", "--recursive", action="store_true", help="递归处理子目录")
+    parser.set_defaults(func=main)
+
+
+def main(args):
+    sidecars = collect_sidecars(args.inputs, args.recursive)
+    if not sidecars:
+        print("没有找到裁剪清单", file=sys.stderr)
+        return 1
+
+    output_format = EXTENSION_FORMATS[args.format] if args.format else None
+    workers = max(1, args.workers or 1)
+    stats = run_rebuild(sidecars, workers, output_format, args.quality, args.force)
+    print(f"重建 {stats['built']} 个，跳过 {stats['skipped']} 个，失败 {stats['failed']} 个，"
+          f"用时 {stats['seconds']:.2f} s（{workers} 个进程）")
+    return 1 if stats["failed"] else 0
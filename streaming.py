@@ -0,0 +1,331 @@
+#!/usr/bin/env python3
+"""
+流式裁剪（不依赖GTK）
+PNG和BMP不解码整张图像，按条带只读取裁剪框覆盖的行：
+BMP直接定位到裁剪行读取；PNG逐块解压IDAT，越过裁剪框底边后立即停止。
+输出为PNG或BMP时条带直接写入文件，内存只与图像宽度和条带高度有关。
+"""
+
+import os
+import struct
+import zlib
+
+import numpy as np
+from PIL import BmpImagePlugin, Image, PngImagePlugin
+
+from export import save_image
+
+# 每个条带的行数
+STRIP_ROWS = 64
+
+# 每次从文件读取的压缩数据大小
+READ_SIZE = 1 << 16
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+# PNG颜色类型 -> 每像素通道数（只处理8位深度）
+PNG_CHANNELS = {0: 1, 2: 3, 3: 1, 4: 2, 6: 4}
+
+# 流式写入PNG时支持的模式 -> 颜色类型
+PNG_COLOR_TYPES = {'L': 0, 'RGB': 2, 'P': 3, 'LA': 4, 'RGBA': 6}
+
+# 流式写入BMP时支持的模式 -> (每像素位数, rawmode)
+BMP_MODES = {'L': (8, 'L'), 'P': (8, 'P'), 'RGB': (24, 'BGR'), 'RGBA': (32, 'BGRA')}
+
+
+class StripSource:
+    """只解析了文件头的PNG/BMP，按条带读取像素
+
+    PNG的行经过过滤（Sub/Up/Average/Paeth依赖上一行），所以裁剪框上方的行
+    仍然要解压和还原，但每次只保留一个条带；过滤的还原交给PIL的zip解码器完成。
+    """
+
+    def __init__(self, path, image, bits):
+        self.path = path
+        self.bits = bits  # 每像素位数
+        self.size = image.size
+        self.mode = image.mode
+        self.format = image.format
+        self.info = dict(image.info)
+        self.tile = image.tile[0]
+        self.palette = None
+        if image.palette is not None and image.mode == 'P':
+            self.palette = (image.palette.rawmode or image.palette.mode, image.palette.palette)
+
+    def strips(self, box, strip_rows=STRIP_ROWS):
+        """依次生成裁剪框内的条带图像（自上而下，每个最多strip_rows行）"""
+        x1, y1, x2, y2 = box
+        width, height = self.size
+        if not (0 <= x1 < x2 <= width and 0 <= y1 < y2 <= height):
+            raise ValueError("无效的裁剪区域")
+        read = self._png_strips if self.format == 'PNG' else self._bmp_strips
+        for strip in read(box, strip_rows):
+            if self.palette is not None:
+                strip.putpalette(self.palette[1], self.palette[0])
+            yield strip
+
+    def _bmp_strips(self, box, strip_rows):
+        x1, y1, x2, y2 = box
+        width, height = self.size
+        _, _, offset, (rawmode, stride, direction) = self.tile
+        bits = self.bits
+
+        with open(self.path, 'rb') as fp:
+            for top in range(y1, y2, strip_rows):
+                rows = range(top, min(top + strip_rows, y2))
+                if bits % 8 == 0:
+                    # 整字节像素：每行只读取裁剪框内的列
+                    start, length = x1 * bits // 8, (x2 - x1) * bits // 8
+                    chunks = []
+                    for y in rows:
+                        row = y if direction > 0 else height - 1 - y
+                        fp.seek(offset + row * stride + start)
+                        chunks.append(fp.read(length))
+                    yield Image.frombytes(self.mode, (x2 - x1, len(rows)), b''.join(chunks),
+                                          'raw', rawmode, 0, 1)
+                else:
+                    # 1/4位调色板：读取整行再裁剪列
+                    first = rows[0] if direction > 0 else height - 1 - rows[-1]
+                    fp.seek(offset + first * stride)
+                    data = fp.read(len(rows) * stride)
+                    strip = Image.frombytes(self.mode, (width, len(rows)), data,
+                                            'raw', rawmode, stride, direction)
+                    yield strip.crop((x1, 0, x2, len(rows)))
+
+    def _png_strips(self, box, strip_rows):
+        x1, y1, x2, y2 = box
+        width, _ = self.size
+        rawmode = self.tile[3]
+        row_bytes = width * self.bits // 8 + 1  # 含过滤类型字节
+        wanted = strip_rows * row_bytes
+
+        decompressor = zlib.decompressobj()
+        pending = b''
+        buffer = bytearray()
+        previous = bytes(row_bytes - 1)  # 第一行的“上一行”全为0
+        y = 0
+
+        with open(self.path, 'rb') as fp:
+            idat = _idat_chunks(fp)
+            while y < y2:
+                # 解压到够一个条带（或数据结束）
+                while len(buffer) < wanted:
+                    if not pending:
+                        pending = next(idat, b'')
+                        if not pending:
+                            break
+                    buffer += decompressor.decompress(pending, wanted - len(buffer))
+                    pending = decompressor.unconsumed_tail
+                rows = min(len(buffer) // row_bytes, strip_rows, y2 - y)
+                if rows == 0:
+                    raise ValueError("PNG数据不完整")
+
+                # 上一行以“无过滤”作为第一行，一起交给zip解码器还原过滤
+                data = b'\x00' + previous + bytes(buffer[:rows * row_bytes])
+                del buffer[:rows * row_bytes]
+                strip = Image.frombytes(self.mode, (width, rows + 1), zlib.compress(data, 0),
+                                        'zip', rawmode)
+                previous = strip.crop((0, rows, width, rows + 1)).tobytes()
+
+                if y + rows > y1:
+                    yield strip.crop((x1, max(y1 - y, 0) + 1, x2, rows + 1))
+                y += rows
+
+
+def _idat_chunks(fp):
+    """依次生成IDAT块中的压缩数据（每次最多READ_SIZE字节），遇到其他块后结束"""
+    fp.seek(len(PNG_SIGNATURE))
+    seen_idat = False
+    while True:
+        header = fp.read(8)
+        if len(header) < 8:
+            return
+        length, chunk_type = struct.unpack('>I4s', header)
+        if chunk_type != b'IDAT':
+            if seen_idat:
+                return
+            fp.seek(length + 4, os.SEEK_CUR)
+            continue
+        seen_idat = True
+        remaining = length
+        while remaining:
+            data = fp.read(min(remaining, READ_SIZE))
+            if not data:
+                return
+            remaining -= len(data)
+            yield data
+        fp.seek(4, os.SEEK_CUR)  # CRC
+
+
+def open_stream(path):
+    """解析PNG/BMP文件头，不支持流式读取时返回None
+
+    支持：非隔行扫描的8位PNG，未压缩（含位域）的BMP。
+    直接用格式插件解析文件头，不经过Image.open的像素数上限检查：
+    流式裁剪从不分配整张图像，正是为超大图像准备的。
+    """
+    with open(path, 'rb') as fp:
+        header = fp.read(32)
+    if header[:8] == PNG_SIGNATURE:
+        plugin = PngImagePlugin.PngImageFile
+    elif header[:2] == b'BM':
+        plugin = BmpImagePlugin.BmpImageFile
+    else:
+        return None
+    try:
+        image = plugin(path)
+    except (OSError, SyntaxError, ValueError):
+        return None
+    with image:
+        if image.format == 'PNG':
+            if header[12:16] != b'IHDR':
+                return None
+            depth, color_type, _, _, interlace = struct.unpack('>5B', header[24:29])
+            if depth != 8 or color_type not in PNG_CHANNELS or interlace:
+                return None
+            return StripSource(path, image, 8 * PNG_CHANNELS[color_type])
+        if image.format == 'BMP' and len(image.tile) == 1 and image.tile[0][0] == 'raw':
+            # OS/2 BMP的12字节信息头中位数在第24字节，其他版本在第28字节
+            info_size = struct.unpack('<I', header[14:18])[0]
+            bits = struct.unpack('<H', header[24:26] if info_size == 12 else header[28:30])[0]
+            return StripSource(path, image, bits)
+    return None
+
+
+class PngStripWriter:
+    """按条带写入8位PNG
+
+    每行使用Up过滤（可以对整个条带向量化计算），压缩数据随写随输出为IDAT块。
+    """
+
+    def __init__(self, fp, size, mode, palette=None, transparency=None, compress_level=6):
+        self.fp = fp
+        self.mode = mode
+        self.width, self.height = size
+        self.previous = None
+        self.compressor = zlib.compressobj(compress_level)
+        fp.write(PNG_SIGNATURE)
+        self._chunk(b'IHDR', struct.pack('>IIBBBBB', self.width, self.height, 8,
+                                         PNG_COLOR_TYPES[mode], 0, 0, 0))
+        if mode == 'P':
+            self._chunk(b'PLTE', bytes(palette))
+            if isinstance(transparency, bytes):
+                self._chunk(b'tRNS', transparency)
+            elif isinstance(transparency, int):
+                self._chunk(b'tRNS', b'\xff' * transparency + b'\x00')
+        elif mode == 'L' and isinstance(transparency, int):
+            self._chunk(b'tRNS', struct.pack('>H', transparency))
+        elif mode == 'RGB' and isinstance(transparency, tuple):
+            self._chunk(b'tRNS', struct.pack('>HHH', *transparency))
+
+    def write(self, strip):
+        rows = np.asarray(strip, dtype=np.uint8).reshape(strip.height, -1)
+        above = np.empty_like(rows)
+        above[0] = self.previous if self.previous is not None else 0
+        above[1:] = rows[:-1]
+        filtered = np.empty((rows.shape[0], rows.shape[1] + 1), dtype=np.uint8)
+        filtered[:, 0] = 2  # Up
+        np.subtract(rows, above, out=filtered[:, 1:])
+        self.previous = rows[-1].copy()
+        data = self.compressor.compress(filtered.tobytes())
+        if data:
+            self._chunk(b'IDAT', data)
+
+    def close(self):
+        self._chunk(b'IDAT', self.compressor.flush())
+        self._chunk(b'IEND', b'')
+
+    def _chunk(self, chunk_type, data):
+        self.fp.write(struct.pack('>I', len(data)))
+        self.fp.write(chunk_type)
+        self.fp.write(data)
+        self.fp.write(struct.pack('>I', zlib.crc32(chunk_type + data)))
+
+
+class BmpStripWriter:
+    """按条带写入未压缩BMP
+
+    文件大小事先已知，自下而上存储的每个条带直接写到它在文件中的位置。
+    """
+
+    def __init__(self, fp, size, mode, palette=None):
+        self.fp = fp
+        self.width, self.height = size
+        self.bits, self.rawmode = BMP_MODES[mode]
+        self.stride = ((self.width * self.bits + 31) >> 5) << 2
+        self.y = 0
+
+        colors = 256 if self.bits == 8 else 0
+        if mode == 'L':
+            palette = bytes(v for i in range(256) for v in (i, i, i))
+        if colors:
+            palette = bytes(palette).ljust(768, b'\x00')
+            table = b''.join(palette[i * 3:i * 3 + 3][::-1] + b'\x00' for i in range(256))
+        else:
+            table = b''
+        self.offset = 14 + 40 + len(table)
+        file_size = self.offset + self.stride * self.height
+        fp.write(b'BM' + struct.pack('<IHHI', file_size, 0, 0, self.offset))
+        fp.write(struct.pack('<IiiHHIIiiII', 40, self.width, self.height, 1, self.bits, 0,
+                             self.stride * self.height, 2835, 2835, colors, colors))
+        fp.write(table)
+
+    def write(self, strip):
+        rows = strip.height
+        # 条带在文件中的起始行（自下而上）
+        self.fp.seek(self.offset + (self.height - self.y - rows) * self.stride)
+        self.fp.write(strip.tobytes('raw', self.rawmode, self.stride, -1))
+        self.y += rows
+
+    def close(self):
+        self.fp.seek(0, os.SEEK_END)
+
+
+def _writable_mode(mode, modes):
+    if mode in modes:
+        return mode
+    return 'RGBA' if 'A' in mode else 'RGB'
+
+
+def stream_crop(source, box, output_path, output_format, params=None):
+    """把source（open_stream的结果）的box区域保存到output_path
+
+    输出为PNG或BMP时逐条带写入；其他格式（JPEG、GIF）的编码器需要完整图像，
+    只拼接裁剪区域后用save_image保存，仍然不需要解码整张原图。
+    """
+    params = params or {}
+    size = (box[2] - box[0], box[3] - box[1])
+    strips = source.strips(box)
+
+    if output_format not in ('PNG', 'BMP'):
+        cropped = Image.new(source.mode, size)
+        if source.palette is not None:
+            cropped.putpalette(source.palette[1], source.palette[0])
+        cropped.info.update(source.info)
+        y = 0
+        for strip in strips:
+            cropped.paste(strip, (0, y))
+            y += strip.height
+        save_image(cropped, output_path, output_format, **params)
+        return
+
+    if output_format == 'PNG':
+        mode = _writable_mode(source.mode, PNG_COLOR_TYPES)
+    else:
+        mode = _writable_mode(source.mode, BMP_MODES)
+
+    with open(output_path, 'wb') as fp:
+        writer = None
+        for strip in strips:
+            if strip.mode != mode:
+                strip = strip.convert(mode)
+            if writer is None:
+                palette = strip.getpalette() if mode == 'P' else None
+                if output_format == 'PNG':
+                    transparency = source.info.get('transparency') if mode == source.mode else None
+                    writer = PngStripWriter(fp, size, mode, palette, transparency,
+                                            params.get('compress_level', 6))
+                else:
+                    writer = BmpStripWriter(fp, size, mode, palette)
+            writer.write(strip)
+        writer.close()
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+内容感知裁剪建议（不依赖GTK）
+在缩小的工作图像上计算能量图（梯度幅值 + 边缘密度 + 颜色显著性），
+建立一次积分图后，对每个比例、每个缩放档位用numpy一次性求出所有窗口位置的能量和，
+取得分最高的窗口。图形界面显示为可选择的建议框，批处理用 --suggest 直接裁剪。
+"""
+
+from math import ceil
+
+import numpy as np
+
+from crop_geometry import fit_ratio
+from region_stats import integral_image
+
+# 工作图像的最长边（约为常见照片1/8预览的尺寸）
+SUGGEST_SIDE = 384
+
+# 相对于该比例最大窗口的缩放档位
+SUGGEST_SCALES = (1.0, 0.9, 0.8, 0.7)
+
+# 能量图各项的权重（每项先归一化到平均值为1）
+GRADIENT_WEIGHT = 1.0
+EDGE_WEIGHT = 0.5
+SALIENCY_WEIGHT = 1.0
+
+# 梯度超过平均梯度的这个倍数时计为边缘
+EDGE_THRESHOLD = 2.0
+
+
+def working_image(image):
+    """按整数倍缩小到最长边不超过SUGGEST_SIDE的RGB图像"""
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+    factor = ceil(max(image.size) / SUGGEST_SIDE)
+    return image.reduce(factor) if factor > 1 else image
+
+
+def _normalized(array):
+    mean = float(array.mean())
+    return array / mean if mean > 0 else array
+
+
+def energy_map(image):
+    """工作图像的能量图，(高, 宽) float32"""
+    rgb = np.asarray(image, dtype=np.float32)
+    luma = rgb @ np.array((0.299, 0.587, 0.114), dtype=np.float32)
+
+    # 中心差分的梯度幅值
+    gx = np.zeros_like(luma)
+    gy = np.zeros_like(luma)
+    gx[:, 1:-1] = luma[:, 2:] - luma[:, :-2]
+    gy[1:-1, :] = luma[2:, :] - luma[:-2, :]
+    gradient = np.hypot(gx, gy)
+
+    # 边缘：梯度明显高于平均值的像素，窗口内的和就是边缘密度
+    edges = (gradient > EDGE_THRESHOLD * gradient.mean()).astype(np.float32)
+
+    # 颜色显著性：与整张图像平均颜色的距离
+    saliency = np.linalg.norm(rgb - rgb.reshape(-1, 3).mean(axis=0), axis=2)
+
+    return (GRADIENT_WEIGHT * _normalized(gradient) + EDGE_WEIGHT * _normalized(edges) +
+            SALIENCY_WEIGHT * _normalized(saliency))
+
+
+def window_sums(table, width, height):
+    """积分图上所有 width × height 窗口的和，[y, x]是左上角在(x, y)的窗口"""
+    return (table[height:, width:] - table[:-height, width:] -
+            table[height:, :-width] + table[:-height, :-width])
+
+
+def suggest_crops(image, ratios, image_size=None):
+    """每个比例的最佳裁剪框
+
+    image是任意尺寸的图像（预览即可），image_size是它对应的完整分辨率尺寸，
+    返回 [(比例, (x1, y1, x2, y2), 得分)]，顺序与ratios相同。
+    得分 = 窗口能量占比 / sqrt(窗口面积占比)：能量集中时倾向更紧的裁剪。
+    """
+    image_size = image_size or image.size
+    work = working_image(image)
+    energy = energy_map(work)
+    height, width = energy.shape
+    table = integral_image(energy, np.float64)
+    total = max(float(table[-1, -1]), 1e-9)
+
+    result = []
+    for ratio in ratios:
+        target_ratio = ratio[0] / ratio[1]
+        # 该比例在工作图像中的最大窗口
+        if width / height > target_ratio:
+            full_width, full_height = height * target_ratio, height
+        else:
+            full_width, full_height = width, width / target_ratio
+
+        best = None
+        for scale in SUGGEST_SCALES:
+            window_width = max(1, min(width, round(full_width * scale)))
+            window_height = max(1, min(height, round(full_height * scale)))
+            sums = window_sums(table, window_width, window_height)
+            y, x = np.unravel_index(np.argmax(sums), sums.shape)
+            area_fraction = window_width * window_height / (width * height)
+            score = float(sums[y, x]) / total / area_fraction ** 0.5
+            if best is None or score > best[0]:
+                best = (score, x, y, window_width, window_height)
+
+        score, x, y, window_width, window_height = best
+        scale_x, scale_y = image_size[0] / width, image_size[1] / height
+        box = (x * scale_x, y * scale_y, (x + window_width) * scale_x,
+               (y + window_height) * scale_y)
+        # 工作图像上取整后的比例有误差，在完整分辨率上按中心修正
+        box = tuple(int(round(v)) for v in fit_ratio([box], image_size, target_ratio)[0])
+        result.append((ratio, box, score))
+    return result
+
+
+def best_crop(image, ratio, image_size=None):
+    """一个比例的最佳裁剪框 (x1, y1, x2, y2)"""
+    return suggest_crops(image, [ratio], image_size)[0][1]
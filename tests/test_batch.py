@@ -0,0 +1,211 @@
+"""batch：裁剪方案的解析、流式/区域源/PIL三条处理路径与Pillow裁剪的比较、输出命名"""
+
+import json
+import os
+
+import numpy as np
+import pytest
+from PIL import Image
+
+import batch
+import cli
+from batch import CropSpec, collect_inputs, output_paths, process_one, run_batch
+from transform import rotate_image
+
+SIZE = (300, 200)
+
+
+def noise_image(size=SIZE, seed=0):
+    rng = np.random.default_rng(seed)
+    width, height = size
+    return Image.fromarray(rng.integers(0, 256, (height, width, 3), dtype=np.uint8))
+
+
+def write(path, image=None, **params):
+    (image or noise_image()).save(path, **params)
+    return str(path)
+
+
+def saved_pixels(path):
+    with Image.open(path) as image:
+        return np.asarray(image.convert('RGB'))
+
+
+@pytest.mark.parametrize('spec,box', [
+    (CropSpec(), (0, 0, 300, 200)),
+    (CropSpec(box=(10, 20, 110, 220)), (10, 20, 110, 200)),
+    (CropSpec(relative=(0.1, 0.25, 0.5, 1.0)), (30, 50, 150, 200)),
+    (CropSpec(ratio=(1, 1)), (50, 0, 250, 200)),
+    (CropSpec(ratio=(3, 1)), (0, 50, 300, 150)),
+    (CropSpec(size=(100, 50)), (100, 75, 200, 125)),
+    (CropSpec(size=(1000, 50)), (0, 75, 300, 125)),
+    (CropSpec(ratio=(1, 1), rotation=90), (0, 50, 200, 250)),
+])
+def test_resolve(spec, box):
+    assert spec.resolve(SIZE) == box
+
+
+def test_resolve_uses_rotated_canvas():
+    spec = CropSpec(ratio=(16, 9), rotation=30)
+    width, height = noise_image().rotate(30, expand=True).size
+    x1, y1, x2, y2 = spec.resolve(SIZE)
+    assert 0 <= x1 < x2 <= width and 0 <= y1 < y2 <= height
+    assert abs((x2 - x1) / (y2 - y1) - 16 / 9) < 0.02
+
+
+def test_invalid_specs_are_rejected():
+    with pytest.raises(ValueError):
+        CropSpec(box=(50, 50, 50, 60)).resolve(SIZE)
+    with pytest.raises(ValueError):
+        CropSpec(box=(400, 0, 500, 100)).resolve(SIZE)
+    with pytest.raises(ValueError):
+        CropSpec(trim=True, rotation=10)
+    with pytest.raises(ValueError):
+        CropSpec(suggest=(1, 1)).resolve(SIZE)
+    assert CropSpec(trim=True).preview_side == batch.TRIM_SIDE
+    assert CropSpec(suggest=(1, 1)).preview_side == batch.SUGGEST_SIDE
+    assert CropSpec(box=(0, 0, 1, 1)).preview_side is None
+
+
+@pytest.fixture
+def paths_taken(monkeypatch):
+    """记录每个输入走的处理路径"""
+    taken = []
+    for name, label in (('stream_crop', 'stream'), ('open_mapped', 'region'),
+                        ('open_tiff_region', 'region')):
+        original = getattr(batch, name)
+
+        def spy(*args, original=original, label=label):
+            result = original(*args)
+            if label == 'stream' or result is not None:
+                taken.append(label)
+            return result
+        monkeypatch.setattr(batch, name, spy)
+    return taken
+
+
+@pytest.mark.parametrize('extension,params,rotation,expected_path', [
+    ('png', {}, 0, 'stream'),
+    ('bmp', {}, 0, 'stream'),
+    ('png', {}, 15, 'pil'),
+    ('gif', {}, 0, 'pil'),
+    ('ppm', {}, 0, 'region'),
+    ('tif', {}, 0, 'region'),
+    ('tif', {'compression': 'tiff_lzw'}, 0, 'region'),
+    ('jpg', {'quality': 90}, 0, 'pil'),
+    ('npy', {}, 0, 'region'),
+])
+def test_paths_match_pillow(tmp_path, paths_taken, extension, params, rotation, expected_path):
+    image = noise_image()
+    if extension == 'gif':
+        image = image.convert('P', palette=Image.Palette.ADAPTIVE)
+    path = tmp_path / f'input.{extension}'
+    if extension == 'npy':
+        np.save(path, np.asarray(image))
+    else:
+        write(path, image, **params)
+    output = tmp_path / 'output.png'
+    spec = CropSpec(box=(20, 10, 270, 180), rotation=rotation)
+
+    _, input_bytes, output_bytes, error = process_one(
+        (str(path), str(output), 'PNG', spec, {}, None))
+    assert error is None
+    assert input_bytes == os.path.getsize(path) and output_bytes == os.path.getsize(output)
+    assert (paths_taken[:1] or ['pil']) == [expected_path]
+
+    if extension == 'npy':
+        reference = image
+    else:
+        with Image.open(path) as decoded:
+            reference = decoded.convert('RGB')
+    if rotation:
+        reference = rotate_image(reference, rotation)
+    expected = np.asarray(reference.crop((20, 10, 270, 180)))
+    diff = np.abs(saved_pixels(output).astype(np.int16) - expected)
+    assert diff.max() <= (2 if rotation else 0)
+
+
+def test_jpeg_output_and_quality(tmp_path):
+    path = write(tmp_path / 'input.png')
+    low, high = tmp_path / 'low.jpg', tmp_path / 'high.jpg'
+    spec = CropSpec(ratio=(1, 1))
+    assert process_one((path, str(low), 'JPEG', spec, {'quality': 10}, None))[3] is None
+    assert process_one((path, str(high), 'JPEG', spec, {'quality': 95}, None))[3] is None
+    assert os.path.getsize(low) < os.path.getsize(high)
+    with Image.open(low) as saved:
+        assert saved.format == 'JPEG' and saved.size == (200, 200)
+
+
+def test_process_one_reports_errors(tmp_path):
+    path = tmp_path / 'broken.png'
+    path.write_bytes(b'not an image')
+    result = process_one((str(path), str(tmp_path / 'out.png'), 'PNG', CropSpec(), {}, None))
+    assert result[:3] == (str(path), 0, 0) and result[3]
+
+
+def test_output_paths_naming():
+    inputs = ['a/x.jpg', 'b/x.jpg', 'a/x.png', 'a/y.tiff', 'a/z.npy', 'c/x.JPG']
+    names = [(os.path.basename(path), fmt)
+             for path, fmt in output_paths(inputs, 'out', None, 'crop')]
+    assert names == [('crop_x.jpg', 'JPEG'), ('crop_x_1.jpg', 'JPEG'), ('crop_x.png', 'PNG'),
+                     ('crop_y.tif', 'TIFF'), ('crop_z.png', 'PNG'), ('crop_x_2.jpg', 'JPEG')]
+    forced = [os.path.basename(path) for path, _ in output_paths(inputs[:3], 'out', 'PNG', 'p')]
+    assert forced == ['p_x.png', 'p_x_1.png', 'p_x_2.png']
+    # 多尺寸输出按主文件名去重，清单JSON不会互相覆盖
+    stems = [os.path.basename(path)
+             for path, _ in output_paths(inputs[:3], 'out', None, 'p', unique_stems=True)]
+    assert stems == ['p_x.jpg', 'p_x_1.jpg', 'p_x_2.png']
+
+
+def test_collect_inputs(tmp_path):
+    for name in ['a.jpg', 'b.PNG', 'notes.txt', 'sub/c.bmp', 'sub/deep/d.npy']:
+        path = tmp_path / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(b'')
+
+    def names(paths):
+        return [os.path.relpath(path, tmp_path) for path in paths]
+
+    assert names(collect_inputs([str(tmp_path)])) == ['a.jpg', 'b.PNG']
+    assert names(collect_inputs([str(tmp_path)], recursive=True)) == [
+        'a.jpg', 'b.PNG', 'sub/c.bmp', 'sub/deep/d.npy']
+    pattern = str(tmp_path / '*.jpg')
+    assert names(collect_inputs([pattern, pattern])) == ['a.jpg']
+
+
+def test_run_batch_counts(tmp_path):
+    inputs = [write(tmp_path / 'a.png'), write(tmp_path / 'b.bmp', noise_image(seed=1))]
+    broken = tmp_path / 'c.png'
+    broken.write_bytes(b'broken')
+    stats = run_batch(inputs + [str(broken)], CropSpec(ratio=(1, 1)), str(tmp_path / 'out'),
+                      workers=2, prefix='crop')
+    assert stats["images"] == 2 and stats["failed"] == 1
+    assert stats["input_bytes"] == sum(os.path.getsize(path) for path in inputs)
+    assert sorted(os.listdir(tmp_path / 'out')) == ['crop_a.png', 'crop_b.bmp']
+
+
+def test_cli_batch_widths_with_shared_stem(tmp_path, capsys):
+    source = tmp_path / 'in'
+    source.mkdir()
+    for i, extension in enumerate(['jpg', 'png', 'bmp']):
+        write(source / f'x.{extension}', noise_image(seed=i))
+    output = tmp_path / 'out'
+    code = cli.main(['batch', str(source), '--ratio', '1:1', '--widths', '100,50',
+                     '-o', str(output), '-j', '1'])
+    assert code == 0
+    assert "完成 3 张" in capsys.readouterr().out
+    manifests = sorted(output.glob('*.json'))
+    assert len(manifests) == 3
+    sources = set()
+    for manifest in manifests:
+        data = json.loads(manifest.read_text())
+        sources.add(os.path.basename(data["source"]))
+        assert [entry["width"] for entry in data["files"]] == [100, 50]
+        for entry in data["files"]:
+            assert (output / entry["file"]).exists()
+    assert sources == {'x.jpg', 'x.png', 'x.bmp'}
+
+
+def test_cli_rejects_bad_arguments(tmp_path, capsys):
+    assert cli.main(['batch', str(tmp_path), '--ratio', 'wide']) == 2
+    assert cli.main(['batch', str(tmp_path / 'empty'), '--ratio', '1:1']) == 1
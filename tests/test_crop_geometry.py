@@ -0,0 +1,429 @@
+"""crop_geometry：随机裁剪框的性质测试，以及与原图形界面逐个角判断的代码的一致性"""
+
+import numpy as np
+import pytest
+
+from crop_geometry import (ANCHOR_BOTTOM_LEFT, ANCHOR_BOTTOM_RIGHT, ANCHOR_CENTER,
+                           ANCHOR_TOP_LEFT, ANCHOR_TOP_RIGHT, anchor_for_drag_mode,
+                           constrain_aspect, fit_ratio, fit_size)
+from presets import RATIO_PRESETS
+
+ANCHORS = (ANCHOR_TOP_LEFT, ANCHOR_TOP_RIGHT, ANCHOR_BOTTOM_LEFT, ANCHOR_BOTTOM_RIGHT,
+           ANCHOR_CENTER)
+CASES = 20000
+EPSILON = 1e-6
+
+
+def random_cases(seed, n=CASES):
+    """随机图像尺寸、裁剪框（可能反向、越界或退化）和比例"""
+    rng = np.random.default_rng(seed)
+    sizes = rng.integers(20, 5000, size=(n, 2)).astype(np.float64)
+    # 裁剪框的两个角落在图像外侧一圈内
+    corners = rng.uniform(-0.3, 1.3, size=(n, 4)) * np.tile(sizes, 2)
+    # 一部分是很小的框，覆盖最小尺寸的回退分支
+    tiny = rng.random(n) < 0.1
+    corners[tiny, 2:] = corners[tiny, :2] + rng.uniform(-5, 5, size=(tiny.sum(), 2))
+    preset = [ratio[0] / ratio[1] for _, _, ratio in RATIO_PRESETS if ratio]
+    ratios = np.where(rng.random(n) < 0.5, rng.choice(preset, n),
+                      np.exp(rng.uniform(np.log(0.2), np.log(5), n)))
+    return corners, sizes, ratios
+
+
+def assert_valid(rects, sizes, ratios=None):
+    """在图像内、非空，给出ratios时宽高比等于目标比例"""
+    x1, y1, x2, y2 = rects.T
+    width, height = sizes.T
+    assert np.all(x1 >= -EPSILON) and np.all(y1 >= -EPSILON)
+    assert np.all(x2 <= width + EPSILON) and np.all(y2 <= height + EPSILON)
+    assert np.all(x2 - x1 > 0) and np.all(y2 - y1 > 0)
+    if ratios is not None:
+        np.testing.assert_allclose((x2 - x1) / (y2 - y1), ratios, rtol=1e-9)
+
+
+@pytest.mark.parametrize('anchor', ANCHORS)
+def test_constrain_aspect_in_bounds_and_keeps_ratio(anchor):
+    rects, sizes, ratios = random_cases(anchor)
+    assert_valid(constrain_aspect(rects, sizes, ratios, anchor), sizes, ratios)
+
+
+def test_constrain_aspect_mixed_anchors_match_single_anchor_calls():
+    rects, sizes, ratios = random_cases(10)
+    anchors = np.random.default_rng(11).integers(0, len(ANCHORS), CASES)
+    mixed = constrain_aspect(rects, sizes, ratios, anchors)
+    for anchor in ANCHORS:
+        rows = anchors == anchor
+        np.testing.assert_array_equal(
+            mixed[rows], constrain_aspect(rects[rows], sizes[rows], ratios[rows], anchor))
+
+
+def test_fit_ratio_in_bounds_and_keeps_ratio():
+    rects, sizes, ratios = random_cases(20)
+    assert_valid(fit_ratio(rects, sizes, ratios), sizes, ratios)
+
+
+def test_fit_size_keeps_size_and_stays_in_bounds_when_it_fits():
+    rects, sizes, _ = random_cases(30)
+    rng = np.random.default_rng(31)
+    targets = np.floor(sizes * rng.uniform(0.05, 1.0, size=sizes.shape))
+    result = fit_size(rects, sizes, targets)
+    assert_valid(result, sizes)
+    np.testing.assert_allclose(result[:, 2:] - result[:, :2], targets)
+
+
+def test_single_rect_broadcasting():
+    rect = constrain_aspect([10, 10, 300, 100], (640, 480), 1.0, ANCHOR_TOP_LEFT)
+    assert rect.shape == (1, 4)
+    np.testing.assert_allclose(rect[0], (10, 10, 300, 300))
+
+
+@pytest.mark.parametrize('mode,anchor', [
+    (None, ANCHOR_TOP_LEFT), ('resize_tl', ANCHOR_TOP_LEFT), ('resize_tr', ANCHOR_TOP_RIGHT),
+    ('resize_bl', ANCHOR_BOTTOM_LEFT), ('resize_br', ANCHOR_BOTTOM_RIGHT),
+    ('move', ANCHOR_CENTER), ('resize_t', ANCHOR_TOP_LEFT),
+])
+def test_anchor_for_drag_mode(mode, anchor):
+    assert anchor_for_drag_mode(mode) == anchor
+
+
+# ---------- 原图形界面的实现（提取为crop_geometry之前），逐字转写为标量函数 ----------
+
+def legacy_apply_aspect_ratio(rect, size, target_ratio, fixed_corner):
+    img_width, img_height = size
+    x1, y1, x2, y2 = rect
+    x1, x2 = min(x1, x2), max(x1, x2)
+    y1, y2 = min(y1, y2), max(y1, y2)
+    current_width = max(x2 - x1, 1)
+    current_height = max(y2 - y1, 1)
+    too_wide = current_width / current_height > target_ratio
+
+    if fixed_corner == ANCHOR_TOP_LEFT:
+        if too_wide:
+            y2 = y1 + current_width / target_ratio
+        else:
+            x2 = x1 + current_height * target_ratio
+        if x2 > img_width:
+            x2 = img_width
+            y2 = y1 + (x2 - x1) / target_ratio
+        if y2 > img_height:
+            y2 = img_height
+            x2 = x1 + (y2 - y1) * target_ratio
+        if x1 < 0 or y1 < 0:
+            if x1 < 0:
+                shift = -x1
+                x1 += shift
+                x2 += shift
+            if y1 < 0:
+                shift = -y1
+                y1 += shift
+                y2 += shift
+            if x2 > img_width:
+                x2 = img_width
+                y2 = y1 + (x2 - x1) / target_ratio
+            if y2 > img_height:
+                y2 = img_height
+                x2 = x1 + (y2 - y1) * target_ratio
+
+    elif fixed_corner == ANCHOR_TOP_RIGHT:
+        if too_wide:
+            y2 = y1 + current_width / target_ratio
+        else:
+            x1 = x2 - current_height * target_ratio
+        if x1 < 0:
+            x1 = 0
+            y2 = y1 + (x2 - x1) / target_ratio
+        if y2 > img_height:
+            y2 = img_height
+            x1 = x2 - (y2 - y1) * target_ratio
+        if x2 > img_width or y1 < 0:
+            if x2 > img_width:
+                shift = x2 - img_width
+                x1 -= shift
+                x2 -= shift
+            if y1 < 0:
+                shift = -y1
+                y1 += shift
+                y2 += shift
+            if x1 < 0:
+                x1 = 0
+                y2 = y1 + (x2 - x1) / target_ratio
+
+    elif fixed_corner == ANCHOR_BOTTOM_LEFT:
+        if too_wide:
+            y1 = y2 - current_width / target_ratio
+        else:
+            x2 = x1 + current_height * target_ratio
+        if x2 > img_width:
+            x2 = img_width
+            y1 = y2 - (x2 - x1) / target_ratio
+        if y1 < 0:
+            y1 = 0
+            x2 = x1 + (y2 - y1) * target_ratio
+        if x1 < 0 or y2 > img_height:
+            if x1 < 0:
+                shift = -x1
+                x1 += shift
+                x2 += shift
+            if y2 > img_height:
+                shift = y2 - img_height
+                y1 -= shift
+                y2 -= shift
+            if x2 > img_width:
+                x2 = img_width
+                y1 = y2 - (x2 - x1) / target_ratio
+
+    elif fixed_corner == ANCHOR_BOTTOM_RIGHT:
+        if too_wide:
+            y1 = y2 - current_width / target_ratio
+        else:
+            x1 = x2 - current_height * target_ratio
+        if x1 < 0:
+            x1 = 0
+            y1 = y2 - (x2 - x1) / target_ratio
+        if y1 < 0:
+            y1 = 0
+            x1 = x2 - (y2 - y1) * target_ratio
+        if x2 > img_width or y2 > img_height:
+            if x2 > img_width:
+                shift = x2 - img_width
+                x1 -= shift
+                x2 -= shift
+            if y2 > img_height:
+                shift = y2 - img_height
+                y1 -= shift
+                y2 -= shift
+            if x1 < 0:
+                x1 = 0
+                y1 = y2 - (x2 - x1) / target_ratio
+
+    else:
+        center_x = (x1 + x2) / 2
+        center_y = (y1 + y2) / 2
+        if too_wide:
+            new_height = current_width / target_ratio
+            y1 = center_y - new_height / 2
+            y2 = center_y + new_height / 2
+        else:
+            new_width = current_height * target_ratio
+            x1 = center_x - new_width / 2
+            x2 = center_x + new_width / 2
+        if x1 < 0:
+            shift = -x1
+            x1 += shift
+            x2 += shift
+        if x2 > img_width:
+            shift = x2 - img_width
+            x1 -= shift
+            x2 -= shift
+        if y1 < 0:
+            shift = -y1
+            y1 += shift
+            y2 += shift
+        if y2 > img_height:
+            shift = y2 - img_height
+            y1 -= shift
+            y2 -= shift
+        if x1 < 0 or x2 > img_width or y1 < 0 or y2 > img_height:
+            x1, y1 = max(0, x1), max(0, y1)
+            x2, y2 = min(img_width, x2), min(img_height, y2)
+            actual_width = x2 - x1
+            actual_height = y2 - y1
+            if actual_width / actual_height > target_ratio:
+                new_height = actual_width / target_ratio
+                if new_height > img_height:
+                    new_width = img_height * target_ratio
+                    x1 = center_x - new_width / 2
+                    x2 = center_x + new_width / 2
+                    y1, y2 = 0, img_height
+                else:
+                    y1 = center_y - new_height / 2
+                    y2 = center_y + new_height / 2
+            else:
+                new_width = actual_height * target_ratio
+                if new_width > img_width:
+                    new_height = img_width / target_ratio
+                    x1, x2 = 0, img_width
+                    y1 = center_y - new_height / 2
+                    y2 = center_y + new_height / 2
+                else:
+                    x1 = center_x - new_width / 2
+                    x2 = center_x + new_width / 2
+
+    x1 = max(0, min(x1, img_width - 1))
+    y1 = max(0, min(y1, img_height - 1))
+    x2 = max(1, min(x2, img_width))
+    y2 = max(1, min(y2, img_height))
+
+    if x2 - x1 < 10 or y2 - y1 < 10:
+        if target_ratio >= 1:
+            new_width = 20
+            new_height = new_width / target_ratio
+        else:
+            new_height = 20
+            new_width = new_height * target_ratio
+        if fixed_corner == ANCHOR_TOP_LEFT:
+            x2 = min(img_width, x1 + new_width)
+            y2 = min(img_height, y1 + new_height)
+        elif fixed_corner == ANCHOR_TOP_RIGHT:
+            x1 = max(0, x2 - new_width)
+            y2 = min(img_height, y1 + new_height)
+        elif fixed_corner == ANCHOR_BOTTOM_LEFT:
+            x2 = min(img_width, x1 + new_width)
+            y1 = max(0, y2 - new_height)
+        elif fixed_corner == ANCHOR_BOTTOM_RIGHT:
+            x1 = max(0, x2 - new_width)
+            y1 = max(0, y2 - new_height)
+        else:
+            center_x = (x1 + x2) / 2
+            center_y = (y1 + y2) / 2
+            x1 = max(0, center_x - new_width / 2)
+            x2 = min(img_width, x1 + new_width)
+            y1 = max(0, center_y - new_height / 2)
+            y2 = min(img_height, y1 + new_height)
+    return x1, y1, x2, y2
+
+
+def legacy_on_ratio_changed(rect, size, target_ratio):
+    img_width, img_height = size
+    x1, y1, x2, y2 = rect
+    x1, x2 = min(x1, x2), max(x1, x2)
+    y1, y2 = min(y1, y2), max(y1, y2)
+    center_x = (x1 + x2) / 2
+    center_y = (y1 + y2) / 2
+    current_width = max(x2 - x1, 1)
+    current_height = max(y2 - y1, 1)
+    if current_width / current_height > target_ratio:
+        new_height = current_width / target_ratio
+        new_width = current_width
+    else:
+        new_width = current_height * target_ratio
+        new_height = current_height
+    if new_width < 10:
+        new_width = 10
+        new_height = new_width / target_ratio
+    if new_height < 10:
+        new_height = 10
+        new_width = new_height * target_ratio
+
+    new_x1 = center_x - new_width / 2
+    new_y1 = center_y - new_height / 2
+    new_x2 = center_x + new_width / 2
+    new_y2 = center_y + new_height / 2
+    if new_x1 < 0:
+        new_x2 -= new_x1
+        new_x1 = 0
+    if new_x2 > img_width:
+        new_x1 -= new_x2 - img_width
+        new_x2 = img_width
+    if new_y1 < 0:
+        new_y2 -= new_y1
+        new_y1 = 0
+    if new_y2 > img_height:
+        new_y1 -= new_y2 - img_height
+        new_y2 = img_height
+
+    if new_x1 < 0:
+        new_x1 = 0
+        new_height = (new_x2 - new_x1) / target_ratio
+        new_y1 = center_y - new_height / 2
+        new_y2 = center_y + new_height / 2
+    if new_x2 > img_width:
+        new_x2 = img_width
+        new_height = (new_x2 - new_x1) / target_ratio
+        new_y1 = center_y - new_height / 2
+        new_y2 = center_y + new_height / 2
+    if new_y1 < 0:
+        new_y1 = 0
+        new_width = (new_y2 - new_y1) * target_ratio
+        new_x1 = center_x - new_width / 2
+        new_x2 = center_x + new_width / 2
+    if new_y2 > img_height:
+        new_y2 = img_height
+        new_width = (new_y2 - new_y1) * target_ratio
+        new_x1 = center_x - new_width / 2
+        new_x2 = center_x + new_width / 2
+
+    new_x1 = max(0, min(new_x1, img_width - 1))
+    new_y1 = max(0, min(new_y1, img_height - 1))
+    new_x2 = max(1, min(new_x2, img_width))
+    new_y2 = max(1, min(new_y2, img_height))
+    if new_x2 - new_x1 < 10 or new_y2 - new_y1 < 10:
+        default_size = min(100, img_width, img_height)
+        if target_ratio > 1:
+            new_width = default_size
+            new_height = new_width / target_ratio
+        else:
+            new_height = default_size
+            new_width = new_height * target_ratio
+        new_x1 = max(0, center_x - new_width / 2)
+        new_y1 = max(0, center_y - new_height / 2)
+        new_x2 = min(img_width, new_x1 + new_width)
+        new_y2 = min(img_height, new_y1 + new_height)
+    return new_x1, new_y1, new_x2, new_y2
+
+
+def legacy_on_preset_changed(rect, size, target):
+    img_width, img_height = size
+    x1, y1, x2, y2 = rect
+    center_x = (x1 + x2) / 2
+    center_y = (y1 + y2) / 2
+    new_x1 = center_x - target[0] / 2
+    new_y1 = center_y - target[1] / 2
+    new_x2 = center_x + target[0] / 2
+    new_y2 = center_y + target[1] / 2
+    if new_x1 < 0:
+        new_x2 -= new_x1
+        new_x1 = 0
+    if new_y1 < 0:
+        new_y2 -= new_y1
+        new_y1 = 0
+    if new_x2 > img_width:
+        new_x1 -= new_x2 - img_width
+        new_x2 = img_width
+    if new_y2 > img_height:
+        new_y1 -= new_y2 - img_height
+        new_y2 = img_height
+    return new_x1, new_y1, new_x2, new_y2
+
+
+def legacy_valid(rect, size, ratio):
+    """原实现的结果本身正确（在图像内、非空、比例正确）"""
+    x1, y1, x2, y2 = rect
+    return (x1 >= 0 and y1 >= 0 and x2 <= size[0] and y2 <= size[1] and
+            x2 > x1 and y2 > y1 and abs((x2 - x1) / (y2 - y1) / ratio - 1) < 1e-9)
+
+
+PARITY_CASES = 3000
+
+
+@pytest.mark.parametrize('anchor', ANCHORS)
+def test_constrain_aspect_matches_legacy_gui(anchor):
+    rects, sizes, ratios = random_cases(100 + anchor, PARITY_CASES)
+    result = constrain_aspect(rects, sizes, ratios, anchor)
+    compared = 0
+    for rect, size, ratio, new in zip(rects, sizes, ratios, result):
+        old = legacy_apply_aspect_ratio(rect, size, ratio, anchor)
+        # 原实现越界或破坏比例的情况已经修正，其余结果必须相同
+        if legacy_valid(old, size, ratio):
+            np.testing.assert_allclose(new, old, rtol=1e-9, atol=1e-9)
+            compared += 1
+    assert compared > PARITY_CASES // 2
+
+
+def test_fit_ratio_matches_legacy_gui():
+    rects, sizes, ratios = random_cases(200, PARITY_CASES)
+    result = fit_ratio(rects, sizes, ratios)
+    compared = 0
+    for rect, size, ratio, new in zip(rects, sizes, ratios, result):
+        old = legacy_on_ratio_changed(rect, size, ratio)
+        if legacy_valid(old, size, ratio):
+            np.testing.assert_allclose(new, old, rtol=1e-9, atol=1e-9)
+            compared += 1
+    assert compared > PARITY_CASES // 2
+
+
+def test_fit_size_matches_legacy_gui():
+    rects, sizes, _ = random_cases(300, PARITY_CASES)
+    targets = np.random.default_rng(301).integers(10, 6000, size=(PARITY_CASES, 2))
+    result = fit_size(rects, sizes, targets)
+    for rect, size, target, new in zip(rects, sizes, targets, result):
+        np.testing.assert_allclose(new, legacy_on_preset_changed(rect, size, target))
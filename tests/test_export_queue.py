@@ -0,0 +1,167 @@
+"""export_queue：提交顺序、失败的任务不影响后续任务、状态回调经dispatch送回主线程"""
+
+import os
+import threading
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from export_queue import ExportJob, ExportQueue
+from sidecar import load_sidecar, make_recipe, sidecar_path
+from transform import crop_rotated
+
+
+class MainLoop:
+    """模拟GLib.idle_add：dispatch只排队，drain()时在“主线程”中依次执行"""
+
+    def __init__(self):
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def dispatch(self, func, *args):
+        with self._lock:
+            self.calls.append((func, args))
+
+    def drain(self):
+        with self._lock:
+            calls, self.calls = self.calls, []
+        for func, args in calls:
+            assert func(*args) is False
+
+
+def noise_image(size=(320, 240), seed=0):
+    rng = np.random.default_rng(seed)
+    width, height = size
+    return Image.fromarray(rng.integers(0, 256, (height, width, 3), dtype=np.uint8))
+
+
+def recorder():
+    updates = []
+    return updates, lambda job, status: updates.append((job.id, status))
+
+
+def statuses(updates, job):
+    return [status for job_id, status in updates if job_id == job.id]
+
+
+def test_jobs_run_in_submission_order(tmp_path):
+    loop = MainLoop()
+    queue = ExportQueue(loop.dispatch, workers=1)
+    image = noise_image()
+    updates, on_update = recorder()
+    jobs = [queue.submit(image, 0.0, (i * 10, 0, i * 10 + 50, 40), str(tmp_path / f'{i}.png'),
+                         'PNG', on_update=on_update) for i in range(5)]
+    queue.shutdown()
+    assert [job.id for job in jobs] == [1, 2, 3, 4, 5]
+    assert queue.jobs == jobs
+    # 回调只在drain()（主线程）中执行
+    assert updates == []
+    loop.drain()
+    done_order = [job_id for job_id, status in updates if status == ExportJob.DONE]
+    assert done_order == [1, 2, 3, 4, 5]
+    for i, job in enumerate(jobs):
+        assert statuses(updates, job) == [ExportJob.QUEUED, ExportJob.CROPPING,
+                                          ExportJob.ENCODING, ExportJob.DONE]
+        assert job.output_bytes == os.path.getsize(job.filename)
+        with Image.open(job.filename) as saved:
+            assert np.array_equal(np.asarray(saved),
+                                  np.asarray(image.crop((i * 10, 0, i * 10 + 50, 40))))
+
+
+def test_failed_job_does_not_block_later_jobs(tmp_path):
+    loop = MainLoop()
+    queue = ExportQueue(loop.dispatch, workers=1)
+    image = noise_image()
+    updates, on_update = recorder()
+    bad = queue.submit(image, 0.0, (0, 0, 50, 50), str(tmp_path / 'missing' / 'a.png'), 'PNG',
+                       on_update=on_update)
+    good = queue.submit(image, 0.0, (0, 0, 50, 50), str(tmp_path / 'b.png'), 'PNG',
+                        on_update=on_update)
+    queue.shutdown()
+    loop.drain()
+    assert bad.status == ExportJob.FAILED and bad.error
+    assert statuses(updates, bad)[-1] == ExportJob.FAILED
+    assert good.status == ExportJob.DONE and os.path.exists(good.filename)
+    assert "失败" in bad.describe() and "KB" in good.describe()
+
+
+def test_failed_decode_fails_the_group_only(tmp_path):
+    loop = MainLoop()
+    queue = ExportQueue(loop.dispatch, workers=2)
+    updates, on_update = recorder()
+
+    def broken():
+        raise OSError("cannot decode")
+
+    items = [((0, 0, 10, 10), str(tmp_path / f'{i}.png'), 'PNG', None) for i in range(2)]
+    failed = queue.submit_group(broken, 0.0, items, on_update)
+    later = queue.submit(noise_image, 0.0, (0, 0, 10, 10), str(tmp_path / 'c.png'), 'PNG',
+                         on_update=on_update)
+    queue.shutdown()
+    loop.drain()
+    for job in failed:
+        assert job.status == ExportJob.FAILED and job.error == "cannot decode"
+        assert statuses(updates, job) == [ExportJob.QUEUED, ExportJob.DECODING, ExportJob.FAILED]
+    assert statuses(updates, later) == [ExportJob.QUEUED, ExportJob.DECODING, ExportJob.CROPPING,
+                                        ExportJob.ENCODING, ExportJob.DONE]
+
+
+def test_group_decodes_source_once(tmp_path):
+    queue = ExportQueue(lambda func, *args: func(*args), workers=3)
+    image = noise_image()
+    calls = []
+
+    def source():
+        calls.append(1)
+        return image
+
+    boxes = [(0, 0, 100, 100), (50, 50, 200, 150), (100, 20, 320, 240)]
+    items = [(box, str(tmp_path / f'{i}.png'), 'PNG', None) for i, box in enumerate(boxes)]
+    jobs = queue.submit_group(source, 12.5, items)
+    queue.shutdown()
+    assert calls == [1]
+    for job, box in zip(jobs, boxes):
+        assert job.status == ExportJob.DONE
+        with Image.open(job.filename) as saved:
+            expected = crop_rotated(image, 12.5, box)
+            assert np.array_equal(np.asarray(saved), np.asarray(expected))
+
+
+def test_pending_and_clear_finished(tmp_path):
+    queue = ExportQueue(lambda func, *args: None, workers=1)
+    release = threading.Event()
+
+    def source():
+        release.wait(10)
+        return noise_image()
+
+    first = queue.submit(source, 0.0, (0, 0, 10, 10), str(tmp_path / 'a.png'), 'PNG')
+    second = queue.submit(noise_image(), 0.0, (0, 0, 10, 10), str(tmp_path / 'b.png'), 'PNG')
+    assert queue.pending() == 2
+    assert queue.clear_finished() == []
+    release.set()
+    queue.shutdown()
+    assert queue.pending() == 0
+    assert queue.clear_finished() == [first, second]
+    assert queue.jobs == []
+
+
+@pytest.mark.parametrize('responsive', [False, True])
+def test_sidecar_is_written_after_success(tmp_path, responsive):
+    source = tmp_path / 'source.png'
+    noise_image().save(source)
+    recipe = make_recipe(str(source), 0, 0.0, (10, 10, 210, 110), (2, 1), 'PNG')
+    queue = ExportQueue(lambda func, *args: func(*args), workers=1)
+    with Image.open(source) as image:
+        image.load()
+        if responsive:
+            job = queue.submit_responsive(image, 0.0, (10, 10, 210, 110), str(tmp_path), 'crop',
+                                          'PNG', [200, 100], recipe=recipe)
+        else:
+            job = queue.submit(image, 0.0, (10, 10, 210, 110), str(tmp_path / 'crop.png'),
+                               'PNG', recipe=recipe)
+        queue.shutdown()
+    assert job.status == ExportJob.DONE
+    data = load_sidecar(sidecar_path(job.filename))
+    assert data["recipe"]["output"] == os.path.basename(job.filename)
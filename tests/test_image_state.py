@@ -0,0 +1,137 @@
+"""image_state：显示图像与底图共用缓冲区、变换不修改共用的原图、缓冲区字节数的统计"""
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from image_state import ImageState, image_nbytes, transpose_quarter_turns
+from mapped import open_mapped
+
+SIZE = (120, 80)
+
+
+def noise_image(mode='RGB', size=SIZE, seed=0):
+    rng = np.random.default_rng(seed)
+    width, height = size
+    return Image.fromarray(rng.integers(0, 256, (height, width, 3), dtype=np.uint8)).convert(mode)
+
+
+def pixels(image):
+    return np.asarray(image).copy()
+
+
+@pytest.mark.parametrize('mode,pixel_size', [('1', 1), ('L', 1), ('P', 1), ('I;16', 2),
+                                             ('LA', 4), ('RGB', 4), ('RGBA', 4), ('F', 4)])
+def test_image_nbytes(mode, pixel_size):
+    assert image_nbytes(Image.new(mode, (30, 20))) == 30 * 20 * pixel_size
+    assert image_nbytes(None) == 0
+
+
+def test_display_shares_the_original_buffer():
+    image = noise_image()
+    state = ImageState()
+    state.load(image, image.size, 'PNG', True)
+    assert state.display is image and state.raster is image and state.display_shared
+    assert state.buffers() == {'original': image_nbytes(image)}
+    assert state.held_bytes == state.peak_bytes == image_nbytes(image)
+    # 设置为底图本身仍然共用
+    state.set_display(image)
+    assert state.display_shared and state.held_bytes == image_nbytes(image)
+
+
+def test_edit_does_not_mutate_shared_original():
+    image = noise_image()
+    before = pixels(image)
+    state = ImageState()
+    state.load(image, image.size, 'PNG', True)
+
+    rotated = state.raster.rotate(30, expand=True)
+    state.set_display(rotated, rotated.size)
+    assert not state.display_shared and state.display is rotated
+    assert state.display_size == rotated.size
+    assert np.array_equal(pixels(state.original), before)
+    assert state.buffers() == {'original': image_nbytes(image), 'display': image_nbytes(rotated)}
+    assert state.peak_bytes == image_nbytes(image) + image_nbytes(rotated)
+
+    state.set_display(None)
+    assert state.display is image and state.held_bytes == image_nbytes(image)
+    assert state.display_size == image.size
+
+
+def test_rotate_and_undo_restore_pixels_and_accounting():
+    image = noise_image()
+    before = pixels(image)
+    state = ImageState()
+    state.load(image, image.size, 'PNG', True)
+    state.set_display(image.rotate(10))
+    held = image_nbytes(image)
+
+    state.rotate_quarter(1)
+    assert state.original is not image
+    # 旧缓冲区没有被原地修改
+    assert np.array_equal(pixels(image), before)
+    assert np.array_equal(pixels(state.original),
+                          pixels(image.transpose(Image.Transpose.ROTATE_90)))
+    assert state.full_size == (SIZE[1], SIZE[0]) and state.display_shared
+    assert state.buffers() == {'original': held}
+    # 转置时新旧两份底图和旧的显示图像同时存在
+    assert state.peak_bytes == 3 * held
+
+    # 反向旋转撤销：像素、尺寸和字节数都回到原样
+    state.rotate_quarter(-1)
+    assert state.quarter_turns == 0 and state.full_size == SIZE
+    assert np.array_equal(pixels(state.original), before)
+    assert state.held_bytes == held and state.peak_bytes == 3 * held
+
+
+def test_lazy_full_resolution_replays_quarter_turns():
+    full = noise_image(size=(480, 320))
+    preview = full.reduce(4)
+    state = ImageState()
+    state.load(preview, full.size, 'JPEG', False)
+    assert state.original is None and state.base is preview
+    assert state.held_bytes == image_nbytes(preview)
+
+    state.rotate_quarter(3)
+    state.rotate_quarter(2)
+    assert state.quarter_turns == 5 and state.full_size == (320, 480)
+    state.set_display(state.raster.rotate(5))
+
+    before = pixels(full)
+    state.set_full(full)
+    expected = transpose_quarter_turns(full, 5)
+    assert np.array_equal(pixels(state.original), pixels(expected))
+    assert np.array_equal(pixels(full), before)
+    assert state.preview is None and state.display_shared
+    assert state.buffers() == {'original': image_nbytes(full)}
+    assert state.peak_bytes >= image_nbytes(full) + image_nbytes(preview)
+
+
+def test_region_source_keeps_preview_and_reports_no_heap(tmp_path):
+    full = noise_image(size=(480, 320))
+    path = tmp_path / 'image.npy'
+    np.save(path, np.asarray(full))
+    source = open_mapped(str(path))
+    preview = source.preview((120, 80))
+    state = ImageState()
+    state.load(preview, source.size, 'NPY', False)
+    state.set_full(source)
+    assert state.region_source is source and state.raster is preview
+    assert state.buffers() == {'mapped': 0, 'preview': image_nbytes(preview)}
+
+    state.rotate_quarter(1)
+    assert state.original.size == (320, 480) and state.preview.size == (80, 120)
+    assert np.array_equal(pixels(state.original.crop((0, 0, 320, 480))),
+                          pixels(full.transpose(Image.Transpose.ROTATE_90)))
+    assert state.held_bytes == image_nbytes(preview)
+
+
+def test_clear_releases_everything_but_keeps_peak():
+    image = noise_image()
+    state = ImageState()
+    state.load(image, image.size, 'PNG', True)
+    state.clear()
+    assert state.buffers() == {} and state.held_bytes == 0
+    assert state.peak_bytes == image_nbytes(image)
+    assert "无" in state.memory_summary()
+    assert "tiles 1.0" in state.memory_summary({"tiles": 1024 * 1024})
@@ -0,0 +1,124 @@
+"""mapped：内存映射的裁剪、90度旋转和预览与Pillow解码整张图像后的结果相同"""
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from mapped import MappedImage, open_mapped
+
+SIZE = (173, 131)
+
+# 部分超出图像的裁剪框与PIL一样填充为0
+BOXES = [(0, 0, 173, 131), (17, 9, 18, 10), (40, 30, 160, 101), (-5, -7, 60, 40),
+         (150, 120, 190, 140), (200, 10, 220, 20)]
+
+
+def noise_array(bands, seed=0):
+    rng = np.random.default_rng(seed)
+    width, height = SIZE
+    shape = (height, width) if bands == 1 else (height, width, bands)
+    return rng.integers(0, 256, shape, dtype=np.uint8)
+
+
+def make_image(mode):
+    if mode == 'P':
+        image = Image.fromarray(noise_array(1)).convert('P')
+        palette = np.random.default_rng(1).integers(0, 256, 768, dtype=np.uint8)
+        image.putpalette(palette.tobytes())
+        return image
+    return Image.fromarray(noise_array(len(mode)), mode)
+
+
+def write(tmp_path, extension, mode, **params):
+    path = tmp_path / f'input.{extension}'
+    if extension == 'npy':
+        np.save(path, noise_array(len(mode)))
+    else:
+        make_image(mode).save(path, **params)
+    return str(path)
+
+
+def decode(path):
+    if path.endswith('.npy'):
+        return Image.fromarray(np.load(path))
+    with Image.open(path) as image:
+        image.load()
+        return image
+
+
+def pixels(image):
+    return np.asarray(image.convert('RGBA'))
+
+
+CASES = [('bmp', 'L'), ('bmp', 'P'), ('bmp', 'RGB'), ('bmp', 'RGBA'),
+         ('ppm', 'RGB'), ('pgm', 'L'),
+         ('tif', 'L'), ('tif', 'RGB'), ('tif', 'RGBA'),
+         ('npy', 'L'), ('npy', 'LA'), ('npy', 'RGB'), ('npy', 'RGBA')]
+
+
+@pytest.fixture(params=CASES, ids=lambda case: '-'.join(case))
+def mapped_file(request, tmp_path):
+    extension, mode = request.param
+    path = write(tmp_path, extension, mode)
+    image = open_mapped(path)
+    assert isinstance(image, MappedImage)
+    return image, decode(path)
+
+
+def test_size_and_mode(mapped_file):
+    image, reference = mapped_file
+    assert image.size == reference.size == SIZE
+    assert image.mode == reference.mode
+
+
+@pytest.mark.parametrize('box', BOXES)
+def test_crop_matches_pillow(mapped_file, box):
+    image, reference = mapped_file
+    cropped = image.crop(box)
+    expected = reference.crop(box)
+    assert cropped.mode == expected.mode and cropped.size == expected.size
+    assert np.array_equal(pixels(cropped), pixels(expected))
+
+
+@pytest.mark.parametrize('method', [Image.Transpose.ROTATE_90, Image.Transpose.ROTATE_180,
+                                    Image.Transpose.ROTATE_270])
+def test_transpose_matches_pillow(mapped_file, method):
+    image, reference = mapped_file
+    turned = image.transpose(method)
+    expected = reference.transpose(method)
+    assert turned.size == expected.size
+    box = (3, 5, expected.width - 7, expected.height - 2)
+    assert np.array_equal(pixels(turned.crop(box)), pixels(expected.crop(box)))
+
+
+@pytest.mark.parametrize('target', [(173, 131), (40, 40), (20, 30), (1, 1)])
+def test_preview_matches_row_sampling_and_reduce(mapped_file, target):
+    """每隔factor行取一行，行内用reduce()平均（调色板图像隔点采样）"""
+    image, reference = mapped_file
+    preview = image.preview(target)
+    factor = max(1, min(SIZE[0] // target[0], SIZE[1] // target[1]))
+    array = np.asarray(reference)
+    if reference.mode == 'P':
+        expected = Image.fromarray(array[::factor, ::factor], 'P')
+        expected.putpalette(reference.getpalette())
+    else:
+        expected = Image.fromarray(array[::factor], reference.mode).reduce((factor, 1))
+    assert preview.size == expected.size
+    assert preview.width >= min(target[0], SIZE[0]) and preview.height >= min(target[1], SIZE[1])
+    assert np.array_equal(pixels(preview), pixels(expected))
+
+
+def test_progress_reaches_one(tmp_path):
+    image = open_mapped(write(tmp_path, 'bmp', 'RGB'))
+    fractions = []
+    image.preview((10, 10), fractions.append)
+    assert fractions and fractions[-1] == 1.0
+
+
+def test_unsupported_files_return_none(tmp_path):
+    assert open_mapped(write(tmp_path, 'tif', 'RGB', compression='tiff_lzw')) is None
+    assert open_mapped(write(tmp_path, 'png', 'RGB')) is None
+    path = tmp_path / 'float.npy'
+    np.save(path, np.zeros((4, 4), dtype=np.float32))
+    assert open_mapped(str(path)) is None
+    assert open_mapped(str(tmp_path / 'missing.bmp')) is None
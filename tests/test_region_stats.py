@@ -0,0 +1,105 @@
+"""region_stats：积分图查出的统计与直接在Pillow裁剪结果上计算的numpy平均值相同"""
+
+import numpy as np
+import pytest
+from PIL import Image
+
+import region_stats
+from region_stats import (CLIP_LEVEL, LUMA_WEIGHTS, RegionStats, box_sum, format_stats,
+                          integral_image)
+
+
+def noise_image(width, height, mode='RGB', seed=0):
+    rng = np.random.default_rng(seed)
+    array = rng.integers(0, 256, (height, width, 3), dtype=np.uint8)
+    return Image.fromarray(array).convert(mode)
+
+
+def reference_stats(image):
+    """在裁剪结果上直接计算的统计"""
+    rgb = np.asarray(image.convert('RGB')).astype(np.float64)
+    channels = rgb.reshape(-1, 3).mean(axis=0)
+    luma = rgb.astype(np.float32) @ np.array(LUMA_WEIGHTS, dtype=np.float32)
+    return {
+        "mean": float(np.dot(LUMA_WEIGHTS, channels)),
+        "channels": channels,
+        "clipped": float((rgb.max(axis=2) >= CLIP_LEVEL).mean() * 100),
+        "luma": luma,
+    }
+
+
+def laplacian_energy(luma):
+    """整张图像的拉普拉斯平方（边缘一圈为0）"""
+    result = np.zeros_like(luma)
+    result[1:-1, 1:-1] = (4 * luma[1:-1, 1:-1] - luma[:-2, 1:-1] - luma[2:, 1:-1] -
+                          luma[1:-1, :-2] - luma[1:-1, 2:])
+    return np.square(result.astype(np.float64))
+
+
+def test_box_sum_matches_numpy_sum():
+    array = np.random.default_rng(3).integers(0, 1000, (37, 53))
+    table = integral_image(array, np.int64)
+    rng = np.random.default_rng(4)
+    for _ in range(200):
+        x1, x2 = sorted(rng.integers(0, 54, 2))
+        y1, y2 = sorted(rng.integers(0, 38, 2))
+        assert box_sum(table, x1, y1, x2, y2) == array[y1:y2, x1:x2].sum()
+
+
+@pytest.mark.parametrize('mode', ['RGB', 'L', 'RGBA', 'P'])
+def test_stats_match_crop(mode):
+    image = noise_image(120, 90, mode)
+    stats = RegionStats(image)
+    energy = laplacian_energy(reference_stats(image)["luma"])
+    rng = np.random.default_rng(5)
+    for _ in range(50):
+        x1, x2 = sorted(rng.choice(121, 2, replace=False))
+        y1, y2 = sorted(rng.choice(91, 2, replace=False))
+        result = stats.stats((x1, y1, x2, y2))
+        expected = reference_stats(image.crop((x1, y1, x2, y2)))
+        assert result["mean"] == pytest.approx(expected["mean"])
+        assert result["channels"] == pytest.approx(tuple(expected["channels"]))
+        assert result["clipped"] == pytest.approx(expected["clipped"])
+        assert result["sharpness"] == pytest.approx(energy[y1:y2, x1:x2].mean(), rel=1e-4)
+
+
+def test_box_is_scaled_from_full_resolution():
+    image = noise_image(100, 50)
+    stats = RegionStats(image, (400, 200))
+    expected = reference_stats(image.crop((10, 5, 60, 45)))
+    result = stats.stats((40, 20, 240, 180))
+    assert result["channels"] == pytest.approx(tuple(expected["channels"]))
+
+
+def test_reversed_and_out_of_bounds_boxes_are_clamped():
+    image = noise_image(80, 60)
+    stats = RegionStats(image)
+    assert stats.stats((70, 50, -10, 20)) == stats.stats((0, 20, 70, 50))
+    assert stats.stats((20, 10, 20, 40)) is None
+    assert stats.stats((90, 0, 120, 60)) is None
+
+
+def test_large_images_are_reduced_before_building(monkeypatch):
+    monkeypatch.setattr(region_stats, 'STATS_MAX_PIXELS', 1000)
+    image = noise_image(120, 90)
+    stats = RegionStats(image)
+    assert stats.size == image.reduce(4).size
+    expected = reference_stats(image.reduce(4))
+    result = stats.stats((0, 0, 120, 90))
+    assert result["channels"] == pytest.approx(tuple(expected["channels"]))
+
+
+def test_format_stats():
+    assert format_stats(None) == "亮度: -"
+    text = format_stats({"mean": 12.34, "channels": (1.0, 2.0, 3.0), "clipped": 0.5,
+                         "sharpness": 7.0})
+    assert "12.3" in text and "1/2/3" in text and "0.50%" in text
+
+
+@pytest.mark.parametrize('mode', ['L', 'LA', 'RGBA', 'P'])
+def test_reducing_before_converting_keeps_sums(monkeypatch, mode):
+    monkeypatch.setattr(region_stats, 'STATS_MAX_PIXELS', 1000)
+    image = noise_image(120, 90, mode)
+    stats = RegionStats(image)
+    expected = integral_image(np.asarray(image.convert('RGB').reduce(4)), np.uint32)
+    assert np.array_equal(stats.channels[..., :3], expected)
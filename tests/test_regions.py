@@ -0,0 +1,100 @@
+"""regions：各区域的导出框和一次解码导出的结果与Pillow的crop()相同，包括超出图像边缘的区域"""
+
+import os
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from export_queue import ExportJob, ExportQueue
+from mapped import open_mapped
+from regions import CropRegion, new_region_name, region_at, region_filenames
+
+SIZE = (240, 180)
+
+# 内部、反向拖出、越过各条边、小数坐标的区域
+RECTS = [[20, 30, 120, 90], [200.7, 170.2, 150.4, 100.9], [-40, -25, 60, 50],
+         [180, 140, 300, 260], [-10, 60, 250, 80], [0, 0, 240, 180]]
+
+
+def noise_image(seed=0):
+    rng = np.random.default_rng(seed)
+    width, height = SIZE
+    return Image.fromarray(rng.integers(0, 256, (height, width, 3), dtype=np.uint8))
+
+
+def pillow_reference(image, rect):
+    """Pillow直接crop()原始框（越界部分填0），再去掉图像外的部分"""
+    x1, y1, x2, y2 = (int(v) for v in rect)
+    x1, x2 = sorted((x1, x2))
+    y1, y2 = sorted((y1, y2))
+    raw = image.crop((x1, y1, x2, y2))
+    inner = (max(0, -x1), max(0, -y1), min(x2, SIZE[0]) - x1, min(y2, SIZE[1]) - y1)
+    return raw.crop(inner)
+
+
+@pytest.mark.parametrize('rect', RECTS)
+def test_export_box_matches_pillow_crop(rect):
+    image = noise_image()
+    box = CropRegion("区域 1", rect).export_box(SIZE)
+    x1, y1, x2, y2 = box
+    assert 0 <= x1 < x2 <= SIZE[0] and 0 <= y1 < y2 <= SIZE[1]
+    expected = pillow_reference(image, rect)
+    assert np.array_equal(np.asarray(image.crop(box)), np.asarray(expected))
+
+
+def test_export_box_outside_or_missing_is_none():
+    assert CropRegion("a").export_box(SIZE) is None
+    assert CropRegion("a", [250, 10, 300, 50]).export_box(SIZE) is None
+    assert CropRegion("a", [10, -30, 50, -1]).export_box(SIZE) is None
+    assert CropRegion("a", [10, 10, 10, 50]).export_box(SIZE) is None
+
+
+@pytest.mark.parametrize('mapped', [False, True])
+def test_group_export_matches_pillow_crop(tmp_path, mapped):
+    """与界面“导出全部区域”相同：region_filenames命名，submit_group共用一次解码"""
+    image = noise_image()
+    source = image
+    if mapped:
+        path = tmp_path / 'source.npy'
+        np.save(path, np.asarray(image))
+        source = open_mapped(str(path))
+    regions = [CropRegion(f"区域 {i}", rect) for i, rect in enumerate(RECTS, 1)]
+    boxes = [region.export_box(SIZE) for region in regions]
+    filenames = region_filenames(str(tmp_path), 'crop', [region.name for region in regions],
+                                 '.png')
+    queue = ExportQueue(lambda func, *args: func(*args), workers=3)
+    jobs = queue.submit_group(lambda: source, 0.0,
+                              [(box, filename, 'PNG', None)
+                               for box, filename in zip(boxes, filenames)])
+    queue.shutdown()
+    for job, region in zip(jobs, regions):
+        assert job.status == ExportJob.DONE
+        with Image.open(job.filename) as saved:
+            expected = pillow_reference(image, region.rect)
+            assert np.array_equal(np.asarray(saved), np.asarray(expected))
+
+
+def test_region_at_prefers_latest_and_honours_exclude():
+    regions = [CropRegion("a", [0, 0, 100, 100]), CropRegion("b", [50, 50, 150, 150]),
+               CropRegion("c")]
+    assert region_at(regions, 75, 75) == 1
+    assert region_at(regions, 75, 75, exclude=1) == 0
+    assert region_at(regions, 10, 10) == 0
+    # 边上的点不算在区域内
+    assert region_at(regions, 100, 20) is None
+    assert region_at(regions, 200, 200) is None
+
+
+def test_new_region_name_fills_gaps():
+    regions = [CropRegion("区域 1"), CropRegion("区域 3")]
+    assert new_region_name(regions) == "区域 2"
+    assert new_region_name([]) == "区域 1"
+
+
+def test_region_filenames_are_safe_and_unique():
+    names = ["封面 1", "a/b", "a b", "***", ""]
+    result = [os.path.basename(path)
+              for path in region_filenames('out', 'crop', names, '.jpg')]
+    assert result == ['crop_封面_1.jpg', 'crop_a_b.jpg', 'crop_a_b_1.jpg', 'crop_region.jpg',
+                      'crop_region_1.jpg']
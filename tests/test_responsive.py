@@ -0,0 +1,115 @@
+"""responsive：逐级缩小的结果与Pillow直接缩放一致，所有宽度都超过裁剪结果时按原宽度输出"""
+
+import json
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from batch import CropSpec, process_one, run_batch
+from export_queue import ExportJob, ExportQueue
+from responsive import export_responsive, parse_widths, resize_chain, responsive_filename
+
+
+def noise_image(width, height, mode='RGB', seed=0):
+    rng = np.random.default_rng(seed)
+    image = Image.fromarray(rng.integers(0, 256, (height, width, 3), dtype=np.uint8))
+    # 平滑一下，逐级缩小与直接缩放的差别只来自盒式滤波，不被噪声放大
+    image = image.resize((width // 8, height // 8)).resize((width, height), Image.BILINEAR)
+    return image.convert(mode)
+
+
+def test_parse_widths():
+    assert parse_widths("640, 1920,640,320") == [1920, 640, 320]
+    with pytest.raises(ValueError):
+        parse_widths("640,0")
+
+
+@pytest.mark.parametrize('mode', ['RGB', 'L', 'P', 'CMYK'])
+def test_chain_matches_direct_resize(mode):
+    image = noise_image(1600, 1000, mode)
+    reference_source = image if mode in ('RGB', 'L') else image.convert('RGB')
+    results = list(resize_chain(image, [1600, 800, 333, 50, 2000]))
+    assert [width for width, _ in results] == [1600, 800, 333, 50]
+    for width, resized in results:
+        height = max(1, round(1000 * width / 1600))
+        assert resized.size == (width, height)
+        reference = reference_source.resize((width, height), Image.Resampling.LANCZOS)
+        diff = np.abs(np.asarray(resized, dtype=np.int16) - np.asarray(reference, dtype=np.int16))
+        assert diff.mean() < 2.0
+
+
+def test_all_widths_wider_than_crop_emit_native_width():
+    image = noise_image(300, 200)
+    results = list(resize_chain(image, [1920, 640]))
+    assert len(results) == 1
+    width, resized = results[0]
+    assert width == 300 and resized.size == (300, 200)
+    assert np.array_equal(np.asarray(resized), np.asarray(image))
+
+
+@pytest.mark.parametrize('workers', [1, 3])
+def test_export_writes_files_and_manifest(tmp_path, workers):
+    image = noise_image(640, 480)
+    manifest = export_responsive(image, [640, 320, 100], str(tmp_path), 'crop', 'PNG',
+                                 workers=workers, source='in.png')
+    assert [entry["width"] for entry in manifest["files"]] == [640, 320, 100]
+    with open(tmp_path / 'crop.json') as f:
+        assert json.load(f) == manifest
+    for entry in manifest["files"]:
+        path = tmp_path / entry["file"]
+        assert path.stat().st_size == entry["bytes"]
+        with Image.open(path) as saved:
+            assert saved.size == (entry["width"], entry["height"])
+    with Image.open(tmp_path / responsive_filename('crop', 640, 'PNG')) as saved:
+        assert np.array_equal(np.asarray(saved), np.asarray(image))
+
+
+def test_export_too_wide_writes_native_width(tmp_path):
+    manifest = export_responsive(noise_image(200, 100), [1920, 1280], str(tmp_path), 'crop',
+                                 'JPEG', {"quality": 90})
+    assert [(entry["width"], entry["height"]) for entry in manifest["files"]] == [(200, 100)]
+    assert manifest["files"][0]["bytes"] > 0
+    assert (tmp_path / responsive_filename('crop', 200, 'JPEG')).exists()
+
+
+def test_batch_widths_wider_than_crop(tmp_path):
+    path = tmp_path / 'input.png'
+    noise_image(400, 300).save(path)
+    task = (str(path), str(tmp_path / 'out' / 'input.jpg'), 'JPEG',
+            CropSpec(box=(50, 50, 250, 150)), {}, [1920, 640])
+    _, _, output_bytes, error = process_one(task)
+    assert error is None and output_bytes > 0
+    with Image.open(tmp_path / 'out' / 'input_200w.jpg') as saved:
+        assert saved.size == (200, 100)
+
+
+def test_export_queue_widths_wider_than_crop(tmp_path):
+    queue = ExportQueue(lambda func, *args: func(*args), workers=1)
+    job = queue.submit_responsive(noise_image(400, 300), 0.0, (0, 0, 120, 90), str(tmp_path),
+                                  'crop', 'PNG', [1920])
+    queue.shutdown()
+    assert job.status == ExportJob.DONE and job.output_bytes > 0
+    with Image.open(tmp_path / 'crop_120w.png') as saved:
+        assert saved.size == (120, 90)
+
+
+def test_batch_widths_same_stem_keeps_every_manifest(tmp_path):
+    inputs = []
+    for extension in ('png', 'bmp', 'tif'):
+        path = tmp_path / f'x.{extension}'
+        noise_image(400, 300, seed=len(inputs)).save(path)
+        inputs.append(str(path))
+    output_dir = tmp_path / 'out'
+    stats = run_batch(inputs, CropSpec(ratio=(1, 1)), str(output_dir), workers=1,
+                      prefix='crop', widths=[100])
+    assert stats["images"] == 3 and stats["failed"] == 0
+    manifests = sorted(p.name for p in output_dir.glob('*.json'))
+    assert manifests == ['crop_x.json', 'crop_x_1.json', 'crop_x_2.json']
+    sources = set()
+    for name in manifests:
+        with open(output_dir / name) as f:
+            manifest = json.load(f)
+        sources.add(manifest["source"])
+        assert (output_dir / manifest["files"][0]["file"]).exists()
+    assert sources == set(inputs)
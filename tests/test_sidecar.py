@@ -0,0 +1,138 @@
+"""sidecar：清单路径、按方案渲染与Pillow比较、plan()/rebuild_one()的跳过和重建判断"""
+
+import os
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from sidecar import (collect_sidecars, load_sidecar, make_recipe, plan, rebuild_one,
+                     run_rebuild, sidecar_path, write_sidecar)
+
+RECT = (20, 30, 220, 180)
+
+
+@pytest.fixture
+def source(tmp_path):
+    path = tmp_path / 'source.png'
+    rng = np.random.default_rng(0)
+    Image.fromarray(rng.integers(0, 256, (300, 400, 3), dtype=np.uint8)).save(path)
+    return str(path)
+
+
+def export(source, directory, name, output_format='PNG', quarter_turns=0, rotation=0.0,
+           rect=RECT, widths=None):
+    """模拟导出队列：按方案渲染一次并写入清单，返回清单路径"""
+    recipe = make_recipe(source, quarter_turns, rotation, rect, (4, 3), output_format,
+                         widths=widths)
+    output = os.path.join(directory, name)
+    recipe = dict(recipe, output=name)
+    filename = sidecar_path(output)
+    data = {"version": 1, "recipe": recipe, "source": {}, "built": {}}
+    _, status, _, error = rebuild_one((filename, data, recipe, None, None, True))
+    assert status == 'built' and error is None
+    return filename
+
+
+def set_mtime(path, delta_ns):
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + delta_ns))
+
+
+def test_sidecar_names_keep_the_full_output_name(tmp_path, source):
+    recipe = make_recipe(source, 0, 0.0, RECT, None, 'PNG')
+    for name in ('a.jpg', 'a.png', 'a.json'):
+        write_sidecar(recipe, str(tmp_path / name))
+    assert sorted(os.path.basename(p) for p in collect_sidecars([str(tmp_path)])) == [
+        'a.jpg.crop.json', 'a.json.crop.json', 'a.png.crop.json']
+    assert load_sidecar(str(tmp_path / 'a.png.crop.json'))['recipe']['output'] == 'a.png'
+
+
+@pytest.mark.parametrize('quarter_turns,rotation,transpose', [
+    (0, 0.0, None),
+    (1, 0.0, Image.Transpose.ROTATE_90),
+    (3, 180.0, Image.Transpose.ROTATE_90),
+])
+def test_render_matches_pillow(tmp_path, source, quarter_turns, rotation, transpose):
+    export(source, str(tmp_path), 'out.png', quarter_turns=quarter_turns, rotation=rotation)
+    with Image.open(source) as image:
+        expected = image.rotate(90 * quarter_turns, expand=True)
+        expected = expected.rotate(rotation, expand=True).crop(RECT)
+    with Image.open(tmp_path / 'out.png') as result:
+        assert np.array_equal(np.asarray(result), np.asarray(expected))
+
+
+def test_responsive_render_matches_pillow_resize(tmp_path, source):
+    export(source, str(tmp_path), 'multi.json', widths=[100])
+    with Image.open(source) as image:
+        crop = image.crop(RECT)
+    with Image.open(tmp_path / 'multi_100w.png') as result:
+        assert result.size == (100, 75)
+        reference = np.asarray(crop.resize(result.size, Image.LANCZOS), dtype=np.int16)
+        assert np.abs(np.asarray(result, dtype=np.int16) - reference).max() <= 2
+
+
+def test_plan_skips_unchanged_tree_using_stat_only(tmp_path, source):
+    filename = export(source, str(tmp_path), 'out.png')
+    assert plan(filename) is None
+    # 强制重建、输出被删除或方案改变时需要重建，此时源文件的哈希仍然可用
+    assert plan(filename, force=True) is not None
+    _, _, recipe, source_hash, _, _ = plan(filename, output_format='JPEG')
+    assert recipe['output'] == 'out.jpg' and source_hash is not None
+    os.remove(tmp_path / 'out.png')
+    assert plan(filename)[3] is not None
+
+
+def test_quality_override_only_affects_jpeg(tmp_path, source):
+    png = export(source, str(tmp_path), 'out.png')
+    jpeg = export(source, str(tmp_path), 'out.jpg', output_format='JPEG')
+    assert plan(png, quality=50) is None
+    assert plan(jpeg, quality=50)[2]['params'] == {'quality': 50}
+
+
+def test_touched_source_is_rehashed_once_then_skipped(tmp_path, source):
+    filename = export(source, str(tmp_path), 'out.png')
+    set_mtime(source, 10 ** 9)
+    task = plan(filename)
+    assert task is not None and task[3] is None
+    _, status, _, _ = rebuild_one(task)
+    assert status == 'skipped'
+    # 新的修改时间已经记录，之后只需要stat
+    assert plan(filename) is None
+
+
+def test_changed_source_is_rebuilt(tmp_path, source):
+    filename = export(source, str(tmp_path), 'out.png')
+    Image.new('RGB', (400, 300), (1, 2, 3)).save(source)
+    set_mtime(source, 10 ** 9)
+    _, status, _, error = rebuild_one(plan(filename))
+    assert status == 'built' and error is None
+    with Image.open(tmp_path / 'out.png') as result:
+        assert result.getpixel((0, 0)) == (1, 2, 3)
+    assert plan(filename) is None
+
+
+def test_format_override_moves_the_sidecar_with_the_output(tmp_path, source):
+    filename = export(source, str(tmp_path), 'out.png')
+    _, status, _, _ = rebuild_one(plan(filename, output_format='JPEG'))
+    assert status == 'built'
+    assert not os.path.exists(filename)
+    moved = str(tmp_path / 'out.jpg.crop.json')
+    assert load_sidecar(moved)['recipe']['format'] == 'JPEG'
+    assert plan(moved) is None
+
+
+def test_run_rebuild_counts_and_conflicts(tmp_path, source):
+    directory = str(tmp_path)
+    export(source, directory, 'a.png')
+    export(source, directory, 'b.png', quarter_turns=2)
+    sidecars = collect_sidecars([directory])
+    stats = run_rebuild(sidecars, workers=1)
+    assert (stats['built'], stats['skipped'], stats['failed']) == (0, 2, 0)
+    stats = run_rebuild(sidecars, workers=1, force=True)
+    assert (stats['built'], stats['skipped'], stats['failed']) == (2, 0, 0)
+
+    # a.png 和 a.jpg 改为同一格式时输出相同，第二个报告失败而不是互相覆盖
+    export(source, directory, 'a.jpg', output_format='JPEG')
+    stats = run_rebuild(collect_sidecars([directory]), workers=1, output_format='PNG')
+    assert stats['failed'] == 1
@@ -0,0 +1,109 @@
+"""streaming：按条带读取和写入的结果与Pillow解码后直接crop()相同"""
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from export import save_image
+import streaming
+from streaming import open_stream, stream_crop
+
+BOXES = [(0, 0, 157, 203), (13, 7, 14, 8), (5, 60, 150, 61), (31, 17, 140, 190)]
+
+
+def noise_image(mode, size=(157, 203), seed=0):
+    rng = np.random.default_rng(seed)
+    width, height = size
+    if mode in ('1', 'L', 'P'):
+        image = Image.fromarray(rng.integers(0, 256, (height, width), dtype=np.uint8), 'L')
+        if mode == '1':
+            return image.convert('1')
+        if mode == 'P':
+            image = image.convert('P')
+            image.putpalette(rng.integers(0, 256, 768, dtype=np.uint8).tobytes())
+        return image
+    bands = len(mode)
+    return Image.fromarray(rng.integers(0, 256, (height, width, bands), dtype=np.uint8), mode)
+
+
+def pixels(image):
+    """转换为RGBA比较，与保存时的模式转换（如1位转为8位）无关"""
+    return np.asarray(image.convert('RGBA'))
+
+
+def write(tmp_path, image, extension, **params):
+    path = tmp_path / f'input.{extension}'
+    image.save(path, **params)
+    return str(path)
+
+
+CASES = [('png', 'L'), ('png', 'LA'), ('png', 'RGB'), ('png', 'RGBA'), ('png', 'P'),
+         ('bmp', '1'), ('bmp', 'L'), ('bmp', 'P'), ('bmp', 'RGB')]
+
+
+@pytest.mark.parametrize('extension,mode', CASES)
+@pytest.mark.parametrize('strip_rows', [1, 7, 64])
+def test_strips_match_pillow_crop(tmp_path, monkeypatch, extension, mode, strip_rows):
+    # 小的读取块让IDAT数据跨多次读取和多个块
+    monkeypatch.setattr(streaming, 'READ_SIZE', 999)
+    path = write(tmp_path, noise_image(mode), extension)
+    source = open_stream(path)
+    assert source is not None
+    with Image.open(path) as reference:
+        reference.load()
+        assert source.size == reference.size and source.mode == reference.mode
+        for box in BOXES:
+            strips = list(source.strips(box, strip_rows))
+            assert all(strip.height <= strip_rows for strip in strips)
+            assert sum(strip.height for strip in strips) == box[3] - box[1]
+            stacked = np.concatenate([pixels(strip) for strip in strips])
+            assert np.array_equal(stacked, pixels(reference.crop(box)))
+
+
+@pytest.mark.parametrize('extension,mode', CASES)
+@pytest.mark.parametrize('output_format,output_extension',
+                         [('PNG', 'png'), ('BMP', 'bmp'), ('GIF', 'gif')])
+def test_stream_crop_matches_pillow_crop(tmp_path, extension, mode, output_format,
+                                         output_extension):
+    """与把Pillow的crop()结果用save_image保存后再解码相同（格式本身的损失两边一致）"""
+    path = write(tmp_path, noise_image(mode), extension)
+    box = BOXES[-1]
+    output = tmp_path / f'output.{output_extension}'
+    stream_crop(open_stream(path), box, str(output), output_format)
+    reference_output = tmp_path / f'reference.{output_extension}'
+    with Image.open(path) as reference:
+        cropped = reference.crop(box)
+        if output_format == 'BMP' and cropped.mode == 'LA':
+            # Pillow不能保存LA模式的BMP，流式写入时转为RGBA
+            cropped = cropped.convert('RGBA')
+        save_image(cropped, str(reference_output), output_format)
+    with Image.open(reference_output) as expected, Image.open(output) as saved:
+        assert saved.size == expected.size
+        assert np.array_equal(pixels(saved), pixels(expected))
+
+
+def test_png_transparency_is_kept(tmp_path):
+    image = noise_image('P')
+    path = write(tmp_path, image, 'png', transparency=3)
+    output = tmp_path / 'output.png'
+    stream_crop(open_stream(path), BOXES[-1], str(output), 'PNG')
+    with Image.open(path) as reference, Image.open(output) as saved:
+        assert saved.info.get('transparency') is not None
+        assert np.array_equal(pixels(saved), pixels(reference.crop(BOXES[-1])))
+
+
+def test_unsupported_files_are_not_streamed(tmp_path):
+    image = noise_image('RGB')
+    assert open_stream(write(tmp_path, image, 'jpg')) is None
+    image16 = Image.fromarray(np.arange(100 * 80, dtype=np.uint16).reshape(80, 100) * 8)
+    path = str(tmp_path / 'deep.png')
+    image16.save(path)
+    assert open_stream(path) is None
+
+
+def test_box_outside_image_is_rejected(tmp_path):
+    source = open_stream(write(tmp_path, noise_image('RGB'), 'png'))
+    with pytest.raises(ValueError):
+        list(source.strips((0, 0, 158, 10)))
+    with pytest.raises(ValueError):
+        list(source.strips((10, 10, 10, 20)))
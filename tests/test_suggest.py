@@ -0,0 +1,92 @@
+"""suggest：建议框在图像内、符合比例，并且框住合成图像中唯一的显著物体"""
+
+import numpy as np
+import pytest
+from PIL import Image, ImageDraw
+
+from batch import CropSpec, process_one
+from presets import RATIO_PRESETS
+from region_stats import integral_image
+from suggest import best_crop, suggest_crops, window_sums, working_image
+
+RATIOS = [ratio for _, _, ratio in RATIO_PRESETS if ratio is not None]
+
+
+def object_image(size, box, seed=0):
+    """低对比度噪声背景上的一个高对比度物体"""
+    rng = np.random.default_rng(seed)
+    width, height = size
+    background = rng.normal(128, 3, (height, width, 3)).clip(0, 255).astype(np.uint8)
+    image = Image.fromarray(background)
+    draw = ImageDraw.Draw(image)
+    x1, y1, x2, y2 = box
+    draw.rectangle(box, fill=(230, 40, 30))
+    for i in range(x1, x2, 12):
+        draw.line((i, y1, i, y2), fill=(20, 20, 200), width=3)
+    return image
+
+
+def contains(outer, inner):
+    return (outer[0] <= inner[0] and outer[1] <= inner[1] and
+            inner[2] <= outer[2] and inner[3] <= outer[3])
+
+
+def test_window_sums_match_numpy():
+    array = np.random.default_rng(1).random((23, 31))
+    table = integral_image(array, np.float64)
+    sums = window_sums(table, 7, 5)
+    assert sums.shape == (23 - 5 + 1, 31 - 7 + 1)
+    for y, x in [(0, 0), (3, 11), (18, 24)]:
+        assert sums[y, x] == pytest.approx(array[y:y + 5, x:x + 7].sum())
+
+
+def test_working_image_is_reduced_rgb():
+    image = Image.new('L', (2000, 900))
+    work = working_image(image)
+    assert work.mode == 'RGB' and max(work.size) <= 384
+    assert work.size == image.reduce(6).size
+
+
+@pytest.mark.parametrize('size', [(640, 480), (300, 900), (1200, 500)])
+def test_boxes_in_bounds_and_at_ratio(size):
+    image = object_image(size, (size[0] // 3, size[1] // 4, size[0] // 2, size[1] // 2))
+    results = suggest_crops(image, RATIOS)
+    assert [ratio for ratio, _, _ in results] == RATIOS
+    for ratio, box, score in results:
+        x1, y1, x2, y2 = box
+        assert 0 <= x1 < x2 <= size[0] and 0 <= y1 < y2 <= size[1]
+        # 取整误差不超过一个像素
+        assert abs((x2 - x1) - (y2 - y1) * ratio[0] / ratio[1]) <= 1 + ratio[0] / ratio[1]
+        assert score > 0
+
+
+@pytest.mark.parametrize('ratio', [(1, 1), (4, 3), (16, 9), (3, 4)])
+def test_box_frames_the_salient_object(ratio):
+    size = (1200, 800)
+    target = (780, 420, 960, 600)
+    image = object_image(size, target)
+    box = best_crop(image, ratio)
+    assert contains(box, target)
+    # 能量集中时选更紧的框，而不是整张图像宽度的最大窗口
+    assert (box[2] - box[0]) * (box[3] - box[1]) < size[0] * size[1] * 0.8
+
+
+def test_preview_coordinates_are_scaled_to_full_resolution():
+    full_size = (2400, 1600)
+    target = (1560, 840, 1920, 1200)
+    preview = object_image((600, 400), tuple(v // 4 for v in target))
+    box = best_crop(preview, (1, 1), full_size)
+    assert 0 <= box[0] < box[2] <= full_size[0] and 0 <= box[1] < box[3] <= full_size[1]
+    assert contains(box, (1580, 860, 1900, 1180))
+
+
+def test_batch_suggest_crops_around_object(tmp_path):
+    path = tmp_path / 'input.png'
+    object_image((900, 600), (600, 100, 760, 260)).save(path)
+    output = tmp_path / 'output.png'
+    task = (str(path), str(output), 'PNG', CropSpec(suggest=(1, 1)), {}, None)
+    _, _, output_bytes, error = process_one(task)
+    assert error is None and output_bytes > 0
+    with Image.open(output) as saved:
+        assert abs(saved.width - saved.height) <= 1
+        assert saved.width < 600
@@ -0,0 +1,177 @@
+"""thumbnails和loader.PrefetchCache：freedesktop缩略图缓存的路径和失效、相邻图片的预解码"""
+
+import hashlib
+import os
+import threading
+from concurrent.futures import Future
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from loader import (SUPPORTED_EXTENSIONS, LoadCancelled, PrefetchCache, open_preview,
+                    wait_prefetched)
+from thumbnails import (FAIL_DIRECTORY, ThumbnailPool, file_uri, get_thumbnail, list_images,
+                        thumbnail_path)
+
+
+def write_image(path, size=(640, 480), seed=0):
+    rng = np.random.default_rng(seed)
+    width, height = size
+    Image.fromarray(rng.integers(0, 256, (height, width, 3), dtype=np.uint8)).save(path)
+    return str(path)
+
+
+def touch(path, seconds):
+    """把修改时间往后调整，不依赖文件系统的时间精度"""
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + seconds * 10**9))
+
+
+def test_thumbnail_path_follows_the_spec(tmp_path):
+    path = tmp_path / 'a b' / 'ü.jpg'
+    uri = file_uri(str(path))
+    assert uri.startswith('file:///') and '%20' in uri and '%C3%BC' in uri
+    digest = hashlib.md5(uri.encode()).hexdigest()
+    assert thumbnail_path(str(path), 'large', 'root') == os.path.join('root', 'large',
+                                                                      digest + '.png')
+
+
+def test_default_root_uses_xdg_cache_home(tmp_path, monkeypatch):
+    monkeypatch.setenv('XDG_CACHE_HOME', str(tmp_path / 'cache'))
+    path = write_image(tmp_path / 'a.png')
+    filename = get_thumbnail(path)
+    assert filename == thumbnail_path(path, 'normal', str(tmp_path / 'cache' / 'thumbnails'))
+
+
+@pytest.mark.parametrize('size,pixels', [('normal', 128), ('large', 256)])
+def test_thumbnail_is_written_with_tags(tmp_path, size, pixels):
+    path = write_image(tmp_path / 'a.png')
+    root = str(tmp_path / 'thumbnails')
+    filename = get_thumbnail(path, size, root)
+    assert filename == thumbnail_path(path, size, root)
+    assert os.stat(filename).st_mode & 0o777 == 0o600
+    with Image.open(filename) as thumbnail:
+        assert max(thumbnail.size) == pixels
+        assert thumbnail.text['Thumb::URI'] == file_uri(path)
+        assert thumbnail.text['Thumb::MTime'] == str(int(os.stat(path).st_mtime))
+        assert thumbnail.text['Thumb::Image::Width'] == '640'
+        assert thumbnail.text['Thumb::Image::Height'] == '480'
+
+
+def test_cached_thumbnail_is_reused_until_source_changes(tmp_path):
+    path = write_image(tmp_path / 'a.png')
+    root = str(tmp_path / 'thumbnails')
+    filename = get_thumbnail(path, root=root)
+    before = os.stat(filename).st_mtime_ns
+    # 修改时间一致时直接使用缓存，不重新生成
+    os.utime(filename, ns=(before, before - 10**9))
+    assert get_thumbnail(path, root=root) == filename
+    assert os.stat(filename).st_mtime_ns == before - 10**9
+
+    write_image(path, (300, 600), seed=1)
+    touch(path, 5)
+    assert get_thumbnail(path, root=root) == filename
+    with Image.open(filename) as thumbnail:
+        assert thumbnail.text['Thumb::MTime'] == str(int(os.stat(path).st_mtime))
+        assert thumbnail.size == (64, 128)
+
+
+def test_failure_is_recorded_in_fail_directory(tmp_path):
+    path = tmp_path / 'broken.png'
+    path.write_bytes(b'not an image')
+    root = str(tmp_path / 'thumbnails')
+    assert get_thumbnail(str(path), root=root) is None
+    failed = os.path.join(root, FAIL_DIRECTORY, os.path.basename(thumbnail_path(str(path))))
+    assert os.path.exists(failed)
+    assert get_thumbnail(str(path), root=root) is None
+    assert not os.path.exists(thumbnail_path(str(path), root=root))
+    assert get_thumbnail(str(tmp_path / 'missing.png'), root=root) is None
+
+
+def test_list_images_filters_and_sorts_naturally(tmp_path):
+    for name in ['img10.png', 'img2.PNG', 'img1.jpg', 'notes.txt', 'scan.npy']:
+        (tmp_path / name).write_bytes(b'')
+    (tmp_path / 'dir.png').mkdir()
+    names = [os.path.basename(path) for path in list_images(str(tmp_path))]
+    assert names == ['img1.jpg', 'img2.PNG', 'img10.png', 'scan.npy']
+    assert '.npy' in SUPPORTED_EXTENSIONS and '.txt' not in SUPPORTED_EXTENSIONS
+    assert list_images(str(tmp_path / 'missing')) == []
+
+
+def test_pool_delivers_through_dispatch_and_drops_cancelled_results(tmp_path):
+    paths = [write_image(tmp_path / f'{i}.png', seed=i) for i in range(3)]
+    dispatched = []
+    done = threading.Event()
+
+    def dispatch(func, *args):
+        dispatched.append((func, args))
+        if len(dispatched) == len(paths):
+            done.set()
+
+    pool = ThumbnailPool(dispatch, root=str(tmp_path / 'thumbnails'), workers=2)
+    results = {}
+    for path in paths:
+        pool.request(path, lambda path, filename: results.__setitem__(path, filename))
+    assert done.wait(10)
+    pool.cancel()
+    # 切换文件夹之后送达的结果被丢弃
+    for func, args in dispatched:
+        func(*args)
+    assert results == {}
+    pool.shutdown()
+
+    pool = ThumbnailPool(lambda func, *args: func(*args), root=str(tmp_path / 'thumbnails'))
+    finished = threading.Event()
+    pool.request(paths[0], lambda path, filename: (results.__setitem__(path, filename),
+                                                   finished.set()))
+    assert finished.wait(10)
+    assert results == {paths[0]: thumbnail_path(paths[0], root=str(tmp_path / 'thumbnails'))}
+    pool.shutdown()
+
+
+def test_prefetch_matches_open_preview(tmp_path):
+    paths = [write_image(tmp_path / f'{i}.png', seed=i) for i in range(3)]
+    cache = PrefetchCache()
+    cache.prefetch(paths[:2], (100, 100))
+    future = cache.take(paths[0], (100, 100))
+    image, full_size, image_format, is_full = wait_prefetched(future)
+    expected = open_preview(paths[0], (100, 100))[0]
+    assert (full_size, image_format, is_full) == ((640, 480), 'PNG', True)
+    assert np.array_equal(np.asarray(image), np.asarray(expected))
+    # 已经取出的不再保留
+    assert cache.take(paths[0], (100, 100)) is None
+    cache.shutdown()
+
+
+def test_prefetch_drops_stale_and_unlisted_entries(tmp_path):
+    paths = [write_image(tmp_path / f'{i}.png', seed=i) for i in range(3)]
+    cache = PrefetchCache()
+    cache.prefetch(paths, (100, 100))
+    # 窗口大小变化后不使用
+    assert cache.take(paths[0], (200, 200)) is None
+    # 文件被修改后不使用
+    touch(paths[1], 5)
+    assert cache.take(paths[1], (100, 100)) is None
+    # 不在最近一次prefetch()中的文件被丢弃
+    cache.prefetch([paths[0]], (100, 100))
+    assert cache.take(paths[2], (100, 100)) is None
+    assert cache.take(paths[0], (100, 100)) is not None
+    cache.shutdown()
+
+
+def test_prefetch_reuses_pending_decode(tmp_path):
+    path = write_image(tmp_path / 'a.png')
+    cache = PrefetchCache()
+    cache.prefetch([path], (100, 100))
+    first = cache._entries[path][1]
+    cache.prefetch([path, str(tmp_path / 'missing.png')], (100, 100))
+    assert cache._entries[path][1] is first and len(cache._entries) == 1
+    cache.shutdown()
+
+
+def test_wait_prefetched_can_be_cancelled():
+    cancelled = threading.Event()
+    cancelled.set()
+    with pytest.raises(LoadCancelled):
+        wait_prefetched(Future(), cancelled=cancelled)
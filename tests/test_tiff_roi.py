@@ -0,0 +1,170 @@
+"""tiff_roi：按块读取与Pillow完整解码比较，缩小页、文件句柄和改写后的缓存"""
+
+import io
+import os
+import struct
+
+import numpy as np
+import pytest
+from PIL import Image, TiffImagePlugin, TiffTags
+
+from image_state import image_nbytes
+from tile_cache import TileCache
+from tiff_roi import DEFAULT_TIFF_CACHE_BYTES, open_tiff_region
+
+COMPRESSIONS = (None, 'tiff_lzw', 'tiff_adobe_deflate', 'packbits')
+CODEC_TAGS = (258, 259, 262, 277, 284, 317, 320, 338, 339)
+
+
+def sample_image(size=(700, 500), mode='RGB', seed=0):
+    rng = np.random.default_rng(seed)
+    gradient = np.linspace(0, 200, size[0] * size[1] * 3).reshape(size[1], size[0], 3)
+    pixels = (gradient + rng.integers(0, 55, gradient.shape)).astype(np.uint8)
+    return Image.fromarray(pixels).convert(mode)
+
+
+def write_tiled(path, images, tile=(128, 96), compression=None):
+    """写一个分块TIFF：images[0]是主图像，其余是缩小页（NewSubfileType=1）
+
+    每个块用Pillow压缩为只有一个条带的TIFF，再取出条带数据
+    """
+    out = bytearray(b'II*\x00\x00\x00\x00\x00')
+    directories = []
+    for index, image in enumerate(images):
+        offsets, counts, codec = [], [], {}
+        for y in range(0, image.height, tile[1]):
+            for x in range(0, image.width, tile[0]):
+                block = Image.new(image.mode, tile)
+                if image.mode == 'P':
+                    block.putpalette(image.getpalette())
+                block.paste(image.crop((x, y, min(x + tile[0], image.width),
+                                        min(y + tile[1], image.height))))
+                buffer = io.BytesIO()
+                block.save(buffer, 'TIFF', compression=compression, strip_size=1 << 30)
+                with Image.open(buffer) as encoded:
+                    tags = encoded.tag_v2
+                    (offset,), (count,) = tags[273], tags[279]
+                    codec = {tag: (tags[tag], tags.tagtype[tag])
+                             for tag in CODEC_TAGS if tag in tags}
+                offsets.append(len(out))
+                counts.append(count)
+                out += buffer.getvalue()[offset:offset + count]
+                if len(out) % 2:
+                    out += b'\x00'
+        ifd = TiffImagePlugin.ImageFileDirectory_v2(prefix=b'II')
+        for tag, (value, tagtype) in codec.items():
+            ifd[tag] = value
+            ifd.tagtype[tag] = tagtype
+        ifd[254] = 1 if index else 0
+        ifd.tagtype[254] = TiffTags.LONG
+        ifd[256], ifd[257] = image.size
+        ifd[322], ifd[323] = tile
+        ifd[324] = tuple(offsets)
+        ifd.tagtype[324] = TiffTags.LONG
+        ifd[325] = tuple(counts)
+        ifd.tagtype[325] = TiffTags.LONG
+        directories.append(ifd)
+
+    starts = []
+    for ifd in directories:
+        starts.append(len(out))
+        out += ifd.tobytes(len(out))
+    struct.pack_into('<I', out, 4, starts[0])
+    for i, start in enumerate(starts):
+        entries = struct.unpack_from('<H', out, start)[0]
+        struct.pack_into('<I', out, start + 2 + 12 * entries,
+                         starts[i + 1] if i + 1 < len(starts) else 0)
+    with open(path, 'wb') as f:
+        f.write(out)
+
+
+def open_files():
+    return len(os.listdir('/proc/self/fd'))
+
+
+@pytest.mark.parametrize('compression', COMPRESSIONS)
+def test_tiled_crop_matches_pillow_decode(tmp_path, compression):
+    path = str(tmp_path / 'tiled.tif')
+    image = sample_image()
+    write_tiled(path, [image], compression=compression)
+    source = open_tiff_region(path)
+    assert source.tiled and source.size == image.size
+
+    with Image.open(path) as decoded:
+        reference = decoded.convert('RGB')
+    for box in [(0, 0, 700, 500), (130, 97, 401, 333), (650, 450, 700, 500), (-5, -5, 20, 20)]:
+        assert np.array_equal(np.asarray(source.crop(box)), np.asarray(reference.crop(box)))
+
+
+def test_crop_decodes_only_intersecting_tiles(tmp_path):
+    path = str(tmp_path / 'tiled.tif')
+    write_tiled(path, [sample_image()], compression='tiff_lzw')
+    source = open_tiff_region(path)
+    source.crop((130, 97, 300, 200))
+    keys = {key[-2:] for key in source.cache._tiles}
+    assert keys == {(1, 1), (2, 1), (1, 2), (2, 2)}
+
+
+@pytest.mark.parametrize('compression', (None, 'tiff_lzw'))
+@pytest.mark.parametrize('mode', ('RGB', 'L', 'P'))
+def test_striped_crop_and_transpose_match_pillow(tmp_path, compression, mode):
+    path = str(tmp_path / 'striped.tif')
+    image = sample_image(mode=mode)
+    image.save(path, compression=compression)
+    source = open_tiff_region(path)
+    box = (5, 7, 690, 493)
+    with Image.open(path) as decoded:
+        decoded.load()
+        assert np.array_equal(np.asarray(source.crop(box)), np.asarray(decoded.crop(box)))
+        rotated = decoded.transpose(Image.Transpose.ROTATE_90)
+    view = source.transpose(Image.Transpose.ROTATE_90)
+    assert view.size == rotated.size
+    box = (10, 20, 300, 400)
+    assert np.array_equal(np.asarray(view.crop(box)), np.asarray(rotated.crop(box)))
+
+
+def test_preview_uses_reduced_page_or_matches_reduce(tmp_path):
+    image = sample_image()
+    pyramid = str(tmp_path / 'pyramid.tif')
+    write_tiled(pyramid, [image, image.reduce(4)])
+    source = open_tiff_region(pyramid)
+    assert source.overview((150, 100)).page == 1
+    assert source.overview((400, 300)) is source
+
+    flat = str(tmp_path / 'flat.tif')
+    write_tiled(flat, [image])
+    preview = open_tiff_region(flat).preview((175, 125))
+    assert np.array_equal(np.asarray(preview), np.asarray(image.reduce(4)))
+
+
+def test_no_file_handles_are_kept_open(tmp_path):
+    path = str(tmp_path / 'pyramid.tif')
+    image = sample_image()
+    write_tiled(path, [image, image.reduce(2), image.reduce(4)])
+    before = open_files()
+    for _ in range(20):
+        source = open_tiff_region(path)
+        source.crop((0, 0, 300, 300))
+        source.preview((100, 80))
+    assert open_files() == before
+
+
+def test_rewritten_file_does_not_return_stale_tiles(tmp_path):
+    path = str(tmp_path / 'tiled.tif')
+    cache = TileCache(DEFAULT_TIFF_CACHE_BYTES, image_nbytes)
+    write_tiled(path, [sample_image(seed=1)])
+    first = open_tiff_region(path, cache).crop((0, 0, 100, 100))
+
+    replacement = sample_image(seed=2)
+    write_tiled(path, [replacement])
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    second = open_tiff_region(path, cache).crop((0, 0, 100, 100))
+    assert not np.array_equal(np.asarray(first), np.asarray(second))
+    assert np.array_equal(np.asarray(second), np.asarray(replacement.crop((0, 0, 100, 100))))
+
+
+def test_non_tiff_is_not_a_region(tmp_path):
+    path = str(tmp_path / 'image.png')
+    sample_image().save(path)
+    assert open_tiff_region(path) is None
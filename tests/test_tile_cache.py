@@ -0,0 +1,31 @@
+"""tile_cache.TileCache：按字节数淘汰和按owner丢弃"""
+
+from tile_cache import TileCache
+
+
+def test_evicts_least_recently_used_by_bytes():
+    cache = TileCache(10, len)
+    cache.put(('a', 0), b'xxxx')
+    cache.put(('a', 1), b'yyyy')
+    assert cache.get(('a', 0)) == b'xxxx'
+    cache.put(('b', 0), b'zzzz')
+    assert cache.get(('a', 1)) is None
+    assert len(cache) == 2 and cache.current_bytes == 8
+
+
+def test_replacing_and_discarding_keep_byte_count():
+    cache = TileCache(100, len)
+    cache.put(('a', 0), b'xxxx')
+    cache.put(('a', 0), b'xx')
+    cache.put(('b', 0), b'yyy')
+    assert cache.current_bytes == 5
+    cache.discard('a')
+    assert cache.get(('a', 0)) is None and cache.current_bytes == 3
+    cache.clear()
+    assert len(cache) == 0 and cache.current_bytes == 0
+
+
+def test_keeps_newest_entry_even_if_over_limit():
+    cache = TileCache(2, len)
+    cache.put(('a', 0), b'xxxx')
+    assert cache.get(('a', 0)) == b'xxxx'
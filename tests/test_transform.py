@@ -0,0 +1,85 @@
+"""transform：一步的旋转裁剪与 rotate(expand=True).crop() 两步的结果相同"""
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from mapped import open_mapped
+from transform import TransposedRegion, crop_rotated, rotate_image, rotated_size
+
+SIZE = (211, 157)
+
+ANGLES = [0, 90, 180, 270, 7.5, -13, 33.3, 45, 123.4, 271, 359.9]
+
+
+def noise_image(mode='RGB', seed=0):
+    rng = np.random.default_rng(seed)
+    width, height = SIZE
+    small = Image.fromarray(rng.integers(0, 256, (height // 4, width // 4, 3), dtype=np.uint8))
+    # 平滑的图像，插值位置的微小差别不会被噪声放大
+    return small.resize(SIZE, Image.BILINEAR).convert(mode)
+
+
+def boxes(size):
+    """内部、贴着四条边和整个画布的裁剪框"""
+    width, height = size
+    return [(20, 15, width - 30, height - 25), (0, 0, width // 2, height // 3),
+            (width // 3, height // 2, width, height), (0, 0, width, height),
+            (width - 1, height - 1, width, height), (5, 0, 6, height)]
+
+
+def difference(a, b):
+    return np.abs(np.asarray(a, dtype=np.int16) - np.asarray(b, dtype=np.int16))
+
+
+@pytest.mark.parametrize('angle', ANGLES)
+def test_rotated_size_matches_pillow(angle):
+    assert rotated_size(SIZE, angle) == noise_image().rotate(angle, expand=True).size
+
+
+@pytest.mark.parametrize('mode', ['RGB', 'L', 'RGBA'])
+@pytest.mark.parametrize('angle', ANGLES)
+def test_crop_rotated_matches_two_step(mode, angle):
+    image = noise_image(mode)
+    rotated = rotate_image(image, angle)
+    for box in boxes(rotated.size):
+        result = crop_rotated(image, angle, box)
+        expected = rotated.crop(box)
+        assert result.mode == expected.mode and result.size == expected.size
+        diff = difference(result, expected)
+        if angle % 90 == 0:
+            # 90度的整数倍只转置，与Pillow完全相同
+            assert not diff.any()
+        else:
+            assert diff.max() <= 2
+
+
+@pytest.mark.parametrize('angle', [0, 90, 180, 270, 17, 200.5])
+def test_region_source_matches_pil_image(tmp_path, angle):
+    """区域源先取出覆盖的区域再重采样，结果与对整张PIL图像重采样相同"""
+    image = noise_image()
+    path = tmp_path / 'image.npy'
+    np.save(path, np.asarray(image))
+    region = open_mapped(str(path))
+    for box in boxes(rotated_size(SIZE, angle)):
+        expected = crop_rotated(image, angle, box)
+        result = crop_rotated(region, angle, box)
+        assert result.size == expected.size
+        assert difference(result, expected).max() <= 1
+
+
+@pytest.mark.parametrize('angle', [90, 180, 270])
+def test_transposed_region_matches_pillow_transpose(tmp_path, angle):
+    image = noise_image()
+    path = tmp_path / 'image.npy'
+    np.save(path, np.asarray(image))
+    view = TransposedRegion(open_mapped(str(path)), angle)
+    expected = image.rotate(angle, expand=True)
+    assert view.size == expected.size and view.mode == 'RGB'
+    for box in boxes(view.size):
+        assert not difference(view.crop(box), expected.crop(box)).any()
+    back = view.transpose(Image.Transpose.ROTATE_90)
+    if (angle + 90) % 360 == 0:
+        assert not isinstance(back, TransposedRegion)
+    else:
+        assert back.size == rotated_size(SIZE, angle + 90)
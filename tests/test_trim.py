@@ -0,0 +1,96 @@
+"""trim.trim_box：各种模式的图像与用Pillow计算的内容框比较"""
+
+import pytest
+from PIL import Image, ImageChops, ImageDraw
+
+from batch import CropSpec, process_one
+from trim import trim_box, trim_preview
+
+CONTENT = (123, 87, 1711, 1302)
+
+
+def bordered(size=(2000, 1500), box=CONTENT, background=(255, 255, 255)):
+    """纯色边框中间一个矩形内容，内容里有细节以免整块同色"""
+    image = Image.new('RGB', size, background)
+    draw = ImageDraw.Draw(image)
+    draw.rectangle((box[0], box[1], box[2] - 1, box[3] - 1), fill=(200, 30, 30))
+    draw.line((box[0], box[1], box[2] - 1, box[3] - 1), fill=(0, 0, 0), width=5)
+    return image
+
+
+def reference_box(image):
+    """Pillow的参考结果：与左上角颜色不同的像素的外接框"""
+    image = image.convert('RGB')
+    background = Image.new('RGB', image.size, image.getpixel((0, 0)))
+    return ImageChops.difference(image, background).getbbox()
+
+
+@pytest.mark.parametrize('mode', ['RGB', 'RGBA', 'L', 'LA', 'P', '1', 'CMYK', 'I'])
+def test_trim_modes_match_pillow(mode):
+    image = bordered()
+    if mode == '1':
+        image = image.convert('L').point(lambda v: 0 if v < 250 else 255).convert(
+            '1', dither=Image.Dither.NONE)
+    elif mode == 'P':
+        image = image.convert('P', palette=Image.Palette.ADAPTIVE, colors=16)
+    else:
+        image = image.convert(mode)
+    expected = reference_box(image)
+    assert trim_box(image, image) == expected
+    # 只给预览时按预览的精度返回
+    preview = trim_box(image)
+    assert all(abs(a - b) <= 2 for a, b in zip(preview, expected))
+
+
+def test_trim_from_small_preview_refines_in_full_resolution():
+    image = bordered()
+    preview = image.resize((500, 375), Image.BOX)
+    assert trim_box(preview, image, image.size) == reference_box(image)
+
+
+@pytest.mark.parametrize('factor', [2, 4, 8])
+def test_trim_from_reduced_level_keeps_thin_content(factor):
+    """显示金字塔的缩小层作为预览：细线被平均稀释，容差按相对原图的倍数降低"""
+    image = bordered()
+    ImageDraw.Draw(image).line((1900, 200, 1900, 1400), fill=(215, 215, 215))
+    preview = image.reduce(factor)
+    assert trim_preview(preview) is preview
+    assert trim_box(preview, image, image.size) == reference_box(image)
+
+
+def test_trim_preview_reduces_to_trim_side():
+    preview = trim_preview(bordered().convert('P'))
+    assert preview.mode == 'RGB' and preview.size == (1000, 750)
+    assert max(trim_preview(bordered(), 384).size) <= 384
+
+
+def test_trim_tolerance_ignores_noise_in_border():
+    image = bordered(background=(240, 240, 240))
+    expected = reference_box(image)
+    image.putpixel((10, 10), (250, 232, 240))
+    assert trim_box(image, image, tolerance=16) == expected
+    assert trim_box(image, image, tolerance=4)[:2] == (10, 10)
+
+
+def test_trim_uniform_image_has_no_content():
+    image = Image.new('RGB', (1200, 800), (10, 20, 30))
+    assert trim_box(image, image) is None
+
+
+@pytest.mark.parametrize('extension,mode', [('gif', 'P'), ('png', 'P'), ('png', '1')])
+def test_batch_trim_palette_and_bilevel_files(tmp_path, extension, mode):
+    image = bordered()
+    if mode == 'P':
+        image = image.convert('P', palette=Image.Palette.ADAPTIVE, colors=16)
+    else:
+        image = image.convert('L').point(lambda v: 0 if v < 250 else 255).convert(
+            '1', dither=Image.Dither.NONE)
+    path = tmp_path / f'input.{extension}'
+    image.save(path)
+    output = tmp_path / 'output.png'
+
+    task = (str(path), str(output), 'PNG', CropSpec(trim=True), {}, None)
+    _, _, _, error = process_one(task)
+    assert error is None
+    with Image.open(path) as source, Image.open(output) as result:
+        assert result.size == source.crop(reference_box(source)).size
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+缩略图缓存和文件夹浏览（不依赖GTK）
+缩略图按freedesktop缩略图规范保存在 $XDG_CACHE_HOME/thumbnails（默认~/.cache/thumbnails）：
+文件名是原文件URI的MD5，PNG中写入Thumb::URI和Thumb::MTime，原文件修改后自动失效，
+与文件管理器共用同一份缓存。缩略图在后台线程池中生成，结果通过dispatch送回主线程。
+"""
+
+import hashlib
+import os
+import re
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from PIL import Image, PngImagePlugin
+
+from loader import SUPPORTED_EXTENSIONS, open_preview
+from responsive import prepare_for_resample
+
+# 规范中的缩略图尺寸
+THUMBNAIL_SIZES = {'normal': 128, 'large': 256}
+
+# 生成失败的记录（规范要求按程序名分目录），避免每次都重试
+FAIL_DIRECTORY = os.path.join('fail', 'imagecropper')
+
+# 同时生成缩略图的线程数，Pillow解码和缩放时会释放GIL
+THUMBNAIL_WORKERS = max(2, min(4, os.cpu_count() or 1))
+
+
+def thumbnail_root():
+    cache = os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache')
+    return os.path.join(cache, 'thumbnails')
+
+
+def file_uri(path):
+    """规范使用的绝对URI（file:///...，非ASCII字符按百分号编码）"""
+    return Path(os.path.abspath(path)).as_uri()
+
+
+def thumbnail_path(path, size='normal', root=None):
+    """缩略图文件的位置：<根目录>/<尺寸>/<URI的MD5>.png"""
+    digest = hashlib.md5(file_uri(path).encode()).hexdigest()
+    return os.path.join(root or thumbnail_root(), size, digest + '.png')
+
+
+def _is_current(filename, uri, mtime):
+    """缩略图存在，并且记录的URI和修改时间与原文件一致"""
+    try:
+        with Image.open(filename) as image:
+            text = getattr(image, 'text', {})
+    except (OSError, SyntaxError, ValueError):
+        return False
+    return text.get('Thumb::URI') == uri and text.get('Thumb::MTime') == str(mtime)
+
+
+def _write_png(image, filename, info):
+    """先写入同目录的临时文件再改名（规范要求原子替换，权限0600）"""
+    directory = os.path.dirname(filename)
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    fd, temp = tempfile.mkstemp(suffix='.png', dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            image.save(f, 'PNG', pnginfo=info)
+        os.replace(temp, filename)
+    except BaseException:
+        os.unlink(temp)
+        raise
+
+
+def get_thumbnail(path, size='normal', root=None):
+    """有效缩略图的文件路径：缓存中没有或已过期时生成，无法生成时返回None"""
+    root = root or thumbnail_root()
+    uri = file_uri(path)
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    mtime = int(stat.st_mtime)
+
+    filename = thumbnail_path(path, size, root)
+    if _is_current(filename, uri, mtime):
+        return filename
+    failed = os.path.join(root, FAIL_DIRECTORY, os.path.basename(filename))
+    if _is_current(failed, uri, mtime):
+        return None
+
+    info = PngImagePlugin.PngInfo()
+    info.add_text('Thumb::URI', uri)
+    info.add_text('Thumb::MTime', str(mtime))
+    info.add_text('Thumb::Size', str(stat.st_size))
+    info.add_text('Software', 'ImageCropper')
+    pixels = THUMBNAIL_SIZES[size]
+    try:
+        image, full_size, _, _ = open_preview(path, (pixels, pixels))
+        image = prepare_for_resample(image)
+        image.thumbnail((pixels, pixels))
+    except Exception:
+        # 规范：失败的文件在fail目录下留一个带相同标签的空白PNG
+        try:
+            _write_png(Image.new('RGBA', (1, 1)), failed, info)
+        except OSError:
+            pass
+        return None
+    info.add_text('Thumb::Image::Width', str(full_size[0]))
+    info.add_text('Thumb::Image::Height', str(full_size[1]))
+    try:
+        _write_png(image, filename, info)
+    except OSError:
+        return None
+    return filename
+
+
+def natural_key(name):
+    """按数字大小排序文件名（img2在img10之前）"""
+    return [int(part) if part.isdigit() else part.lower() for part in re.split(r'(\d+)', name)]
+
+
+def list_images(directory):
+    """目录中所有支持的图片，按文件名自然排序"""
+    try:
+        names = os.listdir(directory)
+    except OSError:
+        return []
+    paths = [os.path.join(directory, name) for name in sorted(names, key=natural_key)
+             if name.lower().endswith(SUPPORTED_EXTENSIONS)]
+    return [path for path in paths if os.path.isfile(path)]
+
+
+class ThumbnailPool:
+    """在线程池中生成缩略图
+
+    切换文件夹时调用cancel()：尚未开始的任务被取消，已经在进行的任务结果被丢弃。
+    """
+
+    def __init__(self, dispatch, size='normal', workers=THUMBNAIL_WORKERS, root=None):
+        self.dispatch = dispatch
+        self.size = size
+        self.root = root
+        self.generation = 0
+        self._futures = []
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers,
+                                            thread_name_prefix="thumbnail")
+
+    def request(self, path, on_done):
+        """生成（或从缓存读取）path的缩略图，完成后在主线程中调用on_done(path, 缩略图路径或None)"""
+        with self._lock:
+            generation = self.generation
+            future = self._executor.submit(get_thumbnail, path, self.size, self.root)
+            self._futures.append(future)
+        future.add_done_callback(
+            lambda f: None if f.cancelled() else
+            self.dispatch(self._deliver, generation, on_done, path, f))
+
+    def cancel(self):
+        with self._lock:
+            self.generation += 1
+            for future in self._futures:
+                future.cancel()
+            self._futures = []
+
+    def shutdown(self):
+        self.cancel()
+        self._executor.shutdown(wait=False)
+
+    def _deliver(self, generation, on_done, path, future):
+        """在主线程中执行：丢弃已取消的文件夹的结果"""
+        if generation == self.generation:
+            on_done(path, future.result())
+        return False
@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+"""
+TIFF区域读取（不依赖GTK）
+分块（tiled）和分条（striped）的TIFF只解码与请求区域相交的块，
+解码后的块保存在一个按字节数限制的LRU缓存中，显示瓦片和导出裁剪共用。
+每个块被包装成一个只有一个条带的内存TIFF交给Pillow（libtiff）解码，
+所以Pillow支持的压缩方式（LZW、Deflate、PackBits、JPEG等）都可以使用。
+"""
+
+import io
+import os
+import struct
+from math import ceil
+
+from PIL import Image, TiffImagePlugin, TiffTags
+
+from image_state import REDUCIBLE_MODES, image_nbytes
+from tile_cache import TileCache
+from transform import TransposedRegion
+
+# 解码块缓存的默认内存上限
+DEFAULT_TIFF_CACHE_BYTES = 128 * 1024 * 1024
+
+# 每个块的内存TIFF中沿用的标签（解码方式相关），尺寸和数据位置另外写入
+CODEC_TAGS = (
+    258,  # BitsPerSample
+    259,  # Compression
+    262,  # PhotometricInterpretation
+    266,  # FillOrder
+    277,  # SamplesPerPixel
+    284,  # PlanarConfiguration
+    317,  # Predictor
+    320,  # ColorMap
+    338,  # ExtraSamples
+    339,  # SampleFormat
+    347,  # JPEGTables
+    530,  # YCbCrSubSampling
+    531,  # YCbCrPositioning
+    532,  # ReferenceBlackWhite
+)
+
+# 其余用到的标签
+IMAGE_WIDTH, IMAGE_LENGTH = 256, 257
+STRIP_OFFSETS, ROWS_PER_STRIP, STRIP_BYTE_COUNTS = 273, 278, 279
+TILE_WIDTH, TILE_LENGTH, TILE_OFFSETS, TILE_BYTE_COUNTS = 322, 323, 324, 325
+NEW_SUBFILE_TYPE = 254
+PLANAR_CONFIGURATION = 284
+
+class TiffRegionSource:
+    """TIFF中的一页，接口与PIL图像的只读部分相同（size、mode、crop、transpose）
+
+    块的网格：分块TIFF为TileWidth×TileLength，分条TIFF为整行宽×RowsPerStrip。
+    不持有文件句柄：区域源由界面、导出线程和缩小页共用，生命周期不确定，
+    每次读取块时打开文件（块在缓存中时不读取）。缓存键包含文件的修改时间，
+    文件被改写后不会取到旧的块。
+    """
+
+    kind = "tiff"
+
+    def __init__(self, path, page=0, cache=None):
+        self.path = path
+        self.page = page
+        self.cache = cache if cache is not None else TileCache(DEFAULT_TIFF_CACHE_BYTES, image_nbytes)
+        self.mtime_ns = os.stat(path).st_mtime_ns
+
+        image = TiffImagePlugin.TiffImageFile(path)
+        with image:
+            if page:
+                image.seek(page)
+            tags = image.tag_v2
+            self.size = image.size
+            self.mode = image.mode
+            self.format = image.format
+            self.info = {k: v for k, v in image.info.items() if k in ('dpi', 'icc_profile')}
+            self.reduced = bool(tags.get(NEW_SUBFILE_TYPE, 0) & 1)
+            if tags.get(PLANAR_CONFIGURATION, 1) != 1:
+                raise ValueError("不支持按通道分开存储的TIFF")
+
+            width, height = self.size
+            if TILE_OFFSETS in tags:
+                self.tile_size = (tags[TILE_WIDTH], tags[TILE_LENGTH])
+                self.offsets = tags[TILE_OFFSETS]
+                self.byte_counts = tags[TILE_BYTE_COUNTS]
+            else:
+                rows = min(tags.get(ROWS_PER_STRIP, height), height)
+                self.tile_size = (width, rows)
+                self.offsets = tags[STRIP_OFFSETS]
+                self.byte_counts = tags[STRIP_BYTE_COUNTS]
+            self.columns = ceil(width / self.tile_size[0])
+            self.rows = ceil(height / self.tile_size[1])
+            if len(self.offsets) < self.columns * self.rows:
+                raise ValueError("TIFF块数与图像尺寸不符")
+
+            self._codec_tags = [(tag, tags[tag], tags.tagtype[tag])
+                                for tag in CODEC_TAGS if tag in tags]
+            self._prefix = tags.prefix  # 沿用原文件的字节序，未压缩的16位数据才能正确解释
+            self.palette = image.palette if image.mode == 'P' else None
+            self.tiled = TILE_OFFSETS in tags
+
+    @property
+    def width(self):
+        return self.size[0]
+
+    @property
+    def height(self):
+        return self.size[1]
+
+    @property
+    def nbytes(self):
+        """解码块缓存占用的字节数"""
+        return self.cache.current_bytes
+
+    def _read(self, offset, length):
+        with open(self.path, 'rb') as fp:
+            fp.seek(offset)
+            return fp.read(length)
+
+    def _wrap(self, data, width, height):
+        """把一个块的压缩数据包装为只有一个条带的内存TIFF"""
+        ifd = TiffImagePlugin.ImageFileDirectory_v2(prefix=self._prefix)
+        for tag, value, tagtype in self._codec_tags:
+            ifd[tag] = value
+            ifd.tagtype[tag] = tagtype
+        ifd[IMAGE_WIDTH] = width
+        ifd[IMAGE_LENGTH] = height
+        ifd[ROWS_PER_STRIP] = height
+        ifd[STRIP_BYTE_COUNTS] = len(data)
+        ifd.tagtype[STRIP_BYTE_COUNTS] = TiffTags.LONG
+        # tobytes()把StripOffsets当作相对目录（含附加数据）末尾的偏移，数据紧跟目录即为0
+        ifd[STRIP_OFFSETS] = 0
+        ifd.tagtype[STRIP_OFFSETS] = TiffTags.LONG
+        byte_order = '<' if self._prefix == b'II' else '>'
+        return self._prefix + struct.pack(byte_order + 'HI', 42, 8) + ifd.tobytes(8) + data
+
+    def read_tile(self, column, row, use_cache=True):
+        """解码一个块，返回限制在图像范围内的PIL图像"""
+        key = (self.path, self.mtime_ns, self.page, column, row)
+        image = self.cache.get(key) if use_cache else None
+        if image is not None:
+            return image
+
+        tile_width, tile_height = self.tile_size
+        index = row * self.columns + column
+        data = self._read(self.offsets[index], self.byte_counts[index])
+        # 分条TIFF的最后一条只包含剩余的行；分块TIFF边缘的块按完整尺寸存储
+        height = tile_height if self.tiled else min(tile_height,
+                                                    self.height - row * tile_height)
+        with Image.open(io.BytesIO(self._wrap(data, tile_width, height))) as tile:
+            tile.load()
+            image = tile.crop((0, 0, min(tile_width, self.width - column * tile_width),
+                               min(height, self.height - row * tile_height)))
+        if use_cache:
+            self.cache.put(key, image)
+        return image
+
+    def crop(self, box):
+        """复制box区域为PIL图像：只解码相交的块，超出图像的部分填充为0"""
+        x1, y1, x2, y2 = map(int, box)
+        image = Image.new(self.mode, (x2 - x1, y2 - y1))
+        if self.palette is not None:
+            image.putpalette(self.palette)
+        tile_width, tile_height = self.tile_size
+        first_column, last_column = max(x1, 0) // tile_width, (min(x2, self.width) - 1) // tile_width
+        first_row, last_row = max(y1, 0) // tile_height, (min(y2, self.height) - 1) // tile_height
+        for row in range(first_row, last_row + 1):
+            for column in range(first_column, last_column + 1):
+                tile = self.read_tile(column, row)
+                image.paste(tile, (column * tile_width - x1, row * tile_height - y1))
+        return image
+
+    def transpose(self, method):
+        """90度的整数倍旋转：返回换算裁剪坐标的视图，不解码像素"""
+        return TransposedRegion(self, 0).transpose(method)
+
+    def overview(self, target_size):
+        """不小于target_size的最小缩小页（金字塔TIFF），没有时返回自身"""
+        best = self
+        try:
+            with TiffImagePlugin.TiffImageFile(self.path) as image:
+                pages = getattr(image, 'n_frames', 1)
+        except OSError:
+            return self
+        for page in range(pages):
+            if page == self.page:
+                continue
+            try:
+                candidate = TiffRegionSource(self.path, page, self.cache)
+            except (ValueError, KeyError, OSError, EOFError):
+                continue
+            if (candidate.reduced and candidate.width >= target_size[0] and
+                    candidate.height >= target_size[1] and candidate.width < best.width and
+                    abs(candidate.width / candidate.height - self.width / self.height) < 0.01):
+                best = candidate
+        return best
+
+    def preview(self, target_size, progress=None):
+        """按整数倍缩小的预览，不小于target_size
+
+        有缩小页时从最合适的缩小页生成；否则逐行解码所有块并立即缩小，
+        内存只需要一行块和预览本身（不经过缓存）。progress(比例)在每行块后调用。
+        """
+        page = self.overview(target_size)
+        factor = max(1, min(page.width // max(1, target_size[0]),
+                            page.height // max(1, target_size[1])))
+        preview = Image.new(self.mode, (ceil(page.width / factor), ceil(page.height / factor)))
+        if self.palette is not None:
+            preview.putpalette(self.palette)
+
+        pending = None  # 还不够factor行、留到下一行块的部分
+        y = 0
+        for row in range(page.rows):
+            band_height = min(page.tile_size[1], page.height - row * page.tile_size[1])
+            band = Image.new(self.mode, (page.width, band_height))
+            for column in range(page.columns):
+                band.paste(page.read_tile(column, row, False), (column * page.tile_size[0], 0))
+            if pending is not None:
+                merged = Image.new(self.mode, (page.width, pending.height + band.height))
+                merged.paste(pending, (0, 0))
+                merged.paste(band, (0, pending.height))
+                band = merged
+
+            last = row == page.rows - 1
+            rows = band.height if last else band.height // factor * factor
+            if rows:
+                part = band.crop((0, 0, page.width, rows))
+                if factor > 1:
+                    # 不能reduce()的模式隔点采样
+                    if self.mode in REDUCIBLE_MODES:
+                        part = part.reduce(factor)
+                    else:
+                        part = part.resize((ceil(page.width / factor), ceil(rows / factor)),
+                                           Image.Resampling.NEAREST)
+                preview.paste(part, (0, y))
+                y += part.height
+            pending = band.crop((0, rows, page.width, band.height)) if rows < band.height else None
+            if progress is not None:
+                progress((row + 1) / page.rows)
+        preview.info.update(self.info)
+        return preview
+
+
+def open_tiff_region(path, cache=None):
+    """打开TIFF的区域读取源，不是TIFF或布局不支持时返回None
+
+    与内存映射一样直接用插件解析文件头，不经过Image.open的像素数上限检查
+    """
+    try:
+        with open(path, 'rb') as fp:
+            magic = fp.read(4)
+    except OSError:
+        return None
+    if magic not in (b'II*\x00', b'MM\x00*'):
+        return None
+    try:
+        return TiffRegionSource(path, cache=cache)
+    except (OSError, SyntaxError, ValueError, KeyError, EOFError):
+        return None
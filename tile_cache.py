@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+按字节数限制内存的LRU缓存（不依赖GTK和cairo）
+显示瓦片（cairo表面）和TIFF解码块（PIL图像）共用这一个实现，
+条目占用的字节数由创建缓存时给出的函数计算。
+"""
+
+import threading
+from collections import OrderedDict
+
+
+class TileCache:
+    """按字节数限制内存的LRU瓦片缓存
+
+    nbytes(条目)返回条目占用的字节数。所有操作都加锁，
+    TIFF解码块缓存在导出线程和主线程中共用。
+    """
+
+    def __init__(self, max_bytes, nbytes):
+        self.max_bytes = max_bytes
+        self.nbytes = nbytes
+        self.current_bytes = 0
+        self._tiles = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._tiles)
+
+    def get(self, key):
+        """取出瓦片并标记为最近使用，不存在时返回None"""
+        with self._lock:
+            tile = self._tiles.get(key)
+            if tile is not None:
+                self._tiles.move_to_end(key)
+            return tile
+
+    def put(self, key, tile):
+        """放入瓦片，超出内存上限时淘汰最久未使用的瓦片"""
+        with self._lock:
+            old = self._tiles.pop(key, None)
+            if old is not None:
+                self.current_bytes -= self.nbytes(old)
+
+            self._tiles[key] = tile
+            self.current_bytes += self.nbytes(tile)
+
+            # 至少保留刚放入的瓦片，避免上限过小时反复解码
+            while self.current_bytes > self.max_bytes and len(self._tiles) > 1:
+                _, evicted = self._tiles.popitem(last=False)
+                self.current_bytes -= self.nbytes(evicted)
+
+    def clear(self):
+        with self._lock:
+            self._tiles.clear()
+            self.current_bytes = 0
+
+    def discard(self, owner):
+        """丢弃某个渲染器图像的全部瓦片（键的第一项为owner）"""
+        with self._lock:
+            for key in [k for k in self._tiles if k[0] == owner]:
+                self.current_bytes -= self.nbytes(self._tiles.pop(key))
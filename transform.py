@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+几何变换辅助
+与PIL的 Image.rotate(expand=True) 保持一致的尺寸和矩阵计算，
+以及只重采样输出区域的“旋转+裁剪”一步导出
+"""
+
+from math import ceil, cos, floor, radians, sin
+
+from PIL import Image
+
+
+def rotated_size(size, angle):
+    """计算图像旋转angle度（expand=True）后的画布尺寸
+
+    与PIL的计算方式相同：四个角旋转后取包围盒，并向外取整。
+    """
+    width, height = size
+
+    # PIL对90度的整数倍直接转置，不经过仿射变换
+    angle = angle % 360.0
+    if angle in (0, 180):
+        return width, height
+    if angle in (90, 270):
+        return height, width
+
+    theta = -radians(angle)
+    a, b = round(cos(theta), 15), round(sin(theta), 15)
+
+    # 绕中心旋转，只需要相对于中心的角点坐标
+    cx, cy = width / 2.0, height / 2.0
+    xs = []
+    ys = []
+    for x, y in ((0, 0), (width, 0), (width, height), (0, height)):
+        dx, dy = x - cx, y - cy
+        xs.append(a * dx + b * dy + cx)
+        ys.append(-b * dx + a * dy + cy)
+
+    return (ceil(max(xs)) - floor(min(xs)),
+            ceil(max(ys)) - floor(min(ys)))
+
+
+def rotate_image(image, angle):
+    """按旋转滑块的方式旋转图像（expand=True，双三次插值）"""
+    return image.rotate(angle, expand=True, resample=Image.BICUBIC)
+
+
+def rotation_matrix(size, angle):
+    """与 Image.rotate(angle, expand=True) 完全相同的逆仿射矩阵
+
+    矩阵把输出（旋转后画布）坐标映射到输入图像坐标，
+    返回 ([a, b, c, d, e, f], 旋转后画布尺寸)。
+    """
+    width, height = size
+    theta = -radians(angle)
+    matrix = [
+        round(cos(theta), 15), round(sin(theta), 15), 0.0,
+        round(-sin(theta), 15), round(cos(theta), 15), 0.0,
+    ]
+
+    def apply(x, y):
+        a, b, c, d, e, f = matrix
+        return a * x + b * y + c, d * x + e * y + f
+
+    # 绕图像中心旋转
+    center_x, center_y = width / 2.0, height / 2.0
+    matrix[2], matrix[5] = apply(-center_x, -center_y)
+    matrix[2] += center_x
+    matrix[5] += center_y
+
+    # expand=True：画布扩大到旋转后的包围盒，原点随之平移
+    new_width, new_height = rotated_size(size, angle)
+    matrix[2], matrix[5] = apply(-(new_width - width) / 2.0,
+                                 -(new_height - height) / 2.0)
+    return matrix, (new_width, new_height)
+
+
+def source_box(size, angle, box, margin=2):
+    """旋转画布中的box在原图中覆盖的区域（整数，含插值需要的margin像素边缘）
+
+    结果限制在图像内，并且至少包含一个像素
+    """
+    width, height = size
+    x1, y1, x2, y2 = box
+    (a, b, c, d, e, f), _ = rotation_matrix(size, angle)
+    xs = [a * x + b * y + c for x, y in ((x1, y1), (x2, y1), (x2, y2), (x1, y2))]
+    ys = [d * x + e * y + f for x, y in ((x1, y1), (x2, y1), (x2, y2), (x1, y2))]
+    sx1 = min(max(0, floor(min(xs)) - margin), width - 1)
+    sy1 = min(max(0, floor(min(ys)) - margin), height - 1)
+    sx2 = max(min(width, ceil(max(xs)) + margin), sx1 + 1)
+    sy2 = max(min(height, ceil(max(ys)) + margin), sy1 + 1)
+    return sx1, sy1, sx2, sy2
+
+
+def crop_rotated(image, angle, box, resample=Image.BICUBIC):
+    """一步得到 image.rotate(angle, expand=True).crop(box) 的结果
+
+    box是旋转后画布坐标系中的整数裁剪框。90度的整数倍只裁剪并转置
+    原图中对应的区域；其他角度把裁剪偏移合并进逆仿射矩阵，只对输出
+    区域的像素做一次重采样。内存和计算量只与裁剪框大小有关。
+    image也可以是只支持crop()的区域源（如内存映射图像），此时先取出
+    box在原图中覆盖的区域再重采样。
+    """
+    x1, y1, x2, y2 = box
+    width, height = image.size
+    angle = angle % 360.0
+
+    if angle == 0:
+        return image.crop(box)
+
+    # 与PIL相同，90度的整数倍直接转置，把裁剪框换算回原图坐标
+    if angle == 90:
+        return image.crop((width - y2, x1, width - y1, x2)).transpose(
+            Image.Transpose.ROTATE_90)
+    if angle == 180:
+        return image.crop((width - x2, height - y2, width - x1, height - y1)).transpose(
+            Image.Transpose.ROTATE_180)
+    if angle == 270:
+        return image.crop((y1, height - x2, y2, height - x1)).transpose(
+            Image.Transpose.ROTATE_270)
+
+    (a, b, c, d, e, f), _ = rotation_matrix(image.size, angle)
+    # 输出像素(u, v)对应旋转画布中的(u + x1, v + y1)
+    c, f = a * x1 + b * y1 + c, d * x1 + e * y1 + f
+    if not isinstance(image, Image.Image):
+        sx1, sy1, sx2, sy2 = source_box(image.size, angle, box)
+        image = image.crop((sx1, sy1, sx2, sy2))
+        c, f = c - sx1, f - sy1
+    return image.transform((x2 - x1, y2 - y1), Image.AFFINE, (a, b, c, d, e, f), resample)
+
+
+# Image.transpose的90度旋转 -> 逆时针角度
+TRANSPOSE_ANGLES = {
+    Image.Transpose.ROTATE_90: 90,
+    Image.Transpose.ROTATE_180: 180,
+    Image.Transpose.ROTATE_270: 270,
+}
+
+
+class TransposedRegion:
+    """只支持crop()的区域源旋转90度整数倍后的视图
+
+    crop()把裁剪框换算回原图中的区域，只读取并转置该区域
+    """
+
+    def __init__(self, source, angle):
+        self.source = source
+        self.angle = angle % 360
+
+    def __getattr__(self, name):
+        # mode、format、info、kind、nbytes等与原区域源相同
+        return getattr(self.source, name)
+
+    @property
+    def size(self):
+        return rotated_size(self.source.size, self.angle)
+
+    @property
+    def width(self):
+        return self.size[0]
+
+    @property
+    def height(self):
+        return self.size[1]
+
+    def crop(self, box):
+        return crop_rotated(self.source, self.angle, box)
+
+    def transpose(self, method):
+        if method not in TRANSPOSE_ANGLES:
+            raise ValueError(f"区域源不支持该变换: {method}")
+        angle = (self.angle + TRANSPOSE_ANGLES[method]) % 360
+        return self.source if angle == 0 else TransposedRegion(self.source, angle)
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+自动去边（不依赖GTK）
+扫描件和截图四周的纯色边框：先在缩小的图像上按容差沿行、列做numpy归约得到粗略的内容框，
+再只在完整分辨率的四条边附近各读取一个窄条带精确定位，不需要处理整张图像。
+"""
+
+from math import ceil, floor
+
+import numpy as np
+
+# 粗略扫描使用的最长边
+TRIM_SIDE = 1024
+
+# 与边框颜色的最大通道差不超过该值视为边框
+DEFAULT_TOLERANCE = 16
+
+# 按通道比较的模式，其他模式先转换为RGB
+TRIM_MODES = ('L', 'LA', 'RGB', 'RGBA')
+
+
+def _trim_image(image):
+    """转换为按通道比较的模式（调色板、1位等模式也不能reduce()）"""
+    return image if image.mode in TRIM_MODES else image.convert('RGB')
+
+
+def trim_preview(image, side=TRIM_SIDE):
+    """粗略扫描用的预览：按整数倍缩小到最长边不超过side
+
+    已经足够小的图像（如显示金字塔的缩小层）原样返回，不再处理
+    """
+    image = _trim_image(image)
+    factor = ceil(max(image.size) / side)
+    return image.reduce(factor) if factor > 1 else image
+
+
+def _bands(image):
+    """各通道的连续uint8数组（逐通道比较比交错的 (高, 宽, 通道) 数组快得多）"""
+    return [np.asarray(band) for band in _trim_image(image).split()]
+
+
+def border_color(bands):
+    """边框颜色：每个通道取四个角像素的中位数"""
+    return [int(np.median(band[[0, 0, -1, -1], [0, -1, 0, -1]])) for band in bands]
+
+
+def content_mask(bands, background, tolerance):
+    """与边框颜色的任一通道差超过容差的像素
+
+    用整数上下限直接比较uint8，不做减法和取绝对值
+    """
+    mask = np.zeros(bands[0].shape, dtype=bool)
+    for band, value in zip(bands, background):
+        low, high = ceil(value - tolerance), floor(value + tolerance)
+        if low > 0:
+            mask |= band < low
+        if high < 255:
+            mask |= band > high
+    return mask
+
+
+def _span(flags):
+    """布尔数组中第一个和最后一个True的位置 (起点, 终点+1)，全为False时返回None"""
+    indices = np.flatnonzero(flags)
+    if indices.size == 0:
+        return None
+    return int(indices[0]), int(indices[-1]) + 1
+
+
+def content_bounds(bands, background, tolerance=DEFAULT_TOLERANCE):
+    """内容的外接框 (x1, y1, x2, y2)，整张都是边框时返回None"""
+    mask = content_mask(bands, background, tolerance)
+    columns = _span(mask.any(axis=0))
+    if columns is None:
+        return None
+    rows = _span(mask.any(axis=1))
+    return columns[0], rows[0], columns[1], rows[1]
+
+
+def trim_box(preview, source=None, image_size=None, tolerance=DEFAULT_TOLERANCE):
+    """去掉纯色边框后的裁剪框（image_size坐标），没有内容时返回None
+
+    preview是任意尺寸的缩小图像，用来找粗略的内容框和边框颜色，最好已经缩小到
+    TRIM_SIDE左右（显示金字塔的一层或trim_preview()的结果），传入完整分辨率图像时
+    要先缩小整张图像；source是可以crop()的完整分辨率图像（PIL图像或区域源），
+    给出时四条边在完整分辨率的窄条带中精确定位，否则按预览的精度返回。
+    """
+    image_size = image_size or (source.size if source is not None else preview.size)
+    preview = trim_preview(preview)
+    width, height = image_size
+    scale_x, scale_y = width / preview.width, height / preview.height
+    bands = _bands(preview)
+    background = border_color(bands)
+    # 缩小时细小的内容被平均稀释，粗略扫描的容差按相对完整分辨率的缩小倍数降低
+    coarse = content_bounds(bands, background, max(1, tolerance / max(scale_x, scale_y, 1)))
+    if coarse is None:
+        return None
+
+    x1, y1, x2, y2 = (round(coarse[0] * scale_x), round(coarse[1] * scale_y),
+                      round(coarse[2] * scale_x), round(coarse[3] * scale_y))
+    if source is None:
+        return x1, y1, x2, y2
+
+    # 每条边在前后各一个预览像素的范围内精确定位
+    margin_x, margin_y = ceil(scale_x) + 1, ceil(scale_y) + 1
+    top, bottom = max(0, y1 - margin_y), min(height, y2 + margin_y)
+    left, right = max(0, x1 - margin_x), min(width, x2 + margin_x)
+
+    def refine(box, axis, from_end):
+        mask = content_mask(_bands(source.crop(box)), background, tolerance)
+        span = _span(mask.any(axis=axis))
+        if span is None:
+            return None
+        origin = box[0] if axis == 0 else box[1]
+        return origin + (span[1] if from_end else span[0])
+
+    new_x1 = refine((left, top, min(width, x1 + margin_x), bottom), 0, False)
+    new_x2 = refine((max(0, x2 - margin_x), top, right, bottom), 0, True)
+    new_y1 = refine((left, top, right, min(height, y1 + margin_y)), 1, False)
+    new_y2 = refine((left, max(0, y2 - margin_y), right, bottom), 1, True)
+    return (x1 if new_x1 is None else new_x1, y1 if new_y1 is None else new_y1,
+            x2 if new_x2 is None else new_x2, y2 if new_y2 is None else new_y2)